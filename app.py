@@ -7,7 +7,7 @@ to the app via a POST-request. Then a buy & rent price estimation is performed,
 which is based on the formular-input-data and the deposited best model
 (*'model_buy.p', 'model_rent.p'*) created by *modeling.py*.
 The buy- & rent-estimation-values together with associated confidence-intervalls,
-which are derived from the also deposited 90%-quantile relative error of the model-test-validation,
+which are derived from the quantiles of the also deposited relative error of the model-test-validation,
 are then returned via a new HTML-page. 
 
 Thanks to GreekDataGuy and Ken Jee for inspiration to this module:
@@ -17,63 +17,301 @@ https://github.com/PlayingNumbers/ds_salary_proj/tree/master/FlaskAPI
 @author: Michael Volk
 """
 
-from flask import Flask, request
-import pandas as pd
-import numpy as np
+from flask import Flask, Response, g, request, jsonify
+from jinja2 import Environment, FileSystemLoader
+from markupsafe import Markup, escape
 import pickle
+import json
+import os
+import tempfile
+import threading
+import time
 
+from modelRegistry import FileRegistry
+from modelVariants import ModelVariants, parseVariants
+from modelArtifacts import artifactFiles, isArtifact, loadArtifact, validateColumns
+from cityIndex import CityIndex
+from pageCache import PageCache
+from predictionCache import LocalCache, PredictionCache
+import heatmap
+import sensitivity
+import metrics
+from metrics import loads_total, request_seconds, timed
+from estimation import (ConfigurationError, ErrorDistribution, FeatureEncoder, configurationToFeatures,
+                        estimatePrices, confidence_levels, default_confidence, parseConfidence)
 
-def load_modelConfigurations():
+# Directory of the model-files, city-coordinates-file and interval (in seconds) for checking them for changes
+MODEL_DIR = os.environ.get('MODEL_DIR', '.')
+CITY_FILE = os.environ.get('CITY_FILE', 'nrwCityCoordinates.csv')
+RELOAD_CHECK_INTERVAL = float(os.environ.get('RELOAD_CHECK_INTERVAL', '2'))
+# Whether changed models and city-coordinates are reloaded only by the gunicorn master, which then recycles the workers
+RELOAD_BY_MASTER = os.environ.get('RELOAD_BY_MASTER', '') in ('1', 'true')
+# Model-variants served side by side as 'name=directory:weight,...' (see modelVariants.py), MODEL_DIR if empty
+MODEL_VARIANTS = os.environ.get('MODEL_VARIANTS', '')
+# Directories of the page-templates and of the static assets (stylesheet)
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+STYLESHEET_FILE = os.path.join(STATIC_DIR, 'style.css')
+# Maximal number of apartment-configurations per request to the estimation-API
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', '100000'))
+
+
+def modelFiles(directory=MODEL_DIR):
+    """Returns files of the model-configurations for buy and rent: the model-artifacts
+    (see modelArtifacts.py) if exported, otherwise the pickled model-configurations"""
+    filenames = []
+    for cat in ['_buy', '_rent']:
+        if isArtifact(os.path.join(directory, 'model' + cat)):
+            filenames += artifactFiles(os.path.join(directory, 'model' + cat))
+        else:
+            filenames.append(os.path.join(directory, 'model' + cat + '.p'))
+    return filenames
+
+def load_modelConfigurations(directory=MODEL_DIR):
     """Returns loaded model configuration from file for buy and rent,
-    which have been saved before by modeling.py"""
+    which have been saved before by modeling.py. Model-artifacts exported by modelArtifacts.py
+    are preferred, since they load faster and their arrays are memory-mapped"""
+    loads_total.inc(resource='models')
+    with timed('model_load'):
+        return _load_modelConfigurations(directory)
+
+def _load_modelConfigurations(directory):
+    """Returns loaded model configuration for buy and rent (see load_modelConfigurations())"""
     modelConfigs = {}
     for cat in ['_buy', '_rent']:
-        with open(file= 'model' + cat + '.p', mode='rb') as pickled:
-            data = pickle.load(pickled)
-            modelConfigs['model' + cat] = data['model']
-            modelConfigs['columns_used' + cat] = data['columns_used']
-            modelConfigs['test_errors' + cat] = data['test_errors']
-            modelConfigs['test_errors_notAbsolute' + cat] = data['test_errors_notAbsolute']
+        if isArtifact(os.path.join(directory, 'model' + cat)):
+            data = loadArtifact(os.path.join(directory, 'model' + cat))
+            error_distribution = ErrorDistribution(data['test_errors_notAbsolute_sorted'], isSorted=True)
+        else:
+            with open(file=os.path.join(directory, 'model' + cat + '.p'), mode='rb') as pickled:
+                data = pickle.load(pickled)
+            validateColumns(data['columns_used'], data['model'])
+            error_distribution = ErrorDistribution(data['test_errors_notAbsolute'])
+        modelConfigs['model' + cat] = data['model']
+        modelConfigs['columns_used' + cat] = data['columns_used']
+        modelConfigs['test_errors' + cat] = data['test_errors']
+        modelConfigs['test_errors_notAbsolute' + cat] = data['test_errors_notAbsolute']
+        # Sorted test-errors and precomputed quantiles for the confidence-intervalls
+        modelConfigs['error_distribution' + cat] = error_distribution
+        # Mapping of the formular-data to the columns of the model
+        modelConfigs['encoder' + cat] = FeatureEncoder(data['columns_used'], data['model'])
     return modelConfigs
 
-def load_cityCoordinates(filename = "nrwCityCoordinates.csv"):    
-    """Read in created mapping-file for cityname to central-coordinates of the city.
+def load_cityCoordinates(filename = CITY_FILE):    
+    """Read in created mapping-file for cityname to central-coordinates of the city
+    and returns it as CityIndex (see cityIndex.py).
     filename = "nrwCityCoordinates.csv" can be recreated using uncommented code
     in module 'featureEngineering.py' in section 3."""
-    return pd.read_csv(filename)
-
-def cityNamesFormular(df_city_coordinates):
-    """Returns for given df_city_coordinates all
-    citynames in the necessary html-format to be used in the formular-dropdown-List"""
-    cities_Html = "<option>""</option>" # Empty value as standard
-    for city in df_city_coordinates['City']:
-        # Setting default-city
-        if city == 'Aachen':
-            cities_Html += "<option selected>" + city + "</option>"
-        else:
-            cities_Html += "<option>" + city + "</option>"
-    return cities_Html
+    loads_total.inc(resource='cities')
+    with timed('city_load'):
+        return CityIndex.fromCsv(filename)
+
+def variantRegistry(variant):
+    """Returns FileRegistry of the model-configurations of given Variant (see modelVariants.py)"""
+    def load():
+        modelConfigs = load_modelConfigurations(variant.directory)
+        # Name of the variant for the metrics per model-variant
+        modelConfigs['variant'] = variant.name
+        return modelConfigs
+    return FileRegistry(lambda: modelFiles(variant.directory), load, checkInterval=RELOAD_CHECK_INTERVAL)
+
+# Registries loading model-configurations (one per model-variant) and city-coordinates only once per process
+# and reloading them, when the underlying files change
+modelVariants = ModelVariants(parseVariants(MODEL_VARIANTS, MODEL_DIR), variantRegistry)
+modelRegistry = modelVariants.registries[modelVariants.primary]
+cityRegistry = FileRegistry([CITY_FILE], load_cityCoordinates, checkInterval=RELOAD_CHECK_INTERVAL)
+
+# Cache for predicted prices of repeated apartment-configurations (None if disabled)
+predictionCache = PredictionCache.fromEnvironment()
+
+# Cache for the price-grids of the heat-map-endpoint (bounded by their bytes) and whether the heat-maps of popular profiles
+# are precomputed at startup
+heatmapCache = LocalCache(maxSize=int(os.environ.get('HEATMAP_CACHE_BYTES', str(64 * 1024 * 1024))),
+                          ttl=float(os.environ.get('HEATMAP_CACHE_TTL', '86400')), weigh=heatmap.pricesBytes)
+HEATMAP_PRECOMPUTE = os.environ.get('HEATMAP_PRECOMPUTE', '1') in ('1', 'true')
+
+# Apartment-configuration of the synthetic warm-up prediction at startup (the default-configuration of the formular)
+WARMUP_CONFIGURATION = {'chooseLocation': 'coordinates', 'Latitude': '51.2', 'Longitude': '7.0', 'Category': 'Apartment',
+                        'Area': '100', 'Rooms': '4', 'Construction_Year': '2010', 'Maintained': '1', 'Balcony': '1'}
+# Set when the startup-phase (see preload()) is finished and this process is ready to serve requests (see /readyz)
+ready = threading.Event()
+startupLock = threading.Lock()
+
+def warmUp(snapshots, cityIndex):
+    """Runs a synthetic prediction of the WARMUP_CONFIGURATION through both models of each given Snapshot
+    (without prediction-cache) and renders and compresses the pages once, so that lazy initializations
+    (e.g. of the models, the spatial index of the city-coordinates and the templates) are not paid by the first requests"""
+    with timed('warm_up'):
+        x_dict = configurationToFeatures(WARMUP_CONFIGURATION, cityIndex)
+        for snapshot in snapshots:
+            results = {key: values[0] for key, values in estimatePrices([x_dict], snapshot.value).items()}
+        renderResult(WARMUP_CONFIGURATION, x_dict, results, default_confidence,
+                     nearestCityOfFormular(WARMUP_CONFIGURATION, x_dict, cityIndex))
+        for pageCache in (formularCache, stylesheetCache):
+            for encoding in pageCache.encodings:
+                pageCache.get(encoding)
+
+def preload():
+    """Startup-phase: loads model-configurations of all model-variants and city-coordinates into the registries,
+    runs the warm-up (see warmUp()), precomputes the heat-maps of the popular profiles and then marks this process as ready.
+    Called in the gunicorn master before forking the workers (see gunicorn.conf.py), so the workers start
+    warm, or at startup of the ASGI-app; does nothing if this process is already ready"""
+    with startupLock:
+        if ready.is_set():
+            return
+        warmUpVariants()
+        ready.set()
+
+def warmUpVariants():
+    """Runs the warm-up (see warmUp()) with the current model-configurations of all model-variants
+    and precomputes their heat-maps of the popular profiles"""
+    snapshots = [modelVariants.get(variant) for variant in modelVariants.names]
+    warmUp(snapshots, cityRegistry.get().value)
+    if HEATMAP_PRECOMPUTE:
+        for snapshot in snapshots:
+            heatmap.precomputeHeatmaps(snapshot, heatmapCache)
+
+def reloadInMaster():
+    """Reloads changed model-configurations and city-coordinates in the gunicorn master (with RELOAD_BY_MASTER)
+    and warms them up. Returns whether anything was reloaded, so that the master recycles the workers, which
+    then share the reloaded models copy-on-write (see gunicorn.conf.py)"""
+    registries = list(modelVariants.registries.values()) + [cityRegistry]
+    previous = [registry.current() for registry in registries]
+    if all(registry.get() is snapshot for registry, snapshot in zip(registries, previous)):
+        return False
+    warmUpVariants()
+    return True
+
+def disableReloads():
+    """Stops the reloading of model-configurations and city-coordinates in this worker (with RELOAD_BY_MASTER)"""
+    for registry in list(modelVariants.registries.values()) + [cityRegistry]:
+        registry.checkInterval = -1
 
-def dictToHTMLTable(dictionary, specialKeys):
-    """Returns given dictionary formated as html-table with key and value as separate columns.
-    For given specialKeys (=list) no corresponding values are returned"""
-    dict_HTML = """<table>"""
+def preloadInBackground():
+    """Starts the startup-phase (see preload()) in a background-thread, if this process is not ready yet
+    (e.g. when started via 'flask run' without gunicorn), so that the liveness-probe answers meanwhile"""
+    if not ready.is_set() and not startupLock.locked():
+        threading.Thread(target=preload, name='preload', daemon=True).start()
+
+def formatNumber(value, decimals=0):
+    """Returns given number with thousands-separator and given decimals"""
+    return "{:,.{}f}".format(value, decimals)
+
+# Templates of the pages (autoescaped), compiled once when the app is imported
+templates = Environment(loader=FileSystemLoader(TEMPLATE_DIR), autoescape=True, trim_blocks=True, lstrip_blocks=True,
+                        auto_reload=False)
+formularTemplate = templates.get_template('formular.html')
+# The result-page is rendered once around a placeholder, per request only the fragment with the tables is rendered
+resultFragmentTemplate = templates.get_template('resultFragment.html')
+resultPageHead, resultPageTail = (templates.get_template('result.html').render(fragment=Markup('<!--fragment-->'))
+                                  .split('<!--fragment-->'))
+
+# Categories of the formular-dropdown (first is the default), checkboxes of the formular by group and the ones checked by default
+categories = ['Apartment', 'Floor-Apartment', 'Maisonette', 'Penthouse', 'Terrace-Apartment', 'Loft']
+checkbox_groups = [('Condition', ['First Occupancy', 'Upscale', 'Maintained', 'Renovated', 'Refurbished']),
+                   ('Outdoor', ['Balcony', 'Garden', 'Loggia', 'Terrace'])]
+checked_checkboxes = ['Maintained', 'Balcony']
+
+def configurationTable(dictionary, specialKeys):
+    """Returns rows (label, value) of the table of given formular-data. For given specialKeys (=list)
+    the value is shown as 'Yes' (checked checkboxes)"""
+    rows = []
     for key in dictionary:
-        if key != "chooseLocation": #shall not be listed in html-table
-            if key !="Construction_Year":
-                dict_HTML += """<tr><td><b>""" + key + """: </b></td>"""
-            else: #Shown name of Construction_Year shall be 'Construction Year'
-                dict_HTML += """<tr><td><b>Construction Year: </b></td>"""            
-            if key not in specialKeys:
-                dict_HTML += """<td>""" + dictionary[key] + """</td>"""
-            else:
-                dict_HTML += """<td>Yes</td>"""
-            dict_HTML += """</tr>"""
-    dict_HTML += """</table>"""
-    return dict_HTML
+        if key not in ("chooseLocation", "Confidence_Level"): #shall not be listed in html-table
+            label = key if key != "Construction_Year" else "Construction Year" #Shown name of Construction_Year shall be 'Construction Year'
+            rows.append((label, dictionary[key] if key not in specialKeys else "Yes"))
+    return rows
+
+def renderFormular(cityIndex):
+    """Returns the input-html-formular with the necessary input fields for the user and a submit button
+    for the citynames of given cityIndex"""
+    return formularTemplate.render(cities=cityIndex.names, default_city='Aachen', categories=categories,
+                                   confidence_levels=confidence_levels, default_confidence=default_confidence,
+                                   checkbox_groups=checkbox_groups, checked=checked_checkboxes)
+
+def nearestCityOfFormular(formular_data, x_dict, cityIndex):
+    """Returns (cityname, distance in km) of the city nearest to the coordinates of the formular
+    or None, if the location has been choosen via cityname"""
+    if formular_data.get('chooseLocation') != 'coordinates':
+        return None
+    with timed('reverse_geocoding'):
+        return cityIndex.nearest(x_dict['Latitude'], x_dict['Longitude'])
+
+def renderResult(formular_data, x_dict, results, confidence, nearestCity=None):
+    """Returns the apartment-configuration (formular_data) with the nearestCity (see nearestCityOfFormular())
+    and the prediction results for given confidence-level as 2 html-tables"""
+    if nearestCity is not None:
+        # Nearest city is shown below the coordinates
+        table_data = {}
+        for key, value in formular_data.items():
+            table_data[key] = value
+            if key == 'Longitude':
+                table_data['Nearest City'] = "{} ({:.1f} km)".format(*nearestCity)
+        formular_data = table_data
+    # Python-floats, since computing and formatting them is much faster than with numpy-scalars
+    y = {key: float(value) for key, value in results.items()}
+    area = x_dict['Area']
+
+    def bounds(cat, divisor=1, decimals=0, unit=''):
+        """Returns formatted estimated value, lower and upper bound of given cat"""
+        return [formatNumber(y[key + cat] / divisor, decimals) + unit for key in ('y_predicted', 'y_lowerBound', 'y_upperBound')]
+    # Rows (label, formatted values) of the table of the estimation results
+    estimates = [('Buy-price', bounds('_buy', unit=' €')),
+                 ('Buy-price per Area', bounds('_buy', area, unit=' €/m\u00b2')),
+                 ('Rent-price', bounds('_rent', unit=' €')),
+                 ('Rent-price per Area', bounds('_rent', area, 1, ' €/m\u00b2')),
+                 ('Buy-to-Rent-ratio', [formatNumber(y['y_predicted_buy'] / (12 * y['y_predicted_rent']))]),
+                 ('Rent-to-Buy-ratio', [formatNumber((12 * y['y_predicted_rent']) / y['y_predicted_buy'] * 100, 1) + '%'])]
+    with timed('html_render'):
+        return resultPageHead + resultFragmentTemplate.render(
+            configuration=configurationTable(formular_data, [checkbox for group, checkboxes in checkbox_groups
+                                                             for checkbox in checkboxes]),
+            estimates=estimates, confidence="{:g}".format(confidence * 100),
+            tail="{:g}".format((1 - confidence) / 2 * 100)) + resultPageTail
+
+# Formular-page rendered and compressed once per version of the city-coordinates
+formularCache = PageCache(cityRegistry, renderFormular)
+# Seconds browsers and CDNs may use the formular-page before revalidating it with its ETag
+FORMULAR_MAX_AGE = int(os.environ.get('FORMULAR_MAX_AGE', '600'))
+
+def load_stylesheet(filename=STYLESHEET_FILE):
+    """Returns content of the stylesheet of the pages"""
+    with open(filename, mode='r', encoding='utf-8') as file:
+        return file.read()
+
+# Stylesheet of both pages served as separate asset, compressed once per version of the file
+stylesheetRegistry = FileRegistry([STYLESHEET_FILE], load_stylesheet, checkInterval=RELOAD_CHECK_INTERVAL)
+stylesheetCache = PageCache(stylesheetRegistry, lambda stylesheet: stylesheet)
+# Seconds browsers and CDNs may use the stylesheet before revalidating it with its ETag
+STATIC_MAX_AGE = int(os.environ.get('STATIC_MAX_AGE', '86400'))
+
+def cachedPageResponse(pageCache, mimetype, maxAge):
+    """Returns response with the page of given PageCache in the best content-encoding accepted by the client
+    or an empty '304 Not Modified'-response, if the ETag sent by the client matches the current page"""
+    encoding = request.accept_encodings.best_match([e for e in pageCache.encodings if e != 'identity'],
+                                                   default='identity')
+    body, etag = pageCache.get(encoding)
+    response = Response(body, mimetype=mimetype)
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = maxAge
+    return response.make_conditional(request)
+
+def formularResponse():
+    """Returns response with the pre-rendered formular-page (see cachedPageResponse())"""
+    return cachedPageResponse(formularCache, 'text/html', FORMULAR_MAX_AGE)
+
+def requestedModel():
+    """Returns name and current Snapshot of the model-variant the request is routed to: the variant of the
+    header 'X-Model-Variant' or chosen by weight, always the same one for the same header 'X-Routing-Key'"""
+    variant = modelVariants.choose(request.headers.get('X-Model-Variant'), request.headers.get('X-Routing-Key'))
+    return variant, modelVariants.get(variant)
 
 # FLASK-app
-app = Flask(__name__)
+app = Flask(__name__, static_folder=None)
 # Route decorator of Flask which wraps below function.
 @app.route('/', methods=['GET', 'POST'])
 def predict():
@@ -86,188 +324,11 @@ def predict():
     be performed when the user hits the submit-button of the input-formular.
     """    
     
-    # Handle the GET request (Direct request of user to server)
-    if request.method == 'GET':
-        
-        # Load created mapping-file for cityname to central-coordinates of the city
-        df_city_coordinates = load_cityCoordinates()
+    # Handle the GET request (Direct request of user to server, HEAD-requests e.g. of a CDN are handled the same way)
+    if request.method in ('GET', 'HEAD'):
         
-        # returns formular with the necessary input fields for the user and a submit button
-        return ("""
-                <HTML>
-                <HEAD>
-                <style>
-                body {
-                    margin-top: 2em;
-                    margin-left: 3em;
-                }
-                body, table, th, td {
-                    font-size: 13px;
-                }
-                input, select {
-                    font-size: 11.5px;
-                }
-                h1 {font-size: 20px;}
-                input.largerCheckbox {
-                    width: 11.5px;
-                    height: 11.5px;
-                  }
-                input[type=submit] {
-                    width: 13em;
-                    height: 4em;
-                }
-                </style>
-                </HEAD>
-                <BODY>
-                
-                <form id="myform" form method="POST">
-                
-                    <h1 style="margin-bottom: 1.25em;">Buy & Rent Price Estimator App for Apartments in North Rhine-Westphalia</h1>
-                    
-                    <p>Get a buy and rent price-estimation for your individual apartment-configuration in german federal state North Rhine-Westphalia.</p>
-                                    
-                    <p>
-                    <div>Choose your input-method for location of apartment in North Rhine-Westphalia:</div>
-                    <div><input type="radio" id="cn" name="chooseLocation" value="cityname" onClick="deactivateCoordinates(this.form)" checked >
-                         <label for="cn"> via Cityname</label></div>
-                    <div><input type="radio" id="co" name="chooseLocation" value="coordinates" onClick="deactivateCityname(this.form)">
-                         <label for="co"> via Coordinates (Latitude & Longitude)</label></div>
-                    </p>
-                    
-                    <p>
-                    <table>
-                      <tr>
-                        <td><b>Cityname: </b></td>
-                        <td><select name="Cityname">
-                        """  +  cityNamesFormular(df_city_coordinates) + """
-                        </select></td>
-                      </tr>
-                      <tr>
-                        <td><b>Latitude: </b></td>
-                        <td><input type="number" name="Latitude" min="50.5600" max="52.3400" step="0.0001" value="" disabled></td>
-                      </tr>
-                      <tr>
-                        <td><b>Longitude: </b></td>
-                        <td><input type="number" name="Longitude" min="6.0300" max="9.3700" step="0.0001" value="" disabled></td>
-                      </tr>
-                      <tr>
-                        <td><b>Category: </b></td>
-                        <td><select name="Category">
-                            <option>Apartment</option>
-                            <option>Floor-Apartment</option>
-                            <option>Maisonette</option>
-                            <option>Penthouse</option>
-                            <option>Terrace-Apartment</option>
-                            <option>Loft</option>
-                        </select></td>
-                      </tr>
-                      <tr>
-                        <td><b>Area: </b></td>
-                        <td><input type="number" name="Area" min="20" max="180" step="1" value="100"></td>
-                      </tr>
-                      <tr>
-                        <td><b>Rooms: </b></td>
-                        <td><input type="number" name="Rooms" min="1" max="7" step="1" value="4"></td>
-                      </tr>
-                      <tr>
-                        <td><b>Construction Year: </b></td>
-                        <td><input type="number" name="Construction_Year" min="1850" max="2021" step="1" value="2010"></td>
-                      </tr>
-                      <tr>
-                        <td></td>
-                      </tr>
-                      <tr>
-                        <td></td>
-                      </tr>
-                      <tr>
-                        <td><b>Condition: </b></td>
-                      </tr>
-                      <tr>
-                        <td>- First Occupancy: </td>
-                        <td><input type="checkbox" class="largerCheckbox" name="First Occupancy" value="1"></td>
-                      </tr>
-                      <tr>
-                        <td>- Upscale: </td>
-                        <td><input type="checkbox" class="largerCheckbox" name="Upscale" value="1"></td>
-                      </tr>
-                      <tr>
-                        <td>- Maintained: </td>
-                        <td><input type="checkbox" class="largerCheckbox" name="Maintained" value="1" checked></td>
-                      </tr>
-                      <tr>
-                        <td>- Renovated: </td>
-                        <td><input type="checkbox" class="largerCheckbox" name="Renovated" value="1"></td>
-                      </tr>
-                      <tr>
-                        <td>- Refurbished: </td>
-                        <td><input type="checkbox" class="largerCheckbox" name="Refurbished" value="1"></td>
-                      </tr>
-                      <tr>
-                        <td></td>
-                      </tr>
-                      <tr>
-                        <td></td>
-                      </tr>
-                      <tr>
-                        <td><b>Outdoor: </b></td>
-                      </tr>
-                      <tr>
-                        <td>- Balcony: </td>
-                        <td><input type="checkbox" class="largerCheckbox" name="Balcony" value="1" checked></td>
-                      </tr>
-                      <tr>
-                        <td>- Garden: </td>
-                        <td><input type="checkbox" class="largerCheckbox" name="Garden" value="1"></td>
-                      </tr>
-                      <tr>
-                        <td>- Loggia: </td>
-                        <td><input type="checkbox" class="largerCheckbox" name="Loggia" value="1"></td>
-                      </tr>
-                      <tr>
-                        <td>- Terrace: </td>
-                        <td><input type="checkbox" class="largerCheckbox" name="Terrace" value="1"></td>
-                      </tr>
-                    </table>
-                    </p>
-                    
-                    <input type="submit" value="Estimate Prices!">
-                    
-               </form>
-               
-                <SCRIPT LANGUAGE="JavaScript">            
-                function deactivateCoordinates(form) {
-                    form.Latitude.value = ""
-                    form.Longitude.value = ""
-                    form.Latitude.disabled = true
-                    form.Longitude.disabled = true
-                    form.Cityname.disabled = false
-                }
-                function deactivateCityname(form) {
-                    form.Cityname.value = ""
-                    form.Cityname.disabled = true
-                    form.Latitude.disabled = false
-                    form.Longitude.disabled = false
-                }
-                function test1() {
-                    alert("Hello")
-                }
-                let myform = document.getElementById('myform');
-                myform.addEventListener('submit', function (evt) {
-                   let error = false; 
-                   if (
-                           (myform.chooseLocation.value=='cityname' && myform.Cityname.value=='') || (myform.chooseLocation.value=='coordinates' && (myform.Latitude.value=='' || myform.Longitude.value=='')) || (myform.Area.value=='' || myform.Rooms.value=='' || myform.Construction_Year.value=='')
-                       ) {
-                       error = true
-                   }
-                   if (error) {
-                      evt.preventDefault();
-                      alert("Please fill out all necessary fields to make a Estimation!")
-                   }
-                });
-                </SCRIPT>
-               
-               </BODY>
-               </HTML>""")
+        # Return pre-rendered formular (compressed and with ETag) or "304 Not Modified" if the client has it already
+        return formularResponse()
 
     
     # Handle the POST request (the html-formular-input is sent via POST request after hitting submit-button by the user)
@@ -276,191 +337,314 @@ def predict():
         # Convert the formular-data (MultiDict structure of flask), which was sent with the POST-Request, to a simple dictionary
         formular_data = request.form.to_dict()
         
-        # Get 'Latitude' and 'Longitude' from formular-data depending on which input-option
-        # the user has choosen (via Cityname vs. via Coordinates)
-        if formular_data['chooseLocation'] == 'cityname':
-            # Load created mapping-file for cityname to central-coordinates of the city
-            df_city_coordinates = load_cityCoordinates()
-            # Create dictionaries with each 'Latitude' and 'Longitude' and value from df_city_coordinates
-            x_dict_latitude = {'Latitude': float(df_city_coordinates.loc[df_city_coordinates['City'] == formular_data['Cityname'], 'Latitude'])}
-            x_dict_longitude = {'Longitude': float(df_city_coordinates.loc[df_city_coordinates['City'] == formular_data['Cityname'], 'Longitude'])}
-        else:
-            x_dict_latitude = {'Latitude': float(formular_data['Latitude'])}
-            x_dict_longitude = {'Longitude': float(formular_data['Longitude'])}
+        # Get loaded model-configuration for buy and rent of the model-variant the request is routed to
+        variant, snapshot = requestedModel()
         
-        # Create dictionary which maps numerical model-features to numerical formular-data-element-names
-        map_num = {'Area': 'Area',
-                   'Rooms': 'Rooms',
-                   'ConstructionYear': 'Construction_Year'
-                  }
-        # Create dictionary which maps categorical model-features to categorical formular-data-element-names
-        map_cat = { 'EQ_CAT_floorApartment': ('Category', 'Floor-Apartment'),
-                    'EQ_CAT_apartment': ('Category', 'Apartment'),
-                    'EQ_CAT_maisonette': ('Category', 'Maisonette'),
-                    'EQ_CAT_penthouse': ('Category', 'Penthouse'),
-                    'EQ_CAT_terraceApartment': ('Category', 'Terrace-Apartment'),
-                    'EQ_CAT_loft': ('Category', 'Loft'),
-                    'EQ_CON_firstOccupancy': ('First Occupancy', '1'),
-                    'EQ_CON_upscale': ('Upscale', '1'),
-                    'EQ_CON_maintained': ('Maintained', '1'),
-                    'EQ_CON_renovated': ('Renovated', '1'),
-                    'EQ_CON_refurbished': ('Refurbished', '1'),
-                    'EQ_OUT_balcony': ('Balcony', '1'),
-                    'EQ_OUT_garden': ('Garden', '1'),
-                    'EQ_OUT_loggia': ('Loggia', '1'),
-                    'EQ_OUT_terrace': ('Terrace', '1'),
-            }
-        # Create dictionary with keys from map_num & map_cat and values from formular_data
-        x_dict_num = {key: float(formular_data[map_num[key]]) for key in map_num}
-        x_dict_cat = {key: 1 if map_cat[key] in formular_data.items() else 0 for key in map_cat}
-                
-        # Concatenate x_dict_num, x_dict_cat, x_dict_latitude, x_dict_longitude to x_dict
-        x_dict = dict(x_dict_num)
-        x_dict.update(x_dict_cat)
-        x_dict.update(x_dict_latitude)
-        x_dict.update(x_dict_longitude)
+        # Create dictionary with model-features and values from formular_data (see map_num & map_cat in estimation.py),
+        # 'Latitude' and 'Longitude' depend on which input-option the user has choosen (via Cityname vs. via Coordinates)
+        cityIndex = cityRegistry.get().value
+        with timed('parse_configuration'):
+            x_dict = configurationToFeatures(formular_data, cityIndex)
         
-        # Load model-configuration for buy and rent dataframe
-        modelConfigs = load_modelConfigurations()
-        # Create new dictionary for saving results
-        results = {}
+        # Make prediction for buy and rent (as batch of a single configuration) with the choosen confidence-level
+        confidence = parseConfidence(formular_data.get('Confidence_Level'))
+        results = estimatePrices([x_dict], snapshot.value, confidence, predictionCache, snapshot.version)
+        modelVariants.observePredictions(variant, results)
+        results = {key: values[0] for key, values in results.items()}
         
-        # Put formular data into model-configuration and make prediction for buy and rent
-        for cat in ['_buy', '_rent']:
-            # Create list filled with values from x_dict with order of columns_used
-            results['x'+cat] = []
-            for col in modelConfigs['columns_used' + cat]:
-                if col in x_dict:
-                    results['x'+cat].append(x_dict[col])
-                else:
-                    results['x'+cat].append(0)
-                    print("WARNING: ", col, " not found in formular-data => value has been set to 0")
-            # Convert results['x'+cat] to correct format for model-prediction
-            results['x_in'+cat] = pd.DataFrame(np.array(results['x'+cat]).reshape(1,-1),
-                                               columns=modelConfigs['columns_used' + cat])
-
-            # Make prediction with model for given input-data and retransform it using np.exp()
-            results['y_predicted'+cat] = np.exp(modelConfigs['model' + cat].predict(results['x_in'+cat])[0])
-            
-            # Calculate confidence-intervall of predicted value            
-            results['y_lowerBound_5%' + cat] = (
-                results['y_predicted' + cat] / np.exp(modelConfigs['test_errors_notAbsolute' + cat].quantile(q=0.95))
-                )
-            results['y_upperBound_5%' + cat] = (
-                results['y_predicted' + cat] / np.exp(modelConfigs['test_errors_notAbsolute' + cat].quantile(q=0.05))
-                )
-
-
-                        
-        # Return the apartment-configuration and the prediction results as 2 html-tables
-        return """
-                <html>
-                <head>
-                <style>
-                body {
-                    font-size: 13px;
-                    margin-top: 2em;
-                    margin-left: 3em;
-                }
-                h1 {font-size: 20px;}
-                table, th, td {
-                    font-size: 13px;
-                    padding: 5px;
-                    text-align: center;
-                    border: 1px solid black;
-                    border-collapse: collapse;
-                }
-                </style>
-                </head>
-                <body>
-                                
-                <h1>Your Configuration</h1>
-                
-                """ + dictToHTMLTable(formular_data, ['First Occupancy', 'Upscale', 'Maintained', 'Renovated',
-                'Refurbished', 'Balcony', 'Garden', 'Loggia', 'Terrace']) + """
-  
-                <h1 style="margin-top: 1.5em;">Estimation Results</h1>
-  
-                <table>
-                    <tr>
-                        <th>Estimation Type</th>
-                        <th>Estimated Value</th>
-                        <th>Lower Bound</th>
-                        <th>Upper Bound</th>
-                    </tr>
-                    <tr>
-                        <th>Buy-price</th>
-                        <td>{:,.0f} €</td>
-                        <td>{:,.0f} €</td>
-                        <td>{:,.0f} €</td>
-                    </tr>
-                    <tr>
-                        <th>Buy-price per Area</th>
-                        <td>{:,.0f} €/m\u00b2</td>
-                        <td>{:,.0f} €/m\u00b2</td>
-                        <td>{:,.0f} €/m\u00b2</td>
-                    </tr>
-                    <tr>
-                        <th>Rent-price</th>
-                        <td>{:,.0f} €</td>
-                        <td>{:,.0f} €</td>
-                        <td>{:,.0f} €</td>
-                    </tr>
-                    <tr>
-                        <th>Rent-price per Area</th>
-                        <td>{:,.1f} €/m\u00b2</td>
-                        <td>{:,.1f} €/m\u00b2</td>
-                        <td>{:,.1f} €/m\u00b2</td>
-                    </tr>
-                    <tr>
-                        <th>Buy-to-Rent-ratio</th>
-                        <td>{:,.0f}</td>
-                    </tr>
-                    <tr>
-                        <th>Rent-to-Buy-ratio</th>
-                        <td>{:,.1f}%</td>
-                    </tr>
-                </table>
-
-                <h1 style="margin-top: 1.5em;">Hints</h1>
-                
-                <ul>
-                  <li>Rent-price is shown on cold & monthly basis, while the shown Buy-to-Rent-ratio and Rent-to-Buy-ratio are based on yearly cold Rent-price</li>
-                  <li>Lower and Upper Bound define a 90% Confidence Intervall for the actual price: it is expected that round about 5% of actual prices are below the Lower and round about 5% are above the Upper Bound</li>
-                </ul>
-                            
-                <h1 style="margin-top: 1.5em;">More Information</h1>
-                            
-                This Buy & Rent Price Estimator App is part of my project:
-                <a href="https://micvolk.github.io/Buy-and-Rent-Price-Estimator-for-Apartments">micvolk.github.io/Buy-and-Rent-Price-Estimator-for-Apartments</a> <br/>
-                Visit the website and get a detailed description of the steps for building this App - starting from scraping, preparing and exploring the data from
-                <a href="https://www.immowelt.de">immowelt.de</a>, evaluating different machine learning models
-                and ending with transferring the best model into production by building this App.
-                To see a detailed and visualised exploration of the prepared data please follow this link:
-                <a href="https://micvolk.github.io/Buy-and-Rent-Price-Estimator-for-Apartments/presentation/Exploring.html">micvolk.github.io/Buy-and-Rent-Price-Estimator-for-Apartments/presentation/Exploring.html</a>
-                
-                <p style="margin-top: 2.5em"><em>Author: <a href="https://github.com/micvolk">Michael Volk</a></em><br>
-                
-                </body>
-                </html>
-                
-                """.format(
-                        results['y_predicted_buy'],
-                        results['y_lowerBound_5%_buy'],
-                        results['y_upperBound_5%_buy'],
-                        
-                        results['y_predicted_buy'] / x_dict['Area'],
-                        results['y_lowerBound_5%_buy'] / x_dict['Area'],
-                        results['y_upperBound_5%_buy'] / x_dict['Area'],
-                        
-                        results['y_predicted_rent'],
-                        results['y_lowerBound_5%_rent'],
-                        results['y_upperBound_5%_rent'],
-                        
-                        results['y_predicted_rent'] / x_dict['Area'],
-                        results['y_lowerBound_5%_rent'] / x_dict['Area'],
-                        results['y_upperBound_5%_rent'] / x_dict['Area'],
-                        
-                        results['y_predicted_buy']/(12 * results['y_predicted_rent']),
-                        (12 * results['y_predicted_rent'])/results['y_predicted_buy']*100
-                        )
\ No newline at end of file
+        # Return the apartment-configuration (with the nearest city of given coordinates) and the prediction results as 2 html-tables
+        return renderResult(formular_data, x_dict, results, confidence,
+                            nearestCityOfFormular(formular_data, x_dict, cityIndex))
+
+@app.route('/static/style.css', methods=['GET'])
+def stylesheet():
+    """Returns the stylesheet of the pages (compressed and with ETag) or "304 Not Modified" if the client has it already"""
+    return cachedPageResponse(stylesheetCache, 'text/css', STATIC_MAX_AGE)
+
+# Content-types of newline-delimited JSON (NDJSON)
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+
+def configurationsFromBody(body, ndjson=False):
+    """Returns list of apartment-configurations of given request-body (text) sent to the estimation-API,
+    either as JSON-array (or single JSON-object) or as newline-delimited JSON (NDJSON)"""
+    if ndjson:
+        try:
+            configurations = [json.loads(line) for line in body.splitlines() if line.strip()]
+        except ValueError:
+            raise ConfigurationError("Request body is no valid NDJSON") from None
+    else:
+        try:
+            configurations = json.loads(body)
+        except ValueError:
+            configurations = None
+        if isinstance(configurations, dict):
+            configurations = [configurations]
+        if not isinstance(configurations, list):
+            raise ConfigurationError("Request body has to be a JSON-array of apartment-configurations")
+    if not all(isinstance(configuration, dict) for configuration in configurations):
+        raise ConfigurationError("Each apartment-configuration has to be a JSON-object")
+    if len(configurations) > MAX_BATCH_SIZE:
+        raise ConfigurationError("Too many apartment-configurations (maximum: " + str(MAX_BATCH_SIZE) + ")")
+    return configurations
+
+def parseConfigurations():
+    """Returns list of apartment-configurations sent with the request to the estimation-API"""
+    return configurationsFromBody(request.get_data(as_text=True), request.mimetype in NDJSON_MIMETYPES)
+
+def configurationsToFeatures(configurations, cityIndex):
+    """Returns list of x_dicts (see configurationToFeatures()) of given apartment-configurations,
+    the error-message of an invalid configuration contains its position"""
+    x_dicts = []
+    with timed('parse_configuration'):
+        for i, configuration in enumerate(configurations):
+            try:
+                x_dicts.append(configurationToFeatures(configuration, cityIndex))
+            except ConfigurationError as error:
+                raise ConfigurationError("Configuration " + str(i) + ": " + str(error)) from None
+    return x_dicts
+
+def nearestCities(x_dicts, cityIndex):
+    """Returns list with the nearest city ('name' and 'distance_km') to the location of each of given x_dicts,
+    resolved with a single query of the spatial index of given cityIndex (see cityIndex.py)"""
+    if not x_dicts:
+        return []
+    with timed('reverse_geocoding'):
+        positions, distances = cityIndex.nearestMany([x_dict['Latitude'] for x_dict in x_dicts],
+                                                     [x_dict['Longitude'] for x_dict in x_dicts])
+        return [{'name': cityIndex.names[position], 'distance_km': round(float(distance), 2)}
+                for position, distance in zip(positions, distances)]
+
+def estimatesOfResults(results, n, cities=None):
+    """Returns list with the estimated values and bounds for buy & rent of each of the n configurations of results
+    and the nearest city of each configuration (if given, see nearestCities())"""
+    estimates = [{cat[1:]: {'estimate': float(results['y_predicted' + cat][i]),
+                            'lower_bound': float(results['y_lowerBound' + cat][i]),
+                            'upper_bound': float(results['y_upperBound' + cat][i])}
+                  for cat in ['_buy', '_rent']}
+                 for i in range(n)]
+    if cities is not None:
+        for estimate, city in zip(estimates, cities):
+            estimate['city'] = city
+    return estimates
+
+@app.errorhandler(ConfigurationError)
+def handleConfigurationError(error):
+    """Returns invalid apartment-configurations as client-error (400) instead of an internal server error"""
+    if request.path.startswith('/api/'):
+        return jsonify(error=str(error)), 400
+    return "Invalid apartment-configuration: " + escape(str(error)), 400
+
+@app.route('/api/v1/estimate', methods=['POST'])
+def estimate():
+    """
+    Estimation-API for a batch of apartment-configurations with the same fields as the HTML-formular
+    ('Area', 'Rooms', 'Construction_Year', 'Category', the condition & outdoor checkboxes
+    and 'Cityname' or 'Latitude' & 'Longitude').
+    All configurations are converted into one feature-matrix per model, so that buy and rent are
+    predicted with a single model.predict()-call each. Returns for each configuration the estimated
+    buy & rent price with the bounds of the confidence-intervall and the nearest city (name and distance
+    in km) as JSON (or NDJSON, if the configurations have been sent as NDJSON). The confidence-level can be set with the query-parameter
+    'confidence' (e.g. '?confidence=95', default is 90%).
+    """
+    configurations = parseConfigurations()
+    confidence = parseConfidence(request.args.get('confidence'))
+    variant, snapshot = requestedModel()
+    cityIndex = cityRegistry.get().value
+    x_dicts = configurationsToFeatures(configurations, cityIndex)
+    results = (estimatePrices(x_dicts, snapshot.value, confidence, predictionCache, snapshot.version)
+               if x_dicts else {})
+    modelVariants.observePredictions(variant, results)
+    
+    estimates = estimatesOfResults(results, len(x_dicts), nearestCities(x_dicts, cityIndex))
+    if request.mimetype in NDJSON_MIMETYPES:
+        return Response(''.join(json.dumps(row) + '\n' for row in estimates), mimetype='application/x-ndjson',
+                        headers={'X-Model-Version': snapshot.version, 'X-Model-Variant': variant})
+    return jsonify(model_version=snapshot.version, model_variant=variant, confidence=confidence, estimates=estimates)
+
+@app.route('/api/v1/cache', methods=['GET'])
+def cacheStats():
+    """Returns hit- & miss-counters and size of the prediction-cache of this worker as JSON"""
+    if predictionCache is None:
+        return jsonify(enabled=False)
+    return jsonify(enabled=True, **predictionCache.stats())
+
+# Content-types of the formats of the heat-map-endpoint
+HEATMAP_MIMETYPES = {'json': 'application/json', 'geojson': 'application/geo+json',
+                     'png': 'image/png', 'binary': 'application/octet-stream'}
+# Seconds browsers and CDNs may cache a heat-map
+HEATMAP_MAX_AGE = int(os.environ.get('HEATMAP_MAX_AGE', '3600'))
+
+def heatmapOptions(args):
+    """Returns (resolution, format, price, scale) of the query-parameters args of a heat-map-request
+    (see heatmapEndpoint()), raises ConfigurationError for invalid values"""
+    resolution = heatmap.parseResolution(args.get('resolution'))
+    resultFormat = args.get('format', 'json')
+    if resultFormat not in HEATMAP_MIMETYPES:
+        raise ConfigurationError("Format has to be one of: " + ", ".join(HEATMAP_MIMETYPES))
+    price = args.get('price', 'buy')
+    if price not in ('buy', 'rent'):
+        raise ConfigurationError("Price has to be 'buy' or 'rent'")
+    try:
+        scale = int(args.get('scale', '1'))
+    except ValueError:
+        scale = 0
+    if not 1 <= scale <= 16:
+        raise ConfigurationError("Scale has to be an integer between 1 and 16")
+    heatmap.checkFormat(resolution, resultFormat, scale)
+    return resolution, resultFormat, price, scale
+
+def renderHeatmap(args, options, variant, snapshot):
+    """Returns body and headers (model-version & -variant, bounds, shape and range of the grid) of the heat-map
+    of the profile given by the query-parameters args with given options (see heatmapOptions()) and model-variant"""
+    resolution, resultFormat, price, scale = options
+    grid, prices = heatmap.heatmap(args, resolution, snapshot, heatmapCache)
+    if resultFormat == 'json':
+        body = json.dumps(dict(heatmap.toJson(grid, prices), model_version=snapshot.version, model_variant=variant))
+    elif resultFormat == 'geojson':
+        body = json.dumps(heatmap.toGeoJson(grid, prices))
+    elif resultFormat == 'png':
+        body = heatmap.toPng(prices[price], scale)
+    else:
+        body = heatmap.toBinary(prices[price])
+    headers = [('X-Model-Version', snapshot.version), ('X-Model-Variant', variant),
+               ('X-Heatmap-Bounds', ','.join('{:g}'.format(bound) for bound in grid.bounds())),
+               ('X-Heatmap-Shape', '{},{}'.format(grid.rows, grid.cols))]
+    if resultFormat in ('png', 'binary'):
+        headers.append(('X-Heatmap-Range', '{:g},{:g}'.format(float(prices[price].min()), float(prices[price].max()))))
+    return body, headers
+
+def heatmapCacheControl(requestedVariant):
+    """Returns Cache-Control of a heat-map: shared caches (CDNs) may only store it, if the variant does not
+    depend on the weighted or client-specific routing (explicitly requested or only a single variant)"""
+    visibility = 'public' if requestedVariant or len(modelVariants.names) == 1 else 'private'
+    return '{}, max-age={}'.format(visibility, HEATMAP_MAX_AGE)
+
+@app.route('/api/v1/heatmap', methods=['GET'])
+def heatmapEndpoint():
+    """
+    Heat-map of the buy & rent prices of an apartment-profile over North Rhine-Westphalia.
+    The profile is given with the query-parameters of the formular without location ('Area', 'Rooms',
+    'Construction_Year', 'Category', the condition & outdoor checkboxes), the grid with 'resolution'
+    (in degrees, default 0.05). All grid-cells are predicted with a single model.predict()-call per model
+    and the grid is cached per profile, resolution and model-version (see heatmap.py).
+    'format' chooses the result: 'json' (default, matrices of buy & rent prices from north to south),
+    'geojson' (one polygon per cell), 'png' or 'binary' (little-endian float32-matrix) of the prices
+    chosen with 'price' ('buy' or 'rent'). Bounds and shape of the grid are sent as headers.
+    """
+    options = heatmapOptions(request.args)
+    variant, snapshot = requestedModel()
+    body, headers = renderHeatmap(request.args.to_dict(), options, variant, snapshot)
+    response = Response(body, mimetype=HEATMAP_MIMETYPES[options[1]], headers=headers)
+    response.vary.add('X-Model-Variant')
+    response.headers['Cache-Control'] = heatmapCacheControl(request.headers.get('X-Model-Variant'))
+    response.add_etag()
+    return response.make_conditional(request)
+
+def sensitivityRanges(args):
+    """Returns the ranges of the numerical elements given by the query-parameters args
+    ('area', 'rooms', 'construction_year', see sensitivity.parseRange())"""
+    return {element: sensitivity.parseRange(args.get(element.lower()), element) for element in sensitivity.DEFAULT_RANGES}
+
+@app.route('/api/v1/sensitivity', methods=['POST'])
+def sensitivityEndpoint():
+    """
+    What-if sensitivity of one apartment-configuration, sent as JSON-object or as formular-data with the same
+    fields as the HTML-formular. All single-feature variations (each condition & outdoor checkbox toggled,
+    each Category, ranges of 'Area', 'Rooms' and 'Construction_Year') are predicted together with the
+    configuration in one feature-matrix per model (see sensitivity.py). The ranges can be set with the
+    query-parameters 'area', 'rooms' and 'construction_year' as 'first:last:step' (e.g. '?area=60:120:5').
+    Returns the estimated buy & rent prices of the configuration and the marginal price-effect of each variation as JSON.
+    """
+    if request.is_json:
+        configuration = request.get_json(silent=True)
+        if not isinstance(configuration, dict):
+            raise ConfigurationError("Request body has to be a JSON-object of an apartment-configuration")
+    else:
+        configuration = request.form.to_dict()
+    ranges = sensitivityRanges(request.args)
+    variant, snapshot = requestedModel()
+    with timed('parse_configuration'):
+        x_dict = configurationToFeatures(configuration, cityRegistry.get().value)
+    return jsonify(model_version=snapshot.version, model_variant=variant, **sensitivity.sensitivity(x_dict, snapshot.value, ranges))
+
+
+def cacheMetrics():
+    """Returns counters of the prediction-cache for the metrics-endpoint"""
+    if predictionCache is None:
+        return []
+    stats = predictionCache.stats()
+    return (metrics.gauge('estimator_prediction_cache_hits_total', 'Hits of the prediction-cache', stats['hits'], 'counter')
+            + metrics.gauge('estimator_prediction_cache_misses_total', 'Misses of the prediction-cache', stats['misses'], 'counter')
+            + metrics.gauge('estimator_prediction_cache_size', 'Entries of the prediction-cache', stats['size']))
+
+metrics.collectors.append(cacheMetrics)
+metrics.collectors.append(modelVariants.testErrorMetrics)
+
+# Sampling-profiler per request (header 'X-Profile: 1'), only if enabled via environment-variable (e.g. in staging)
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '') in ('1', 'true')
+PROFILE_DIR = os.environ.get('PROFILE_DIR', tempfile.gettempdir())
+
+def startProfiler():
+    """Returns started profiler: pyinstrument (sampling, optional dependency) if installed, otherwise cProfile"""
+    try:
+        from pyinstrument import Profiler
+        profiler = Profiler(interval=0.0005)
+    except ImportError:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+    profiler.start()
+    return profiler
+
+def stopProfiler(profiler):
+    """Stops given profiler and returns the file, where its result has been written to: HTML-flame-graph
+    of pyinstrument or pstats-file of cProfile (can be viewed e.g. with snakeviz or converted with flameprof)"""
+    filename = os.path.join(PROFILE_DIR, 'profile-{}-{}'.format(time.strftime('%Y%m%d-%H%M%S'), os.getpid()))
+    if hasattr(profiler, 'output_html'):
+        profiler.stop()
+        filename += '.html'
+        with open(filename, mode='w') as file:
+            file.write(profiler.output_html())
+    else:
+        profiler.disable()
+        filename += '.prof'
+        profiler.dump_stats(filename)
+    return filename
+
+@app.before_request
+def startRequest():
+    """Records start of the request and starts the profiler if requested"""
+    g.requestStart = time.perf_counter()
+    preloadInBackground()
+    if PROFILING_ENABLED and request.headers.get('X-Profile'):
+        g.profiler = startProfiler()
+
+@app.after_request
+def finishRequest(response):
+    """Observes duration of the request and adds the file of the profile as header, if profiled"""
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        response.headers['X-Profile-File'] = stopProfiler(profiler)
+    if 'requestStart' in g:
+        request_seconds.observe(time.perf_counter() - g.requestStart,
+                                endpoint=request.endpoint or 'unknown', method=request.method)
+    return response
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness-probe: returns 200 as long as the process answers requests"""
+    return jsonify(status='ok')
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """Readiness-probe: returns 200 with the model-version after the startup-phase (see preload()),
+    otherwise 503, so that load-balancers send no requests to a process still loading its models"""
+    if not ready.is_set():
+        return jsonify(status='starting'), 503
+    return jsonify(status='ready', model_version=modelRegistry.version(), model_versions=modelVariants.versions())
+
+@app.route('/metrics', methods=['GET'])
+def metricsEndpoint():
+    """Returns the metrics of this worker in the text-format of Prometheus"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
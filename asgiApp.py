@@ -0,0 +1,435 @@
+"""
+Asynchronous serving mode of app.py as ASGI-application, e.g. started with
+    uvicorn asgiApp:app --host 0.0.0.0 --port $PORT
+or  gunicorn asgiApp:app -k uvicorn.workers.UvicornWorker
+(package 'uvicorn' is only needed for this mode).
+Request parsing and HTML rendering run on the event-loop, whereas the CPU-bound model.predict()-calls
+run on a bounded thread-pool, where buy and rent are predicted concurrently. Requests waiting for
+the models are micro-batched: all configurations queued while the models are busy are predicted
+together with a single model.predict()-call per model. If more than MAX_QUEUE_DEPTH requests are
+waiting, new requests are rejected with '503 Service Unavailable' (backpressure), so bursts are
+handled by one process holding one copy of the models instead of additional workers.
+Models, city-coordinates, prediction-cache and pages are the same as in app.py.
+
+@author: Michael Volk
+"""
+
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+from markupsafe import escape
+from werkzeug.http import generate_etag
+
+import app as estimator
+import metrics
+import sensitivity
+from estimation import (ConfigurationError, addBounds, cacheFill, cacheLookup, configurationToFeatures,
+                        modelInputs, parseConfidence, predictModel)
+from metrics import request_seconds, timed
+
+# Threads for model.predict() (buy and rent run concurrently), waiting requests before rejecting new ones,
+# maximal configurations per micro-batch and seconds to wait for further requests before predicting a batch
+INFERENCE_THREADS = int(os.environ.get('INFERENCE_THREADS', '2'))
+MAX_QUEUE_DEPTH = int(os.environ.get('MAX_QUEUE_DEPTH', '64'))
+MAX_MICRO_BATCH = int(os.environ.get('MAX_MICRO_BATCH', '4096'))
+MICRO_BATCH_WAIT = float(os.environ.get('MICRO_BATCH_WAIT', '0.001'))
+# Heavy jobs (heat-maps, sensitivity) running on the thread-pool at the same time, so that threads stay free for the micro-batches
+MAX_CONCURRENT_JOBS = int(os.environ.get('MAX_CONCURRENT_JOBS', str(max(1, INFERENCE_THREADS - 1))))
+# Maximal size of a request-body in bytes
+MAX_BODY_SIZE = int(os.environ.get('MAX_BODY_SIZE', str(64 * 1024 * 1024)))
+
+
+class Overloaded(Exception):
+    """Raised if too many requests are waiting for the models"""
+
+
+class Disconnected(ConnectionError):
+    """Raised if the client disconnected before the request-body was received"""
+
+
+class InferenceBatcher:
+    """
+    Queue of requests waiting for the models. A single background-task takes all queued requests
+    (of the same model-version, i.e. of the same model-variant, up to maxBatch configurations), predicts them as one batch on the
+    thread-pool (buy and rent concurrently) and hands the predicted values back to each request.
+    While a batch is predicted, new requests accumulate in the queue and form the next batch.
+    Other CPU-bound jobs (e.g. heat-maps) run on the same thread-pool via runJob(), at most maxJobs at a
+    time; jobs waiting for a slot count to the queue-depth, so they are rejected by the same backpressure.
+    """
+
+    def __init__(self, threads=INFERENCE_THREADS, maxQueue=MAX_QUEUE_DEPTH, maxBatch=MAX_MICRO_BATCH,
+                 maxWait=MICRO_BATCH_WAIT, maxJobs=MAX_CONCURRENT_JOBS):
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='inference')
+        self.maxQueue = maxQueue
+        self.maxBatch = maxBatch
+        self.maxWait = maxWait
+        self.maxJobs = maxJobs
+        self._queue = deque()
+        self._wakeup = None
+        self._jobSlots = None
+        self._jobsWaiting = 0
+        self._task = None
+        self.batches = 0
+
+    def start(self):
+        """Starts the background-task on the running event-loop"""
+        self._wakeup = asyncio.Event()
+        self._jobSlots = asyncio.Semaphore(self.maxJobs)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stops the background-task and the thread-pool"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self.pool.shutdown(wait=False)
+
+    def queueDepth(self):
+        return len(self._queue) + self._jobsWaiting
+
+    async def runJob(self, function, *args):
+        """Returns function(*args) run on the thread-pool as soon as one of the maxJobs slots is free,
+        raises Overloaded if the queue is full"""
+        if self.queueDepth() >= self.maxQueue:
+            raise Overloaded()
+        self._jobsWaiting += 1
+        try:
+            await self._jobSlots.acquire()
+        finally:
+            self._jobsWaiting -= 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.pool, function, *args)
+        finally:
+            self._jobSlots.release()
+
+    async def predict(self, x_dicts, snapshot):
+        """Returns dictionary with arrays of predicted values ('y_predicted'+cat) for given x_dicts
+        predicted with the model-configuration of given Snapshot, raises Overloaded if the queue is full"""
+        if len(self._queue) >= self.maxQueue:
+            raise Overloaded()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append((snapshot, x_dicts, future))
+        self._wakeup.set()
+        return await future
+
+    def _takeBatch(self):
+        """Removes and returns the next batch: the oldest queued request and all further queued requests
+        with the same model-version (e.g. of the same model-variant), the others keep their order"""
+        batch = [self._queue.popleft()]
+        size = len(batch[0][1])
+        remaining = deque()
+        while self._queue:
+            queued = self._queue.popleft()
+            if queued[0] is batch[0][0] and size + len(queued[1]) <= self.maxBatch:
+                batch.append(queued)
+                size += len(queued[1])
+            else:
+                remaining.append(queued)
+        self._queue.extend(remaining)
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wakeup.wait()
+            if self.maxWait > 0:
+                # Gives further requests the chance to join the batch
+                await asyncio.sleep(self.maxWait)
+            batch = self._takeBatch()
+            if not self._queue:
+                self._wakeup.clear()
+            snapshot = batch[0][0]
+            x_dicts = [x_dict for _, request_x_dicts, _ in batch for x_dict in request_x_dicts]
+            try:
+                x_in = await loop.run_in_executor(self.pool, modelInputs, x_dicts, snapshot.value)
+                predicted = await asyncio.gather(*[loop.run_in_executor(self.pool, predictModel, x_in[cat], snapshot.value, cat)
+                                                   for cat in ['_buy', '_rent']])
+            except Exception as error:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            self.batches += 1
+            start = 0
+            for _, request_x_dicts, future in batch:
+                end = start + len(request_x_dicts)
+                if not future.done():
+                    future.set_result({'y_predicted_buy': predicted[0][start:end], 'y_predicted_rent': predicted[1][start:end]})
+                start = end
+
+
+batcher = InferenceBatcher()
+
+
+async def estimatePricesAsync(x_dicts, snapshot, confidence):
+    """Returns the same as estimation.estimatePrices() with the prediction-cache of app.py,
+    but predicts the missing configurations via the InferenceBatcher"""
+    cache = estimator.predictionCache
+    if cache is None:
+        results = await batcher.predict(x_dicts, snapshot)
+    else:
+        keys, cached, missing = cacheLookup(x_dicts, cache, snapshot.version)
+        predicted = await batcher.predict([x_dicts[i] for i in missing.values()], snapshot) if missing else None
+        results = cacheFill(keys, cached, missing, predicted, cache)
+    return addBounds(results, snapshot.value, confidence)
+
+
+async def readBody(receive):
+    """Returns the complete body of the request"""
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise Disconnected("client disconnected")
+        body += message.get('body', b'')
+        if len(body) > MAX_BODY_SIZE:
+            raise ConfigurationError("Request body too large")
+        if not message.get('more_body', False):
+            return bytes(body)
+
+async def readText(receive):
+    """Returns the complete body of the request decoded as UTF-8, raises ConfigurationError if it is no UTF-8"""
+    body = await readBody(receive)
+    try:
+        return body.decode('utf-8')
+    except UnicodeDecodeError:
+        raise ConfigurationError("Request body has to be UTF-8 encoded") from None
+
+async def sendResponse(send, status, body, contentType='text/html; charset=utf-8', headers=(), head=False):
+    """Sends response with given status, body (str or bytes) and additional headers"""
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    allHeaders = [(b'content-type', contentType.encode()), (b'content-length', str(len(body)).encode())]
+    allHeaders += [(name.lower().encode(), str(value).encode()) for name, value in headers]
+    await send({'type': 'http.response.start', 'status': status, 'headers': allHeaders})
+    await send({'type': 'http.response.body', 'body': b'' if head else body})
+
+def requestHeaders(scope):
+    """Returns headers of the request as dictionary with lowercase names"""
+    return {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope.get('headers', [])}
+
+def queryParameters(scope):
+    """Returns query-parameters of the request as dictionary (first value of repeated parameters, like Flask)"""
+    parameters = {}
+    for key, value in parse_qsl(scope.get('query_string', b'').decode('latin-1'), keep_blank_values=True):
+        parameters.setdefault(key, value)
+    return parameters
+
+def notModified(headers, etag):
+    """Returns whether the ETag sent by the client in 'If-None-Match' matches given etag"""
+    ifNoneMatch = [tag.strip().replace('W/', '', 1).strip('"') for tag in headers.get('if-none-match', '').split(',')]
+    return etag in ifNoneMatch or '*' in ifNoneMatch
+
+def acceptedEncoding(acceptEncoding, pageCache):
+    """Returns best content-encoding of the page of given PageCache accepted by the client (ignoring q-values of 0)"""
+    accepted = {}
+    for part in acceptEncoding.split(','):
+        name, _, parameters = part.strip().partition(';')
+        quality = 1.0
+        if parameters.strip().startswith('q='):
+            try:
+                quality = float(parameters.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    candidates = [encoding for encoding in pageCache.encodings
+                  if encoding != 'identity' and accepted.get(encoding, accepted.get('*', 0)) > 0]
+    return max(candidates, key=lambda encoding: accepted.get(encoding, accepted.get('*', 0)), default='identity')
+
+
+async def cachedPage(scope, send, headers, pageCache, contentType, maxAge):
+    """Sends page of given PageCache in the best accepted content-encoding (see app.cachedPageResponse())"""
+    encoding = acceptedEncoding(headers.get('accept-encoding', ''), pageCache)
+    body, etag = pageCache.get(encoding)
+    responseHeaders = [('Vary', 'Accept-Encoding'), ('ETag', '"' + etag + '"'),
+                       ('Cache-Control', 'public, max-age={}'.format(maxAge))]
+    if encoding != 'identity':
+        responseHeaders.append(('Content-Encoding', encoding))
+    if notModified(headers, etag):
+        await sendResponse(send, 304, b'', contentType, headers=responseHeaders, head=True)
+    else:
+        await sendResponse(send, 200, body, contentType, headers=responseHeaders, head=scope['method'] == 'HEAD')
+
+def requestedModel(headers):
+    """Returns name and current Snapshot of the model-variant the request is routed to (see app.requestedModel())"""
+    variant = estimator.modelVariants.choose(headers.get('x-model-variant'), headers.get('x-routing-key'))
+    return variant, estimator.modelVariants.get(variant)
+
+async def result(receive, send, headers):
+    """Predicts buy & rent price for the posted formular-data and sends the result-page"""
+    body = await readText(receive)
+    formular_data = {}
+    for key, value in parse_qsl(body, keep_blank_values=True):
+        formular_data.setdefault(key, value)
+    variant, snapshot = requestedModel(headers)
+    cityIndex = estimator.cityRegistry.get().value
+    with timed('parse_configuration'):
+        x_dict = configurationToFeatures(formular_data, cityIndex)
+    confidence = parseConfidence(formular_data.get('Confidence_Level'))
+    results = await estimatePricesAsync([x_dict], snapshot, confidence)
+    estimator.modelVariants.observePredictions(variant, results)
+    results = {key: values[0] for key, values in results.items()}
+    await sendResponse(send, 200, estimator.renderResult(formular_data, x_dict, results, confidence,
+                                                         estimator.nearestCityOfFormular(formular_data, x_dict, cityIndex)))
+
+async def estimate(scope, receive, send, headers):
+    """Estimation-API (see app.estimate())"""
+    body = await readText(receive)
+    ndjson = headers.get('content-type', '').split(';')[0].strip() in estimator.NDJSON_MIMETYPES
+    configurations = estimator.configurationsFromBody(body, ndjson)
+    query = dict(parse_qsl(scope.get('query_string', b'').decode('latin-1')))
+    confidence = parseConfidence(query.get('confidence'))
+    variant, snapshot = requestedModel(headers)
+    cityIndex = estimator.cityRegistry.get().value
+    x_dicts = estimator.configurationsToFeatures(configurations, cityIndex)
+    results = await estimatePricesAsync(x_dicts, snapshot, confidence) if x_dicts else {}
+    estimator.modelVariants.observePredictions(variant, results)
+    estimates = estimator.estimatesOfResults(results, len(x_dicts), estimator.nearestCities(x_dicts, cityIndex))
+    if ndjson:
+        await sendResponse(send, 200, ''.join(json.dumps(row) + '\n' for row in estimates),
+                           'application/x-ndjson', [('X-Model-Version', snapshot.version), ('X-Model-Variant', variant)])
+    else:
+        await sendResponse(send, 200, json.dumps({'model_version': snapshot.version, 'model_variant': variant,
+                                                  'confidence': confidence, 'estimates': estimates}), 'application/json')
+
+async def heatmapEndpoint(scope, send, headers):
+    """Heat-map (see app.heatmapEndpoint()), predicted and encoded as job of the InferenceBatcher (see runJob())"""
+    args = queryParameters(scope)
+    options = estimator.heatmapOptions(args)
+    variant, snapshot = requestedModel(headers)
+    body, responseHeaders = await batcher.runJob(estimator.renderHeatmap, args, options, variant, snapshot)
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    etag = generate_etag(body)
+    responseHeaders += [('Vary', 'X-Model-Variant'), ('ETag', '"' + etag + '"'),
+                        ('Cache-Control', estimator.heatmapCacheControl(headers.get('x-model-variant')))]
+    contentType = estimator.HEATMAP_MIMETYPES[options[1]]
+    if notModified(headers, etag):
+        await sendResponse(send, 304, b'', contentType, headers=responseHeaders, head=True)
+    else:
+        await sendResponse(send, 200, body, contentType, headers=responseHeaders)
+
+async def sensitivityEndpoint(scope, receive, send, headers):
+    """What-if sensitivity (see app.sensitivityEndpoint()), predicted as job of the InferenceBatcher (see runJob())"""
+    body = await readText(receive)
+    if headers.get('content-type', '').split(';')[0].strip() == 'application/json':
+        try:
+            configuration = json.loads(body)
+        except ValueError:
+            configuration = None
+        if not isinstance(configuration, dict):
+            raise ConfigurationError("Request body has to be a JSON-object of an apartment-configuration")
+    else:
+        configuration = {}
+        for key, value in parse_qsl(body, keep_blank_values=True):
+            configuration.setdefault(key, value)
+    ranges = estimator.sensitivityRanges(queryParameters(scope))
+    variant, snapshot = requestedModel(headers)
+    with timed('parse_configuration'):
+        x_dict = configurationToFeatures(configuration, estimator.cityRegistry.get().value)
+    result = await batcher.runJob(sensitivity.sensitivity, x_dict, snapshot.value, ranges)
+    await sendResponse(send, 200, json.dumps(dict(result, model_version=snapshot.version, model_variant=variant)),
+                       'application/json')
+
+async def lifespan(receive, send):
+    """Runs the startup-phase (see app.preload()) and starts the InferenceBatcher at startup"""
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, estimator.preload)
+                batcher.start()
+            except Exception as error:
+                await send({'type': 'lifespan.startup.failed', 'message': repr(error)})
+                return
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await batcher.stop()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    """ASGI-application with the routes of app.py"""
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+    if batcher._task is None:
+        # Servers without lifespan-support: start on first request
+        batcher.start()
+        estimator.preloadInBackground()
+    start = time.perf_counter()
+    path, method = scope['path'], scope['method']
+    headers = requestHeaders(scope)
+    endpoint = 'unknown'
+    try:
+        if path == '/' and method in ('GET', 'HEAD'):
+            endpoint = 'predict'
+            await cachedPage(scope, send, headers, estimator.formularCache, 'text/html; charset=utf-8',
+                             estimator.FORMULAR_MAX_AGE)
+        elif path == '/static/style.css' and method in ('GET', 'HEAD'):
+            endpoint = 'stylesheet'
+            await cachedPage(scope, send, headers, estimator.stylesheetCache, 'text/css; charset=utf-8',
+                             estimator.STATIC_MAX_AGE)
+        elif path == '/' and method == 'POST':
+            endpoint = 'predict'
+            await result(receive, send, headers)
+        elif path == '/api/v1/estimate' and method == 'POST':
+            endpoint = 'estimate'
+            await estimate(scope, receive, send, headers)
+        elif path == '/api/v1/heatmap' and method == 'GET':
+            endpoint = 'heatmapEndpoint'
+            await heatmapEndpoint(scope, send, headers)
+        elif path == '/api/v1/sensitivity' and method == 'POST':
+            endpoint = 'sensitivityEndpoint'
+            await sensitivityEndpoint(scope, receive, send, headers)
+        elif path == '/api/v1/cache' and method == 'GET':
+            endpoint = 'cacheStats'
+            cache = estimator.predictionCache
+            stats = dict(enabled=True, **cache.stats()) if cache is not None else {'enabled': False}
+            await sendResponse(send, 200, json.dumps(stats), 'application/json')
+        elif path == '/healthz' and method == 'GET':
+            endpoint = 'healthz'
+            await sendResponse(send, 200, json.dumps({'status': 'ok'}), 'application/json')
+        elif path == '/readyz' and method == 'GET':
+            endpoint = 'readyz'
+            if estimator.ready.is_set():
+                await sendResponse(send, 200, json.dumps({'status': 'ready', 'model_version': estimator.modelRegistry.version(),
+                                                               'model_versions': estimator.modelVariants.versions()}),
+                                   'application/json')
+            else:
+                await sendResponse(send, 503, json.dumps({'status': 'starting'}), 'application/json')
+        elif path == '/metrics' and method == 'GET':
+            endpoint = 'metricsEndpoint'
+            await sendResponse(send, 200, metrics.render(), 'text/plain; version=0.0.4')
+        else:
+            await sendResponse(send, 404, 'Not Found', 'text/plain')
+    except ConfigurationError as error:
+        if path.startswith('/api/'):
+            await sendResponse(send, 400, json.dumps({'error': str(error)}), 'application/json')
+        else:
+            await sendResponse(send, 400, "Invalid apartment-configuration: " + escape(str(error)))
+    except Overloaded:
+        await sendResponse(send, 503, 'Too many requests waiting for the models, please retry', 'text/plain',
+                           [('Retry-After', '1')])
+    except Disconnected:
+        # Nobody is left to receive a response
+        pass
+    finally:
+        request_seconds.observe(time.perf_counter() - start, endpoint=endpoint, method=method)
+
+
+def queueMetrics():
+    """Returns queue-depth and number of predicted micro-batches for the metrics-endpoint"""
+    return (metrics.gauge('estimator_inference_queue_depth', 'Requests waiting for the models', batcher.queueDepth())
+            + metrics.gauge('estimator_inference_batches_total', 'Predicted micro-batches', batcher.batches, 'counter'))
+
+metrics.collectors.append(queueMetrics)
@@ -0,0 +1,80 @@
+"""
+Micro-benchmark of the feature-assembly of a single request (and of a batch) without the model itself:
+compares the former per-request assembly of predict() in app.py (lookup of every map_cat-tuple in the
+formular-items, loop over columns_used, np.array and one-row pd.DataFrame per model) with the
+FeatureEncoder compiled once per model (see estimation.py).
+
+Run from the directory of app.py: python benchmarks/featureEncoding.py
+
+@author: Michael Volk
+"""
+
+import os
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from estimation import FeatureEncoder, configurationToFeatures, featureRows, features, map_cat, map_num  # noqa: E402
+
+
+class NamedModel:
+    """Stand-in for a model fitted with column-names (e.g. a scikit-learn model fitted on a DataFrame)"""
+    feature_names_in_ = None
+
+
+class UnnamedModel:
+    """Stand-in for a model fitted without column-names"""
+
+
+class CityIndexStandIn:
+    """Stand-in for cityIndex.CityIndex with a single city"""
+    def lookup(self, cityname):
+        return (50.7614, 6.1107)
+
+
+formular_data = {'chooseLocation': 'cityname', 'Cityname': 'Aachen', 'Category': 'Apartment', 'Area': '100',
+                 'Rooms': '4', 'Construction_Year': '2010', 'Maintained': '1', 'Balcony': '1'}
+# Model-columns in a different order than the canonical features
+columns_used = list(reversed(features))
+
+
+def formerAssembly():
+    """Feature-assembly of predict() before the FeatureEncoder (for both models)"""
+    x_dict = {key: float(formular_data[map_num[key]]) for key in map_num}
+    x_dict.update({key: 1 if map_cat[key] in formular_data.items() else 0 for key in map_cat})
+    x_dict.update({'Latitude': 50.7614, 'Longitude': 6.1107})
+    for cat in ['_buy', '_rent']:
+        x = []
+        for col in columns_used:
+            x.append(x_dict[col] if col in x_dict else 0)
+        pd.DataFrame(np.array(x).reshape(1, -1), columns=columns_used)
+
+
+def encoderAssembly(encoder):
+    """Feature-assembly with the compiled FeatureEncoder (for both models)"""
+    rows = featureRows([configurationToFeatures(formular_data, CityIndexStandIn())])
+    for cat in ['_buy', '_rent']:
+        encoder.modelInput(rows)
+
+
+def report(name, function, number):
+    """Prints the best mean time per call of 5 repetitions"""
+    best = min(timeit.repeat(function, number=number, repeat=5)) / number
+    print("{:<45} {:>10.1f} µs".format(name, best * 1e6))
+    return best
+
+
+if __name__ == '__main__':
+    named, unnamed = FeatureEncoder(columns_used, NamedModel()), FeatureEncoder(columns_used, UnnamedModel())
+    print("Single request (buy & rent):")
+    former = report("former assembly (one-row DataFrame)", formerAssembly, 2000)
+    new = report("FeatureEncoder, model with column-names", lambda: encoderAssembly(named), 2000)
+    newPlain = report("FeatureEncoder, model without column-names", lambda: encoderAssembly(unnamed), 2000)
+    print("=> speedup {:.1f}x (with column-names) / {:.1f}x (without)".format(former / new, former / newPlain))
+
+    batch = [configurationToFeatures(formular_data, CityIndexStandIn()) for _ in range(10000)]
+    print("Batch of {} configurations (buy & rent):".format(len(batch)))
+    report("featureRows + FeatureEncoder", lambda: [unnamed.encode(featureRows(batch)) for _ in range(2)], 5)
@@ -0,0 +1,257 @@
+"""
+Benchmark- and load-test-suite for the endpoints of app.py, which runs locally without network-access.
+Synthetic stand-in models (see syntheticModels.py) are created in a temporary directory and the app
+is driven with three scenarios: GET-requests of the formular, POST-requests via cityname and
+POST-requests via coordinates (with varying apartment-configurations).
+Two modes are measured:
+    - flask: sequential requests with the Flask test-client in this process
+    - gunicorn: concurrent requests against a local gunicorn-instance (started with gunicorn.conf.py)
+For each scenario p50/p95/p99-latency and requests per second are reported, furthermore the peak
+RSS of the process (flask) or of each gunicorn-worker. The results are compared with a stored
+baseline and the script exits with status 1, if they regress by more than the tolerance.
+
+Run from the directory of app.py:
+    python benchmarks/loadTest.py --update-baseline     (store results as baseline on this machine)
+    python benchmarks/loadTest.py                       (compare with stored baseline)
+
+@author: Michael Volk
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+import numpy as np
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, REPO_DIR)
+from cityIndex import CityIndex  # noqa: E402
+from syntheticModels import writeSyntheticModels  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+SCENARIOS = ['get_form', 'post_cityname', 'post_coordinates']
+# Requests per scenario sent before measuring (e.g. to fill caches of the interpreter and the OS)
+WARMUP_REQUESTS = 10
+
+
+def formularData(scenario, rng, citynames):
+    """Returns random formular-data of an apartment-configuration for given POST-scenario"""
+    data = {'Category': rng.choice(['Apartment', 'Floor-Apartment', 'Maisonette', 'Penthouse', 'Terrace-Apartment', 'Loft']),
+            'Area': str(rng.randint(20, 180)), 'Rooms': str(rng.randint(1, 7)),
+            'Construction_Year': str(rng.randint(1850, 2021)), 'Confidence_Level': '90'}
+    for checkbox in ['First Occupancy', 'Upscale', 'Maintained', 'Renovated', 'Refurbished',
+                     'Balcony', 'Garden', 'Loggia', 'Terrace']:
+        if rng.random() < 0.3:
+            data[checkbox] = '1'
+    if scenario == 'post_cityname':
+        data.update(chooseLocation='cityname', Cityname=rng.choice(citynames))
+    else:
+        data.update(chooseLocation='coordinates', Latitude='{:.4f}'.format(rng.uniform(50.56, 52.34)),
+                    Longitude='{:.4f}'.format(rng.uniform(6.03, 9.37)))
+    return data
+
+def requestsOfScenario(scenario, n, citynames, seed=0):
+    """Returns n requests (method, body) of given scenario"""
+    rng = random.Random(seed)
+    if scenario == 'get_form':
+        return [('GET', None)] * n
+    return [('POST', urlencode(formularData(scenario, rng, citynames))) for _ in range(n)]
+
+def summary(latencies, duration):
+    """Returns percentiles of given latencies (seconds) in ms and requests per second"""
+    latencies = np.array(latencies) * 1000
+    return {'p50_ms': float(np.percentile(latencies, 50)),
+            'p95_ms': float(np.percentile(latencies, 95)),
+            'p99_ms': float(np.percentile(latencies, 99)),
+            'rps': len(latencies) / duration}
+
+def runFlask(n, citynames):
+    """Runs all scenarios sequentially with the Flask test-client and returns the results"""
+    import app
+    client = app.app.test_client()
+    app.preload()
+    results = {}
+    for scenario in SCENARIOS:
+        requests = requestsOfScenario(scenario, WARMUP_REQUESTS + n, citynames)
+        latencies = []
+        for i, (method, body) in enumerate(requests):
+            if i == WARMUP_REQUESTS:
+                latencies = []
+                start = time.perf_counter()
+            begin = time.perf_counter()
+            if method == 'GET':
+                response = client.get('/', headers={'Accept-Encoding': 'gzip'})
+            else:
+                response = client.post('/', data=body, content_type='application/x-www-form-urlencoded')
+            latencies.append(time.perf_counter() - begin)
+            assert response.status_code == 200, response.status_code
+        results[scenario] = summary(latencies, time.perf_counter() - start)
+    # ru_maxrss is in kilobytes on Linux
+    results['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return results
+
+def freePort():
+    """Returns a free local TCP-port"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def sendRequest(port, method, body):
+    """Sends request to the local server and returns (status, latency in seconds)"""
+    begin = time.perf_counter()
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    try:
+        headers = {'Accept-Encoding': 'gzip'}
+        if body is not None:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        connection.request(method, '/', body=body, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        return response.status, time.perf_counter() - begin
+    finally:
+        connection.close()
+
+def workerPids(masterPid):
+    """Returns pids of the child-processes (gunicorn-workers) of given process (Linux only)"""
+    try:
+        with open('/proc/{0}/task/{0}/children'.format(masterPid)) as file:
+            return [int(pid) for pid in file.read().split()]
+    except OSError:
+        return []
+
+def peakRssMb(pid):
+    """Returns peak resident set size (VmHWM) of given process in MB (Linux only, otherwise None)"""
+    try:
+        with open('/proc/{}/status'.format(pid)) as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+
+def runGunicorn(n, citynames, env, workers, concurrency):
+    """Runs all scenarios with concurrent requests against a local gunicorn-instance and returns the results"""
+    port = freePort()
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', os.path.join(REPO_DIR, 'gunicorn.conf.py'),
+                               '-w', str(workers), '-b', '127.0.0.1:{}'.format(port), 'app:app'],
+                              cwd=REPO_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.time() + 60
+        while True:
+            try:
+                if sendRequest(port, 'GET', None)[0] == 200:
+                    break
+            except OSError:
+                pass
+            if time.time() > deadline or server.poll() is not None:
+                raise RuntimeError("gunicorn did not start")
+            time.sleep(0.2)
+        results = {}
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for scenario in SCENARIOS:
+                requests = requestsOfScenario(scenario, WARMUP_REQUESTS + n, citynames)
+                list(pool.map(lambda request: sendRequest(port, *request), requests[:WARMUP_REQUESTS]))
+                start = time.perf_counter()
+                responses = list(pool.map(lambda request: sendRequest(port, *request), requests[WARMUP_REQUESTS:]))
+                duration = time.perf_counter() - start
+                assert all(status == 200 for status, _ in responses), "request failed"
+                results[scenario] = summary([latency for _, latency in responses], duration)
+        rss = [peakRssMb(pid) for pid in workerPids(server.pid)]
+        rss = [value for value in rss if value is not None]
+        results['peak_rss_mb_per_worker'] = max(rss) if rss else None
+        return results
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+def regressions(results, baseline, tolerance, minDeltaMs=1.0):
+    """Returns list of descriptions of all metrics, which are worse than the baseline by more than tolerance
+    (latencies additionally by more than minDeltaMs, so sub-millisecond jitter is not reported)"""
+    found = []
+    for mode, metrics in results.items():
+        for scenario, values in metrics.items():
+            base = baseline.get(mode, {}).get(scenario)
+            if base is None:
+                continue
+            if not isinstance(values, dict):
+                values, base = {scenario: values}, {scenario: base}
+            for metric, value in values.items():
+                if value is None or base.get(metric) is None:
+                    continue
+                # Higher requests per second are better, for all other metrics (latency, memory) lower is better
+                if metric == 'rps':
+                    worse = value < base[metric] * (1 - tolerance)
+                elif metric.endswith('_ms'):
+                    worse = value > base[metric] * (1 + tolerance) and value - base[metric] > minDeltaMs
+                else:
+                    worse = value > base[metric] * (1 + tolerance)
+                if worse:
+                    found.append("{} {} {}: {:.2f} (baseline {:.2f})".format(mode, scenario, metric, value, base[metric]))
+    return found
+
+def printResults(results):
+    """Prints the results as table"""
+    for mode, metrics in results.items():
+        print("\n" + mode)
+        for scenario in SCENARIOS:
+            values = metrics[scenario]
+            print("  {:<18} p50 {:>7.2f} ms   p95 {:>7.2f} ms   p99 {:>7.2f} ms   {:>8.1f} req/s".format(
+                scenario, values['p50_ms'], values['p95_ms'], values['p99_ms'], values['rps']))
+        for key in metrics:
+            if key not in SCENARIOS and metrics[key] is not None:
+                print("  {:<18} {:.1f}".format(key, metrics[key]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark- and load-test-suite for app.py")
+    parser.add_argument('--mode', choices=['flask', 'gunicorn', 'all'], default='all')
+    parser.add_argument('--requests', type=int, default=300, help="requests per scenario")
+    parser.add_argument('--workers', type=int, default=2, help="gunicorn-workers")
+    parser.add_argument('--concurrency', type=int, default=4, help="concurrent clients against gunicorn")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed relative regression")
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help="allowed absolute regression of latencies")
+    parser.add_argument('--update-baseline', action='store_true', help="store results as new baseline")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='benchmark_models_')
+    try:
+        writeSyntheticModels(directory)
+        shutil.copy(os.path.join(REPO_DIR, 'nrwCityCoordinates.csv'), directory)
+        os.environ.update(MODEL_DIR=directory, CITY_FILE=os.path.join(directory, 'nrwCityCoordinates.csv'))
+        citynames = CityIndex.fromCsv(os.environ['CITY_FILE']).names
+
+        results = {}
+        if args.mode in ('flask', 'all'):
+            results['flask'] = runFlask(args.requests, citynames)
+        if args.mode in ('gunicorn', 'all'):
+            results['gunicorn'] = runGunicorn(args.requests, citynames, dict(os.environ), args.workers, args.concurrency)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    printResults(results)
+
+    if args.update_baseline:
+        with open(args.baseline, mode='w') as file:
+            json.dump(results, file, indent=2)
+        print("\nStored results as baseline in", args.baseline)
+    elif os.path.isfile(args.baseline):
+        with open(args.baseline) as file:
+            found = regressions(results, json.load(file), args.tolerance, args.min_delta_ms)
+        if found:
+            print("\nRegressions against baseline (tolerance {:.0%}):".format(args.tolerance))
+            print("\n".join("  " + description for description in found))
+            sys.exit(1)
+        print("\nNo regressions against baseline (tolerance {:.0%})".format(args.tolerance))
+    else:
+        print("\nNo baseline found, store one with --update-baseline")
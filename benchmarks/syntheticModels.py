@@ -0,0 +1,68 @@
+"""
+Synthetic stand-in models for benchmarks without the real 'model_buy.p' and 'model_rent.p'.
+The created pickles have the same structure as the ones created by modeling.py: a dictionary with
+'model' (scikit-learn regressor fitted on a DataFrame with log-prices as target), 'columns_used',
+'test_errors' and 'test_errors_notAbsolute' (pandas.Series of relative errors).
+
+Create them in a directory with: python benchmarks/syntheticModels.py <directory>
+
+@author: Michael Volk
+"""
+
+import os
+import pickle
+import sys
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from estimation import features  # noqa: E402
+
+
+def syntheticData(n, rng):
+    """Returns DataFrame with n random apartment-configurations in North Rhine-Westphalia"""
+    x = pd.DataFrame(0.0, index=range(n), columns=features)
+    x['Area'] = rng.uniform(20, 180, n)
+    x['Rooms'] = np.clip(np.round(x['Area'] / 30 + rng.normal(0, 0.7, n)), 1, 7)
+    x['ConstructionYear'] = rng.integers(1850, 2022, n)
+    for prefix in ['EQ_CAT_', 'EQ_CON_']:
+        columns = [col for col in features if col.startswith(prefix)]
+        chosen = rng.integers(0, len(columns), n)
+        for i, col in enumerate(columns):
+            x[col] = (chosen == i).astype(float)
+    for col in [col for col in features if col.startswith('EQ_OUT_')]:
+        x[col] = (rng.random(n) < 0.4).astype(float)
+    x['Latitude'] = rng.uniform(50.56, 52.34, n)
+    x['Longitude'] = rng.uniform(6.03, 9.37, n)
+    return x
+
+def syntheticModel(pricePerArea, n=5000, n_estimators=100, seed=0):
+    """Returns model-configuration (dictionary like the pickles of modeling.py) of a random forest
+    fitted on synthetic data with given average price per m²"""
+    rng = np.random.default_rng(seed)
+    x = syntheticData(n, rng)
+    # Prices increase with area, age of building and proximity to the Rhine (around longitude 6.9)
+    log_y = (np.log(pricePerArea * x['Area']) + 0.002 * (x['ConstructionYear'] - 1950)
+             - 0.15 * np.abs(x['Longitude'] - 6.9) + 0.1 * x['EQ_CON_upscale'] + rng.normal(0, 0.15, n))
+    x_train, x_test = x.iloc[:int(0.8 * n)], x.iloc[int(0.8 * n):]
+    y_train, y_test = log_y.iloc[:int(0.8 * n)], log_y.iloc[int(0.8 * n):]
+    model = RandomForestRegressor(n_estimators=n_estimators, max_depth=12, random_state=seed, n_jobs=1)
+    model.fit(x_train, y_train)
+    test_errors_notAbsolute = pd.Series(model.predict(x_test) - y_test.values)
+    return {'model': model,
+            'columns_used': list(features),
+            'test_errors': test_errors_notAbsolute.abs(),
+            'test_errors_notAbsolute': test_errors_notAbsolute}
+
+def writeSyntheticModels(directory, **kwargs):
+    """Writes synthetic 'model_buy.p' and 'model_rent.p' into given directory"""
+    os.makedirs(directory, exist_ok=True)
+    for cat, pricePerArea, seed in [('_buy', 3000, 1), ('_rent', 9, 2)]:
+        with open(os.path.join(directory, 'model' + cat + '.p'), mode='wb') as pickled:
+            pickle.dump(syntheticModel(pricePerArea, seed=seed, **kwargs), pickled)
+
+
+if __name__ == '__main__':
+    writeSyntheticModels(sys.argv[1] if len(sys.argv) > 1 else '.')
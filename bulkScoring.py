@@ -0,0 +1,253 @@
+"""
+Command-line pipeline for scoring large files of apartment-configurations (e.g. the whole listing-database)
+with the same model-configurations, feature-mapping (map_num & map_cat) and city-coordinates as app.py.
+The input (CSV or Parquet) has the same columns as the formular and the estimation-API ('Area', 'Rooms',
+'Construction_Year', 'Category', the condition & outdoor flags and 'Cityname' or 'Latitude' & 'Longitude').
+It is read in chunks of fixed size and each chunk is scored with a single model.predict()-call per model.
+The output gets all input-columns plus the estimated buy & rent prices with the bounds of the
+confidence-intervall and an 'error'-column for invalid configurations (whose estimates stay empty).
+Scored chunks are written in input-order as soon as they are done, so memory stays flat for any file-size:
+CSV-output is appended to a single file, Parquet-output (path ending with '.parquet') is written as
+directory with one part-file per chunk.
+With --workers > 1 chunks are scored in a pool of processes (forked after loading the models, so the
+workers share their memory-pages), with at most two chunks per worker in flight.
+After each written chunk a checkpoint is stored next to the output. With --resume an interrupted run
+continues after the last checkpointed chunk (if the models have not changed in between).
+
+Score a CSV-file with the models of the current directory using 4 processes:
+    python bulkScoring.py listings.csv scores.csv --workers 4
+Resume after a failure:
+    python bulkScoring.py listings.csv scores.csv --workers 4 --resume
+
+Parquet-files require the package pyarrow.
+
+@author: Michael Volk
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import app as estimator
+from estimation import (ConfigurationError, checkbox_features, configurationToFeatures, estimatePrices, map_num,
+                        parseConfidence)
+from modelRegistry import contentHash
+
+# Columns of the input used for the features (see estimation.configurationToFeatures())
+INPUT_COLUMNS = set(map_num.values()) | {element for element, key in checkbox_features} | {
+    'Category', 'chooseLocation', 'Cityname', 'Latitude', 'Longitude'}
+# Columns added to each row of the input
+SCORE_COLUMNS = [cat[1:] + suffix for cat in ['_buy', '_rent'] for suffix in ['_estimate', '_lower_bound', '_upper_bound']]
+ERROR_COLUMN = 'error'
+
+# Model-configurations and city-coordinates of this process (set in the main process before forking the workers)
+_resources = None
+
+
+def isParquet(filename):
+    """Returns whether given file (or output-directory) is in Parquet-format"""
+    return filename.lower().endswith('.parquet')
+
+def importParquet():
+    """Returns module pyarrow.parquet (optional dependency only needed for Parquet-files)"""
+    try:
+        import pyarrow.parquet
+    except ImportError:
+        sys.exit("Reading and writing Parquet-files requires the package 'pyarrow'")
+    return pyarrow.parquet
+
+def loadResources(modelDir, cityFile):
+    """Loads model-configurations and city-coordinates of this process, if not already loaded (e.g. inherited)"""
+    global _resources
+    if _resources is None:
+        _resources = (estimator.load_modelConfigurations(modelDir), estimator.load_cityCoordinates(cityFile))
+    return _resources
+
+def readChunks(filename, chunkSize, skipRows=0):
+    """Yields DataFrames with at most chunkSize rows of given CSV- or Parquet-file, starting after skipRows rows.
+    CSV-values are read as strings (like the formular-data), empty Parquet-values are None.
+    Skipped rows are parsed as well, since rows of a CSV-file may span several lines (quoted line-breaks)"""
+    if isParquet(filename):
+        chunks = (batch.to_pandas() for batch in importParquet().ParquetFile(filename).iter_batches(batch_size=chunkSize))
+        chunks = (chunk.astype(object).where(chunk.notna(), None) for chunk in chunks)
+    else:
+        chunks = pd.read_csv(filename, dtype=str, keep_default_na=False, chunksize=chunkSize)
+    for chunk in chunks:
+        if skipRows and skipRows >= len(chunk):
+            skipRows -= len(chunk)
+            continue
+        if skipRows:
+            chunk, skipRows = chunk.iloc[skipRows:], 0
+        yield chunk
+
+def emptyChunk(filename):
+    """Returns DataFrame without rows with the columns of given CSV- or Parquet-file"""
+    if isParquet(filename):
+        return importParquet().ParquetFile(filename).schema_arrow.empty_table().to_pandas()
+    return pd.read_csv(filename, dtype=str, keep_default_na=False, nrows=0)
+
+def scoreChunk(chunk, confidence):
+    """Returns given chunk with the estimates & bounds of buy and rent and the error-message of invalid rows"""
+    modelConfigs, cityIndex = _resources
+    x_dicts, valid, errors = [], [], [''] * len(chunk)
+    # Configurations built from the column-lists, which is much faster than DataFrame.to_dict('records')
+    columns = [column for column in chunk.columns if column in INPUT_COLUMNS]
+    rows = zip(*(chunk[column].tolist() for column in columns))
+    for i, configuration in enumerate(dict(zip(columns, row)) for row in rows):
+        try:
+            x_dicts.append(configurationToFeatures(configuration, cityIndex))
+            valid.append(i)
+        except ConfigurationError as error:
+            errors[i] = str(error)
+    scores = np.full((len(chunk), len(SCORE_COLUMNS)), np.nan)
+    if x_dicts:
+        results = estimatePrices(x_dicts, modelConfigs, confidence)
+        scores[valid] = np.column_stack([results[prefix + cat] for cat in ['_buy', '_rent']
+                                         for prefix in ['y_predicted', 'y_lowerBound', 'y_upperBound']])
+    scored = chunk.copy()
+    for j, column in enumerate(SCORE_COLUMNS):
+        scored[column] = scores[:, j]
+    scored[ERROR_COLUMN] = errors
+    return scored
+
+
+class OutputWriter:
+    """
+    Writes scored chunks incrementally: appended to a CSV-file or as part-files into a Parquet-directory.
+    position() returns what is needed to continue writing after the last chunk: the size of the
+    CSV-file (so a partially written chunk is cut off when resuming) or the number of part-files.
+    """
+
+    def __init__(self, filename, position=None):
+        self.filename = filename
+        self.parquet = isParquet(filename)
+        if self.parquet:
+            if position is None:
+                shutil.rmtree(filename, ignore_errors=True)
+            os.makedirs(filename, exist_ok=True)
+            self.parts = position or 0
+        else:
+            self.file = open(filename, mode='r+b' if position is not None else 'wb')
+            if position is not None:
+                self.file.truncate(position)
+                self.file.seek(position)
+            self.header = position is None
+
+    def write(self, chunk):
+        if self.parquet:
+            import pyarrow
+            partname = os.path.join(self.filename, 'part-{:06d}.parquet'.format(self.parts))
+            importParquet().write_table(pyarrow.Table.from_pandas(chunk, preserve_index=False), partname)
+            self.parts += 1
+        else:
+            self.file.write(chunk.to_csv(index=False, header=self.header).encode('utf-8'))
+            self.header = False
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def position(self):
+        return self.parts if self.parquet else self.file.tell()
+
+    def close(self):
+        if not self.parquet:
+            self.file.close()
+
+
+def readCheckpoint(filename):
+    """Returns stored checkpoint or None if there is none"""
+    if not os.path.isfile(filename):
+        return None
+    with open(filename) as file:
+        return json.load(file)
+
+def writeCheckpoint(filename, checkpoint):
+    """Stores checkpoint atomically (written to a temporary file, which then replaces the old checkpoint)"""
+    with open(filename + '.tmp', mode='w') as file:
+        json.dump(checkpoint, file)
+    os.replace(filename + '.tmp', filename)
+
+def scoreFile(inputFile, outputFile, modelDir='.', cityFile='nrwCityCoordinates.csv', chunkSize=50000,
+              workers=1, confidence=None, resume=False, checkpointFile=None):
+    """Scores inputFile into outputFile (see module-docstring) and returns number of scored rows"""
+    confidence = parseConfidence(confidence)
+    checkpointFile = checkpointFile or outputFile.rstrip('/\\') + '.checkpoint.json'
+    modelVersion = contentHash(estimator.modelFiles(modelDir))
+    loadResources(modelDir, cityFile)
+
+    checkpoint = {'input': os.path.abspath(inputFile), 'model_version': modelVersion, 'confidence': confidence,
+                  'rows': 0, 'chunks': 0, 'position': None}
+    stored = readCheckpoint(checkpointFile) if resume else None
+    if stored is not None:
+        for key in ['input', 'model_version', 'confidence']:
+            if stored[key] != checkpoint[key]:
+                sys.exit("Checkpoint " + checkpointFile + " does not match (" + key + " has changed), "
+                         + "restart without --resume")
+        checkpoint = stored
+        print("Resuming after", checkpoint['rows'], "rows")
+
+    writer = OutputWriter(outputFile, checkpoint['position'])
+    start, startRows = time.perf_counter(), checkpoint['rows']
+
+    def writeChunk(scored):
+        writer.write(scored)
+        checkpoint.update(rows=checkpoint['rows'] + len(scored), chunks=checkpoint['chunks'] + 1,
+                          position=writer.position())
+        writeCheckpoint(checkpointFile, checkpoint)
+        print("Scored {} rows ({:.0f} rows/s)".format(checkpoint['rows'],
+                                                      (checkpoint['rows'] - startRows) / (time.perf_counter() - start)))
+
+    chunks = readChunks(inputFile, chunkSize, checkpoint['rows'])
+    try:
+        if workers <= 1:
+            for chunk in chunks:
+                writeChunk(scoreChunk(chunk, confidence))
+        else:
+            # Forked workers inherit the loaded resources, otherwise each worker loads them in loadResources()
+            context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+            with ProcessPoolExecutor(workers, mp_context=context, initializer=loadResources,
+                                     initargs=(modelDir, cityFile)) as pool:
+                pending = deque()
+                for chunk in chunks:
+                    pending.append(pool.submit(scoreChunk, chunk, confidence))
+                    # Bounded number of chunks in flight keeps memory flat
+                    if len(pending) >= 2 * workers:
+                        writeChunk(pending.popleft().result())
+                while pending:
+                    writeChunk(pending.popleft().result())
+        if checkpoint['chunks'] == 0:
+            # Input without rows: the output gets at least the columns (header of the CSV-file)
+            writeChunk(scoreChunk(emptyChunk(inputFile), confidence))
+    finally:
+        writer.close()
+    if os.path.exists(checkpointFile):
+        os.remove(checkpointFile)
+    return checkpoint['rows']
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Score CSV- or Parquet-files of apartment-configurations in chunks")
+    parser.add_argument('input', help="CSV- or Parquet-file with the columns of the formular")
+    parser.add_argument('output', help="CSV-file or Parquet-directory (ending with '.parquet') for the scored rows")
+    parser.add_argument('--model-dir', default=estimator.MODEL_DIR, help="directory of the model-files")
+    parser.add_argument('--city-file', default=estimator.CITY_FILE, help="file of the city-coordinates")
+    parser.add_argument('--chunk-size', type=int, default=50000, help="rows per chunk")
+    parser.add_argument('--workers', type=int, default=1, help="processes scoring chunks in parallel")
+    parser.add_argument('--confidence', default=None, help="confidence-level of the bounds (default 90%%)")
+    parser.add_argument('--resume', action='store_true', help="continue after the last chunk of the checkpoint")
+    parser.add_argument('--checkpoint', default=None, help="checkpoint-file (default: <output>.checkpoint.json)")
+    args = parser.parse_args()
+    try:
+        rows = scoreFile(args.input, args.output, args.model_dir, args.city_file, args.chunk_size,
+                         args.workers, args.confidence, args.resume, args.checkpoint)
+    except ConfigurationError as error:
+        sys.exit(str(error))
+    print("Finished:", rows, "rows written to", args.output)
@@ -0,0 +1,125 @@
+"""
+Index of the city-coordinates from 'nrwCityCoordinates.csv' for app.py.
+The index is built once when the file is loaded and maps normalized citynames to the
+central-coordinates of the city, so a cityname is resolved by a single dictionary-lookup.
+Lookups are case-insensitive and tolerant regarding umlauts ('Düsseldorf', 'Duesseldorf'
+and 'dusseldorf' are all found) as well as hyphens and whitespaces.
+Coordinates are resolved to the nearest city (reverse geocoding) with a KD-tree over the
+central-coordinates as unit-vectors on the sphere, so the euclidean nearest neighbour is also
+the nearest city by great-circle distance. The tree is built on the first lookup and a whole
+batch of coordinates is resolved by a single vectorized query.
+
+@author: Michael Volk
+"""
+
+import csv
+import math
+import unicodedata
+
+import numpy as np
+
+
+# Transliteration of german umlauts and sharp s
+umlauts = str.maketrans({'ä': 'ae', 'ö': 'oe', 'ü': 'ue', 'ß': 'ss'})
+# Mean radius of the earth in km
+EARTH_RADIUS_KM = 6371.0
+
+
+def stripAccents(text):
+    """Returns given text without diacritics (e.g. 'ü' => 'u')"""
+    return ''.join(char for char in unicodedata.normalize('NFKD', text) if not unicodedata.combining(char))
+
+def normalizeCityname(cityname):
+    """Returns the normalized forms of given cityname used as keys of the CityIndex:
+    lowercase with single spaces instead of hyphens/whitespaces, once with transliterated
+    umlauts ('ü' => 'ue') and once without diacritics ('ü' => 'u')"""
+    name = ' '.join(unicodedata.normalize('NFC', cityname).casefold().replace('-', ' ').split())
+    return stripAccents(name.translate(umlauts)), stripAccents(name)
+
+def unitVectors(latitudes, longitudes):
+    """Returns matrix with the 3D-unit-vectors (one row per coordinate) of given latitudes and longitudes (in degrees)"""
+    latitudes = np.radians(np.asarray(latitudes, dtype=np.float64))
+    longitudes = np.radians(np.asarray(longitudes, dtype=np.float64))
+    return np.column_stack([np.cos(latitudes) * np.cos(longitudes), np.cos(latitudes) * np.sin(longitudes),
+                            np.sin(latitudes)])
+
+
+class CityIndex:
+    """
+    Citynames with central-coordinates of the city. names and coordinates keep the order of
+    the file, the dictionary _positions maps each normalized form of a cityname to its position
+    and _tree is the KD-tree for resolving coordinates to the nearest city (built on first use).
+    """
+
+    def __init__(self, names, latitudes, longitudes):
+        self.names = list(names)
+        self.coordinates = list(zip(map(float, latitudes), map(float, longitudes)))
+        self._positions = {}
+        for position, name in enumerate(self.names):
+            for key in (name,) + normalizeCityname(name):
+                # For (unlikely) collisions of the normalized forms the first city is kept
+                self._positions.setdefault(key, position)
+        self._tree = None
+
+    @classmethod
+    def fromCsv(cls, filename):
+        """Returns CityIndex of given csv-file with columns 'City', 'Latitude' and 'Longitude'"""
+        with open(filename, mode='r', encoding='utf-8', newline='') as file:
+            rows = list(csv.DictReader(file))
+        return cls([row['City'] for row in rows], [row['Latitude'] for row in rows], [row['Longitude'] for row in rows])
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, cityname):
+        return self.position(cityname) is not None
+
+    def position(self, cityname):
+        """Returns position of given cityname in the index or None if the city is unknown"""
+        position = self._positions.get(cityname)
+        if position is None:
+            for key in normalizeCityname(cityname):
+                position = self._positions.get(key)
+                if position is not None:
+                    break
+        return position
+
+    def lookup(self, cityname):
+        """Returns (Latitude, Longitude) of given cityname, raises KeyError for an unknown city"""
+        position = self.position(cityname)
+        if position is None:
+            raise KeyError(cityname)
+        return self.coordinates[position]
+
+    def cityname(self, cityname):
+        """Returns the cityname as written in the index for given (not normalized) cityname"""
+        position = self.position(cityname)
+        if position is None:
+            raise KeyError(cityname)
+        return self.names[position]
+
+    def _spatialIndex(self):
+        """Returns KD-tree over the unit-vectors of the central-coordinates of the cities"""
+        if self._tree is None:
+            from scipy.spatial import cKDTree
+            latitudes, longitudes = zip(*self.coordinates) if self.coordinates else ((), ())
+            self._tree = cKDTree(unitVectors(latitudes, longitudes))
+        return self._tree
+
+    def nearestMany(self, latitudes, longitudes):
+        """Returns arrays with the positions of the nearest cities and the great-circle distances to them (in km)
+        for given arrays of latitudes and longitudes"""
+        if not self.names:
+            raise KeyError("No cities in the index")
+        chords, positions = self._spatialIndex().query(unitVectors(latitudes, longitudes))
+        return positions, 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(chords / 2, 1.0))
+
+    def nearest(self, latitude, longitude):
+        """Returns (cityname, distance in km) of the city nearest to given coordinates"""
+        if not self.names:
+            raise KeyError("No cities in the index")
+        # Single coordinate converted without numpy-arrays, since their overhead dominates a single query
+        latitude, longitude = math.radians(latitude), math.radians(longitude)
+        chord, position = self._spatialIndex().query((math.cos(latitude) * math.cos(longitude),
+                                                      math.cos(latitude) * math.sin(longitude), math.sin(latitude)))
+        return self.names[position], 2 * EARTH_RADIUS_KM * math.asin(min(chord / 2, 1.0))
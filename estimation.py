@@ -0,0 +1,306 @@
+"""
+Shared estimation-logic of app.py: converts apartment-configurations (formular-data of the
+HTML-formular or JSON-objects of the API) into model-features and performs the buy & rent
+price estimation for a whole batch of configurations with a single model.predict()-call per model.
+
+@author: Michael Volk
+"""
+
+import math
+import time
+
+import numpy as np
+
+from metrics import missing_columns_total, model_seconds, timed
+
+
+# Dictionary which maps numerical model-features to numerical formular-data-element-names
+map_num = {'Area': 'Area',
+           'Rooms': 'Rooms',
+           'ConstructionYear': 'Construction_Year'
+          }
+# Dictionary which maps categorical model-features to categorical formular-data-element-names
+map_cat = { 'EQ_CAT_floorApartment': ('Category', 'Floor-Apartment'),
+            'EQ_CAT_apartment': ('Category', 'Apartment'),
+            'EQ_CAT_maisonette': ('Category', 'Maisonette'),
+            'EQ_CAT_penthouse': ('Category', 'Penthouse'),
+            'EQ_CAT_terraceApartment': ('Category', 'Terrace-Apartment'),
+            'EQ_CAT_loft': ('Category', 'Loft'),
+            'EQ_CON_firstOccupancy': ('First Occupancy', '1'),
+            'EQ_CON_upscale': ('Upscale', '1'),
+            'EQ_CON_maintained': ('Maintained', '1'),
+            'EQ_CON_renovated': ('Renovated', '1'),
+            'EQ_CON_refurbished': ('Refurbished', '1'),
+            'EQ_OUT_balcony': ('Balcony', '1'),
+            'EQ_OUT_garden': ('Garden', '1'),
+            'EQ_OUT_loggia': ('Loggia', '1'),
+            'EQ_OUT_terrace': ('Terrace', '1'),
+    }
+# Values of a formular-data-element which count as checked or unchecked checkbox (besides numbers, see flagValue())
+checked_values = {'1', 'true', 'on', 'yes'}
+unchecked_values = {'', '0', 'false', 'off', 'no'}
+# Canonical order of the model-features derived from an apartment-configuration
+features = list(map_num) + list(map_cat) + ['Latitude', 'Longitude']
+# Model-feature for each value of formular-data-element 'Category' and (element, model-feature) of each checkbox
+category_features = {value: key for key, (element, value) in map_cat.items() if element == 'Category'}
+checkbox_features = [(element, key) for key, (element, value) in map_cat.items() if element != 'Category']
+# Confidence-levels selectable in the formular, whose bounds are precomputed when loading a model
+confidence_levels = (0.8, 0.9, 0.95)
+default_confidence = 0.9
+
+
+class ConfigurationError(ValueError):
+    """Raised for an apartment-configuration, which can not be converted into model-features"""
+
+
+class ErrorDistribution:
+    """
+    Relative (not absolute) errors of the model-test-validation as sorted array.
+    Created once when the model-configuration is loaded. Quantiles are then looked up by index
+    (with the same linear interpolation as pandas.Series.quantile) instead of sorting the
+    test-errors again for every request. The divisors of the confidence_levels are precomputed.
+    Already sorted test-errors without NaN (e.g. memory-mapped from a model-artifact) are used as they are.
+    """
+
+    def __init__(self, test_errors_notAbsolute, isSorted=False):
+        errors = np.asarray(test_errors_notAbsolute, dtype=np.float64)
+        self.sorted_errors = errors if isSorted else np.sort(errors[~np.isnan(errors)])
+        self.divisors = {confidence: self._divisors(confidence) for confidence in confidence_levels}
+
+    def quantile(self, q):
+        """Returns q-quantile of the test-errors"""
+        position = q * (len(self.sorted_errors) - 1)
+        lower = int(np.floor(position))
+        upper = min(lower + 1, len(self.sorted_errors) - 1)
+        fraction = position - lower
+        return self.sorted_errors[lower] + (self.sorted_errors[upper] - self.sorted_errors[lower]) * fraction
+
+    def _divisors(self, confidence):
+        """Returns divisors of the predicted value for the lower and upper bound of the confidence-intervall"""
+        alpha = (1 - confidence) / 2
+        return np.exp(self.quantile(1 - alpha)), np.exp(self.quantile(alpha))
+
+    def bounds(self, y_predicted, confidence=default_confidence):
+        """Returns lower and upper bound of the confidence-intervall for given predicted value(s)"""
+        divisors = self.divisors.get(confidence)
+        if divisors is None:
+            divisors = self._divisors(confidence)
+        return y_predicted / divisors[0], y_predicted / divisors[1]
+
+
+def parseConfidence(value):
+    """Returns confidence-level given as fraction ('0.9') or percentage ('90' or '90%')
+    as fraction, default_confidence if value is empty"""
+    value = str(value).strip().rstrip('%') if value is not None else ''
+    if not value:
+        return default_confidence
+    try:
+        confidence = float(value)
+    except ValueError:
+        raise ConfigurationError("Confidence-level has to be a number") from None
+    if confidence >= 1:
+        confidence /= 100
+    if not 0 < confidence < 1:
+        raise ConfigurationError("Confidence-level has to be between 0% and 100%")
+    return round(confidence, 4)
+
+def formValue(configuration, key):
+    """Returns value of given key in configuration as stripped string ('' if missing).
+    Allows the values of JSON-configurations to be numbers or booleans instead of strings"""
+    value = configuration.get(key)
+    if value is None or value is False:
+        return ''
+    if value is True:
+        return '1'
+    return str(value).strip()
+
+def numberValue(configuration, key):
+    """Returns value of given key in configuration as finite number,
+    raises ConfigurationError if it is missing, not a number, infinite or NaN"""
+    try:
+        value = float(formValue(configuration, key))
+    except ValueError:
+        raise ConfigurationError(key + " has to be a number") from None
+    if not math.isfinite(value):
+        raise ConfigurationError(key + " has to be a finite number")
+    return value
+
+def flagValue(configuration, key):
+    """Returns 1 if the checkbox of given key in configuration is checked ('1', 'true', 'on', 'yes' or any
+    nonzero number, e.g. '1.0' of a float-column), 0 if it is unchecked or missing,
+    raises ConfigurationError for any other value"""
+    value = formValue(configuration, key).lower()
+    if value in checked_values:
+        return 1
+    if value in unchecked_values:
+        return 0
+    try:
+        number = float(value)
+    except ValueError:
+        number = math.nan
+    if not math.isfinite(number):
+        raise ConfigurationError(key + " has to be checked ('1', 'true', 'on', 'yes') or unchecked ('0', 'false', 'off', 'no')")
+    return 1 if number != 0 else 0
+
+def locationOfConfiguration(configuration, cityIndex):
+    """Returns (Latitude, Longitude) of given configuration depending on which input-option
+    has been choosen (via Cityname vs. via Coordinates). The cityname is resolved with given
+    cityIndex (see cityIndex.py). Without 'chooseLocation' (e.g. JSON-configurations)
+    the cityname is used if given, otherwise the coordinates"""
+    chooseLocation = formValue(configuration, 'chooseLocation')
+    if not chooseLocation:
+        chooseLocation = 'cityname' if formValue(configuration, 'Cityname') else 'coordinates'
+    if chooseLocation == 'cityname':
+        cityname = formValue(configuration, 'Cityname')
+        try:
+            return cityIndex.lookup(cityname)
+        except KeyError:
+            raise ConfigurationError("Unknown Cityname: '" + cityname + "'") from None
+    try:
+        latitude, longitude = float(formValue(configuration, 'Latitude')), float(formValue(configuration, 'Longitude'))
+    except ValueError:
+        raise ConfigurationError("Latitude and Longitude have to be numbers") from None
+    # Non-finite coordinates can neither be predicted nor resolved to the nearest city
+    if not (math.isfinite(latitude) and math.isfinite(longitude)):
+        raise ConfigurationError("Latitude and Longitude have to be finite numbers")
+    return latitude, longitude
+
+def configurationToFeatures(configuration, cityIndex):
+    """Returns dictionary with model-features (keys from map_num & map_cat, 'Latitude', 'Longitude'
+    in the canonical order of features) and values from given configuration"""
+    x_dict = dict.fromkeys(features, 0)
+    for key, element in map_num.items():
+        x_dict[key] = numberValue(configuration, element)
+    # Prices per Area are derived from the estimates, the limits of the formular are only checked by the browser
+    if not x_dict['Area'] > 0:
+        raise ConfigurationError("Area has to be positive")
+    category = category_features.get(formValue(configuration, 'Category'))
+    if category is not None:
+        x_dict[category] = 1
+    for element, key in checkbox_features:
+        x_dict[key] = flagValue(configuration, element)
+    x_dict['Latitude'], x_dict['Longitude'] = locationOfConfiguration(configuration, cityIndex)
+    return x_dict
+
+def featureRows(x_dicts):
+    """Returns matrix with the values of given x_dicts (one row per x_dict, one column per element of features)"""
+    return np.array([tuple(x_dict.values()) for x_dict in x_dicts], dtype=np.float64).reshape(len(x_dicts), len(features))
+
+
+class FeatureEncoder:
+    """
+    Mapping of the canonical features to the columns_used of a model, compiled once when the
+    model-configuration is loaded. encode() fills the feature-matrix of the model with a single
+    vectorized assignment instead of looking up every column for every configuration.
+    Columns of the model, which can not be derived from the formular-data, stay 0.
+    A pandas.DataFrame (with a prebuilt column-index) is only created as model-input, if the model has
+    been fitted with column-names (and therefore checks them), otherwise the plain matrix is passed
+    (and pandas is not imported at all).
+    """
+
+    def __init__(self, columns_used, model=None):
+        self.columns_used = list(columns_used)
+        positions = {feature: i for i, feature in enumerate(features)}
+        self.targetIndices = np.array([j for j, col in enumerate(self.columns_used) if col in positions], dtype=np.intp)
+        self.sourceIndices = np.array([positions[col] for col in self.columns_used if col in positions], dtype=np.intp)
+        self.missingColumns = [col for col in self.columns_used if col not in positions]
+        self.needsColumnNames = hasattr(model, 'feature_names_in_')
+        if self.needsColumnNames:
+            # pandas is imported only here (not when the app is imported), since only these models need it.
+            # Column-index created once, since creating it from the list is the main cost of a small DataFrame
+            import pandas as pd
+            self.columns = pd.Index(self.columns_used)
+            self.DataFrame = pd.DataFrame
+        for col in self.missingColumns:
+            print("WARNING: ", col, " not found in formular-data => value will be set to 0")
+
+    def encode(self, rows):
+        """Returns feature-matrix of the model (one column per element of columns_used)
+        for given matrix of canonical feature-rows (see featureRows())"""
+        x = np.zeros((rows.shape[0], len(self.columns_used)), dtype=np.float64)
+        x[:, self.targetIndices] = rows[:, self.sourceIndices]
+        for col in self.missingColumns:
+            missing_columns_total.inc(rows.shape[0], column=col)
+        return x
+
+    def modelInput(self, rows):
+        """Returns input for model.predict() for given matrix of canonical feature-rows"""
+        x = self.encode(rows)
+        if self.needsColumnNames:
+            return self.DataFrame(x, columns=self.columns, copy=False)
+        return x
+
+
+def modelInputs(x_dicts, modelConfigs):
+    """Returns the input for model.predict() of buy and rent ('_buy', '_rent') for given x_dicts"""
+    with timed('feature_encoding'):
+        rows = featureRows(x_dicts)
+        return {cat: modelConfigs['encoder' + cat].modelInput(rows) for cat in ['_buy', '_rent']}
+
+def predictModel(x_in, modelConfigs, cat):
+    """Returns array of predicted values of the model of given cat ('_buy' or '_rent') for given model-input"""
+    # Make prediction with model for given input-data and retransform it using np.exp()
+    start = time.perf_counter()
+    with timed('model_predict'):
+        predicted = np.exp(modelConfigs['model' + cat].predict(x_in))
+    # Duration per model-variant (see modelVariants.py), for comparing the inference-cost of the variants
+    model_seconds.observe(time.perf_counter() - start, variant=modelConfigs.get('variant', ''), model=cat[1:])
+    return predicted
+
+def predictPrices(x_dicts, modelConfigs):
+    """Returns dictionary with arrays of predicted values ('y_predicted'+cat) for buy and rent
+    for all given x_dicts, using a single model.predict()-call per model"""
+    x_in = modelInputs(x_dicts, modelConfigs)
+    return {'y_predicted' + cat: predictModel(x_in[cat], modelConfigs, cat) for cat in ['_buy', '_rent']}
+
+def cacheLookup(x_dicts, cache, version):
+    """Returns keys and cached values (or None) of given x_dicts in given cache (see predictionCache.py)
+    and dictionary mapping each missing key to the position of its first occurrence in x_dicts"""
+    with timed('cache_lookup'):
+        keys = [cache.key(x_dict, version) for x_dict in x_dicts]
+        cached = cache.getMany(keys)
+    missing = {}
+    for i, (key, value) in enumerate(zip(keys, cached)):
+        if value is None:
+            missing.setdefault(key, i)
+    return keys, cached, missing
+
+def cacheFill(keys, cached, missing, predicted, cache):
+    """Adds the predicted values of the missing keys (see cacheLookup()) to the cache and returns
+    dictionary with arrays of predicted values ('y_predicted'+cat) for all keys"""
+    if missing:
+        values = dict(zip(missing, zip(predicted['y_predicted_buy'].tolist(), predicted['y_predicted_rent'].tolist())))
+        cache.setMany(values.items())
+        cached = [values[key] if value is None else value for key, value in zip(keys, cached)]
+    values = np.array(cached, dtype=np.float64).reshape(len(keys), 2)
+    return {'y_predicted_buy': values[:, 0], 'y_predicted_rent': values[:, 1]}
+
+def predictPricesCached(x_dicts, modelConfigs, cache, version):
+    """Returns the same as predictPrices(), but takes the predicted values of configurations
+    already contained in given cache (see predictionCache.py) from there and predicts (once)
+    only the missing configurations, which are then added to the cache"""
+    keys, cached, missing = cacheLookup(x_dicts, cache, version)
+    predicted = predictPrices([x_dicts[i] for i in missing.values()], modelConfigs) if missing else None
+    return cacheFill(keys, cached, missing, predicted, cache)
+
+def addBounds(results, modelConfigs, confidence=default_confidence):
+    """Adds bounds of the confidence-intervall ('y_lowerBound'+cat, 'y_upperBound'+cat) for the
+    predicted values of results and returns results"""
+    with timed('confidence_bounds'):
+        for cat in ['_buy', '_rent']:
+            # Calculate confidence-intervall of predicted values with the precomputed quantiles of the test-errors
+            results['y_lowerBound' + cat], results['y_upperBound' + cat] = (
+                modelConfigs['error_distribution' + cat].bounds(results['y_predicted' + cat], confidence)
+                )
+    return results
+
+def estimatePrices(x_dicts, modelConfigs, confidence=default_confidence, cache=None, version=''):
+    """Returns dictionary with arrays of predicted values ('y_predicted'+cat) and bounds of the
+    confidence-intervall ('y_lowerBound'+cat, 'y_upperBound'+cat) for buy and rent
+    for all given x_dicts, using a single model.predict()-call per model.
+    If a cache is given, the predicted values are cached under given version of the model-configuration"""
+    if cache is None:
+        results = predictPrices(x_dicts, modelConfigs)
+    else:
+        results = predictPricesCached(x_dicts, modelConfigs, cache, version)
+    return addBounds(results, modelConfigs, confidence)
@@ -0,0 +1,66 @@
+"""
+Configuration for gunicorn, which is automatically read when the app is started via
+'gunicorn app:app' (see Procfile).
+The app is preloaded in the gunicorn master, which runs the startup-phase (loading the
+model-configurations and city-coordinates and a warm-up prediction, see app.preload())
+once before the workers are forked. So the workers start warm and ready (see /readyz) with the
+loaded models and share their memory-pages copy-on-write instead of each unpickling
+its own copy on the first request.
+With the environment-variable METRICS_DIR the workers share their metrics through that
+directory (see metrics.py), so each scrape of '/metrics' returns the metrics of all workers.
+With RELOAD_BY_MASTER changed models are reloaded only in the master, which then recycles the
+workers (like 'kill -HUP'), so the new workers share the reloaded models copy-on-write as well
+instead of each worker reloading them into its own memory.
+
+@author: Michael Volk
+"""
+
+import os
+import signal
+import threading
+import time
+
+preload_app = True
+
+
+def when_ready(server):
+    """Called in the master after the app has been imported and before the workers are forked"""
+    import app
+    import metrics
+    metrics.clearShared()
+    app.preload()
+    # The metrics of the startup-phase are counted once in the file of the master
+    metrics.writeShared(withCollectors=False)
+    if app.RELOAD_BY_MASTER:
+        threading.Thread(target=reloadModels, args=(server,), name='reload-models', daemon=True).start()
+
+def reloadModels(server):
+    """Reloads changed models in the master and recycles the workers by SIGHUP (runs in a thread of the master)"""
+    import app
+    import metrics
+    while True:
+        time.sleep(max(app.RELOAD_CHECK_INTERVAL, 1))
+        if app.reloadInMaster():
+            metrics.writeShared(withCollectors=False)
+            server.log.info("Models reloaded, recycling the workers")
+            os.kill(os.getpid(), signal.SIGHUP)
+
+def post_worker_init(worker):
+    """Called in each worker after forking: runs the startup-phase, if the master has not run it
+    (e.g. with preload_app disabled), so that the worker becomes ready before serving requests"""
+    import app
+    import metrics
+    metrics.startSharing(reset=True)
+    if app.RELOAD_BY_MASTER:
+        app.disableReloads()
+    app.preload()
+
+def worker_exit(server, worker):
+    """Called in a worker before it exits: writes its final metrics"""
+    import metrics
+    metrics.writeShared(withCollectors=False)
+
+def child_exit(server, worker):
+    """Called in the master after a worker has exited"""
+    import metrics
+    metrics.markExited(worker.pid)
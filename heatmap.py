@@ -0,0 +1,176 @@
+"""
+Price heat-maps of app.py: buy & rent prices of a fixed apartment-profile on a regular grid over the
+bounding box of North Rhine-Westphalia (the latitude- and longitude-range of the formular).
+All grid-cells are predicted in one vectorized pass (single model.predict()-call per model) and the
+resulting grids are cached per profile, resolution and model-version. Grids can be returned as compact
+JSON, GeoJSON (one polygon per cell), raw float32-binary or PNG-tile (without additional dependencies).
+
+@author: Michael Volk
+"""
+
+import struct
+import zlib
+
+import numpy as np
+
+from estimation import ConfigurationError, configurationToFeatures, featureRows, features, predictModel
+from metrics import timed
+
+# Bounding box of North Rhine-Westphalia as used in the formular
+LATITUDE_RANGE = (50.56, 52.34)
+LONGITUDE_RANGE = (6.03, 9.37)
+# Default, finest and coarsest grid-resolution in degrees, maximal number of grid-cells
+DEFAULT_RESOLUTION = 0.05
+MIN_RESOLUTION = 0.005
+MAX_RESOLUTION = 1.0
+MAX_CELLS = 250000
+# Maximal number of grid-cells as GeoJSON (one polygon per cell is built in Python) and of pixels of a PNG-tile
+MAX_GEOJSON_CELLS = 10000
+MAX_PNG_PIXELS = 4000000
+# Elements of the formular, which define an apartment-profile
+PROFILE_ELEMENTS = ['Category', 'Area', 'Rooms', 'Construction_Year', 'First Occupancy', 'Upscale', 'Maintained',
+                    'Renovated', 'Refurbished', 'Balcony', 'Garden', 'Loggia', 'Terrace']
+# Values of the profile not given (checkboxes not given are unchecked)
+DEFAULT_PROFILE = {'Category': 'Apartment', 'Area': '100', 'Rooms': '4', 'Construction_Year': '2010'}
+# Profiles precomputed at startup: the default-configuration of the formular
+POPULAR_PROFILES = [dict(DEFAULT_PROFILE, Maintained='1', Balcony='1')]
+# Anchor-colors (RGB) of the color-scale of the PNG-tiles from low to high prices
+COLOR_SCALE = np.array([[68, 1, 84], [59, 82, 139], [33, 145, 140], [94, 201, 98], [253, 231, 37]], dtype=np.float64)
+
+
+class Grid:
+    """Cell-centers of a regular grid over the bounding box with given resolution (in degrees).
+    Rows run from north to south (like the rows of an image), columns from west to east."""
+
+    def __init__(self, resolution=DEFAULT_RESOLUTION):
+        self.resolution = resolution
+        self.rows = int(np.ceil(round((LATITUDE_RANGE[1] - LATITUDE_RANGE[0]) / resolution, 9)))
+        self.cols = int(np.ceil(round((LONGITUDE_RANGE[1] - LONGITUDE_RANGE[0]) / resolution, 9)))
+        self.latitudes = LATITUDE_RANGE[1] - (np.arange(self.rows) + 0.5) * resolution
+        self.longitudes = LONGITUDE_RANGE[0] + (np.arange(self.cols) + 0.5) * resolution
+
+    def bounds(self):
+        """Returns (south, north, west, east) of the grid"""
+        return (LATITUDE_RANGE[1] - self.rows * self.resolution, LATITUDE_RANGE[1],
+                LONGITUDE_RANGE[0], LONGITUDE_RANGE[0] + self.cols * self.resolution)
+
+
+def parseResolution(value):
+    """Returns grid-resolution in degrees of given string (default if empty),
+    raises ConfigurationError if it is too fine or the grid would have too many cells"""
+    if value is None or str(value).strip() == '':
+        return DEFAULT_RESOLUTION
+    try:
+        resolution = float(value)
+    except ValueError:
+        raise ConfigurationError("Resolution has to be a number (in degrees)") from None
+    if not MIN_RESOLUTION <= resolution <= MAX_RESOLUTION:
+        raise ConfigurationError("Resolution has to be between " + str(MIN_RESOLUTION) + " and "
+                                 + str(MAX_RESOLUTION) + " degrees")
+    grid = Grid(resolution)
+    if grid.rows * grid.cols > MAX_CELLS:
+        raise ConfigurationError("Too many grid-cells (maximum: " + str(MAX_CELLS) + ")")
+    return resolution
+
+def checkFormat(resolution, resultFormat, scale=1):
+    """Raises ConfigurationError if the grid with given resolution is too large for given format
+    (see MAX_GEOJSON_CELLS, MAX_PNG_PIXELS)"""
+    grid = Grid(resolution)
+    if resultFormat == 'geojson' and grid.rows * grid.cols > MAX_GEOJSON_CELLS:
+        raise ConfigurationError("Too many grid-cells for GeoJSON (maximum: " + str(MAX_GEOJSON_CELLS)
+                                 + "), choose a coarser resolution")
+    if resultFormat == 'png' and grid.rows * grid.cols * scale ** 2 > MAX_PNG_PIXELS:
+        raise ConfigurationError("Too many pixels for PNG (maximum: " + str(MAX_PNG_PIXELS)
+                                 + "), choose a coarser resolution or a smaller scale")
+
+def pricesBytes(prices):
+    """Returns number of bytes of the price-grids of a heat-map (weight of a cache-entry)"""
+    return sum(values.nbytes for values in prices.values())
+
+def profileFeatures(profile, cityIndex=None):
+    """Returns x_dict (see estimation.configurationToFeatures()) of given apartment-profile (location is set per cell)"""
+    configuration = dict(DEFAULT_PROFILE)
+    configuration.update((element, profile[element]) for element in PROFILE_ELEMENTS if element in profile)
+    configuration.update(chooseLocation='coordinates', Latitude=LATITUDE_RANGE[0], Longitude=LONGITUDE_RANGE[0])
+    return configurationToFeatures(configuration, cityIndex)
+
+def predictGrid(x_dict, grid, modelConfigs):
+    """Returns dictionary with the predicted buy & rent prices ('buy', 'rent') of the profile x_dict for
+    all cells of the grid as matrices of shape (rows, cols), predicted with one model.predict() per model"""
+    with timed('feature_encoding'):
+        rows = np.repeat(featureRows([x_dict]), grid.rows * grid.cols, axis=0)
+        latitudes, longitudes = np.meshgrid(grid.latitudes, grid.longitudes, indexing='ij')
+        rows[:, features.index('Latitude')] = latitudes.ravel()
+        rows[:, features.index('Longitude')] = longitudes.ravel()
+        x_in = {cat: modelConfigs['encoder' + cat].modelInput(rows) for cat in ['_buy', '_rent']}
+    return {cat[1:]: predictModel(x_in[cat], modelConfigs, cat).reshape(grid.rows, grid.cols)
+            for cat in ['_buy', '_rent']}
+
+def cacheKey(x_dict, resolution, version):
+    """Returns key of the heat-map of profile x_dict with given resolution for the given model-version"""
+    return (version, resolution) + tuple(value for feature, value in x_dict.items()
+                                         if feature not in ('Latitude', 'Longitude'))
+
+def heatmap(profile, resolution, snapshot, cache=None):
+    """Returns (grid, prices) of given profile and resolution predicted with the model-configuration of
+    given Snapshot, taken from the cache (see predictionCache.LocalCache) if already computed"""
+    grid = Grid(resolution)
+    x_dict = profileFeatures(profile)
+    key = cacheKey(x_dict, resolution, snapshot.version)
+    prices = cache.getMany([key])[0] if cache is not None else None
+    if prices is None:
+        prices = predictGrid(x_dict, grid, snapshot.value)
+        if cache is not None:
+            cache.setMany([(key, prices)])
+    return grid, prices
+
+def precomputeHeatmaps(snapshot, cache, profiles=POPULAR_PROFILES, resolution=DEFAULT_RESOLUTION):
+    """Computes the heat-maps of the popular profiles into the cache (e.g. at startup)"""
+    for profile in profiles:
+        heatmap(profile, resolution, snapshot, cache)
+
+
+def toJson(grid, prices):
+    """Returns heat-map as compact JSON-serializable dictionary (prices rounded, rows from north to south)"""
+    south, north, west, east = grid.bounds()
+    return {'bounds': {'south': south, 'north': north, 'west': west, 'east': east},
+            'resolution': grid.resolution, 'rows': grid.rows, 'cols': grid.cols,
+            'buy': np.round(prices['buy']).astype(int).tolist(),
+            'rent': np.round(prices['rent'], 1).tolist()}
+
+def toGeoJson(grid, prices):
+    """Returns heat-map as GeoJSON-FeatureCollection with one polygon per grid-cell"""
+    half = grid.resolution / 2
+    cells = []
+    for i, latitude in enumerate(grid.latitudes.tolist()):
+        for j, longitude in enumerate(grid.longitudes.tolist()):
+            ring = [[longitude - half, latitude - half], [longitude + half, latitude - half],
+                    [longitude + half, latitude + half], [longitude - half, latitude + half],
+                    [longitude - half, latitude - half]]
+            cells.append({'type': 'Feature',
+                          'geometry': {'type': 'Polygon', 'coordinates': [ring]},
+                          'properties': {'buy': round(float(prices['buy'][i, j])),
+                                         'rent': round(float(prices['rent'][i, j]), 1)}})
+    return {'type': 'FeatureCollection', 'features': cells}
+
+def toBinary(values):
+    """Returns matrix as raw little-endian float32-bytes (row-major, rows from north to south)"""
+    return np.ascontiguousarray(values, dtype='<f4').tobytes()
+
+def toPng(values, scale=1):
+    """Returns matrix as PNG-image (RGB, one pixel per cell enlarged by scale) colored from low to high values"""
+    low, high = float(np.nanmin(values)), float(np.nanmax(values))
+    normalized = (values - low) / (high - low) if high > low else np.zeros_like(values)
+    position = normalized * (len(COLOR_SCALE) - 1)
+    lower = np.clip(np.floor(position).astype(int), 0, len(COLOR_SCALE) - 2)
+    fraction = (position - lower)[..., None]
+    rgb = np.round(COLOR_SCALE[lower] * (1 - fraction) + COLOR_SCALE[lower + 1] * fraction).astype(np.uint8)
+    rgb = np.repeat(np.repeat(rgb, scale, axis=0), scale, axis=1)
+    height, width = rgb.shape[:2]
+    # Each scanline starts with filter-type 0 (None)
+    raw = np.concatenate([np.zeros((height, 1), dtype=np.uint8), rgb.reshape(height, width * 3)], axis=1).tobytes()
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(raw, 9)) + chunk(b'IEND', b''))
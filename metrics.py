@@ -0,0 +1,309 @@
+"""
+Metrics of app.py in the text-format of Prometheus, served by the endpoint '/metrics'.
+Contains histograms for the duration of each stage of a request (loading of city-coordinates
+and models, feature-assembly, model.predict(), calculation of the confidence-bounds, rendering
+of the HTML-page), the duration of the requests per endpoint and counters (e.g. model-loads and
+model-columns missing in the formular-data). Values computed at scrape-time (e.g. the counters
+of the prediction-cache) are added by registering a collector-function.
+The metrics are held per process. With several gunicorn-workers the environment-variable
+METRICS_DIR names a directory shared by the workers: each worker writes its values into its own
+file every METRICS_FLUSH_INTERVAL seconds (and before each scrape and its exit), and '/metrics'
+merges the files of all workers. Counters and histograms are summed over the workers (also of
+exited ones, so they never decrease), the values of the collectors (e.g. the queue-depth) are
+per worker and returned with the label 'worker' (the process-id) for the running workers only.
+
+@author: Michael Volk
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+
+# Upper bounds (in seconds) of the buckets of the duration-histograms
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Directory shared by the gunicorn-workers to merge their metrics (None: metrics of the answering process only)
+SHARED_DIRECTORY = os.environ.get('METRICS_DIR') or None
+# Seconds between the writes of the metrics of a worker into the shared directory
+FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', '5'))
+
+
+def formatLabels(labelNames, labelValues, extra=()):
+    """Returns labels in the Prometheus-format, e.g. '{stage="model_predict"}'"""
+    pairs = list(zip(labelNames, labelValues)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                          for name, value in pairs) + '}'
+
+def addLabel(line, name, value):
+    """Returns sample-line in the Prometheus-format with given additional label"""
+    sample, _, number = line.rpartition(' ')
+    label = formatLabels((name,), (value,))
+    if sample.endswith('}'):
+        sample = sample[:-1] + ',' + label[1:]
+    else:
+        sample += label
+    return sample + ' ' + number
+
+
+class Counter:
+    """Monotonically increasing counter per combination of label-values"""
+
+    def __init__(self, name, documentation, labelNames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelNames = tuple(labelNames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelNames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.get(name, '') for name in self.labelNames), 0)
+
+    def snapshot(self):
+        """Returns the values as list of [label-values, value] (to be written as JSON)"""
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    @staticmethod
+    def merge(total, value):
+        return value if total is None else total + value
+
+    def clear(self):
+        with self._lock:
+            self._values = {}
+
+    def render(self, values=None):
+        """Returns lines of the values of this process (or of given values, e.g. merged over all workers)"""
+        values = self._values if values is None else values
+        lines = ['# HELP {} {}'.format(self.name, self.documentation), '# TYPE {} counter'.format(self.name)]
+        for key, value in sorted(values.items()):
+            lines.append('{}{} {}'.format(self.name, formatLabels(self.labelNames, key), value))
+        return lines
+
+
+class Histogram:
+    """Histogram with cumulative buckets, sum and count per combination of label-values"""
+
+    def __init__(self, name, documentation, labelNames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelNames = tuple(labelNames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelNames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # Counts per bucket (last one is '+Inf'), sum of observed values
+                counts = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            counts[0][index] += 1
+            counts[1] += value
+
+    def observeMany(self, values, **labels):
+        """Observes all values of given array at once (bucketed with numpy instead of one bisect per value)"""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        key = tuple(labels.get(name, '') for name in self.labelNames)
+        bucketCounts = np.bincount(np.searchsorted(self.buckets, values, side='left'), minlength=len(self.buckets) + 1)
+        total = float(values.sum())
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            counts[0] = [count + int(added) for count, added in zip(counts[0], bucketCounts)]
+            counts[1] += total
+
+    def count(self, **labels):
+        counts = self._values.get(tuple(labels.get(name, '') for name in self.labelNames))
+        return sum(counts[0]) if counts else 0
+
+    def snapshot(self):
+        """Returns the values as list of [label-values, [bucket-counts, sum]] (to be written as JSON)"""
+        with self._lock:
+            return [[list(key), [list(counts), total]] for key, (counts, total) in self._values.items()]
+
+    @staticmethod
+    def merge(total, value):
+        if total is None:
+            return value
+        return [[count + added for count, added in zip(total[0], value[0])], total[1] + value[1]]
+
+    def clear(self):
+        with self._lock:
+            self._values = {}
+
+    def render(self, values=None):
+        """Returns lines of the values of this process (or of given values, e.g. merged over all workers)"""
+        values = self._values if values is None else values
+        lines = ['# HELP {} {}'.format(self.name, self.documentation), '# TYPE {} histogram'.format(self.name)]
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append('{}_bucket{} {}'.format(self.name, formatLabels(self.labelNames, key, [('le', le)]), cumulative))
+            lines.append('{}_sum{} {}'.format(self.name, formatLabels(self.labelNames, key), total))
+            lines.append('{}_count{} {}'.format(self.name, formatLabels(self.labelNames, key), cumulative))
+        return lines
+
+
+stage_seconds = Histogram('estimator_stage_seconds', 'Duration of the stages of a request in seconds', ['stage'])
+request_seconds = Histogram('estimator_request_seconds', 'Duration of requests in seconds', ['endpoint', 'method'])
+model_seconds = Histogram('estimator_model_predict_seconds', 'Duration of model.predict() per model-variant and model',
+                          ['variant', 'model'])
+loads_total = Counter('estimator_resource_loads_total', 'Number of (re-)loads of models and city-coordinates', ['resource'])
+missing_columns_total = Counter('estimator_missing_columns_total',
+                                'Number of model-columns set to 0, since they are missing in the formular-data', ['column'])
+metrics = [stage_seconds, request_seconds, model_seconds, loads_total, missing_columns_total]
+# Functions returning additional lines at scrape-time
+collectors = []
+
+
+@contextmanager
+def timed(stage):
+    """Context-manager observing the duration of the enclosed block as given stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds.observe(time.perf_counter() - start, stage=stage)
+
+def gauge(name, documentation, value, kind='gauge'):
+    """Returns lines of a single value in the Prometheus-format (for collectors)"""
+    return ['# HELP {} {}'.format(name, documentation), '# TYPE {} {}'.format(name, kind), '{} {}'.format(name, value)]
+
+def collect():
+    """Returns lines of all collectors"""
+    lines = []
+    for collector in collectors:
+        lines += collector()
+    return lines
+
+def render():
+    """Returns all metrics in the text-format of Prometheus (merged over all workers with SHARED_DIRECTORY)"""
+    lines = []
+    if SHARED_DIRECTORY is None:
+        for metric in metrics:
+            lines += metric.render()
+        lines += collect()
+    else:
+        startSharing()
+        writeShared()
+        processes = readShared()
+        for metric in metrics:
+            merged = {}
+            for process in processes:
+                for key, value in process['metrics'].get(metric.name, []):
+                    merged[tuple(key)] = metric.merge(merged.get(tuple(key)), value)
+            lines += metric.render(merged)
+        lines += workerLines(processes)
+    return '\n'.join(lines) + '\n'
+
+
+def sharedFile(pid):
+    return os.path.join(SHARED_DIRECTORY, 'metrics-{}.json'.format(pid))
+
+def _writeFile(pid, content):
+    """Replaces the file of given process atomically, so readers never see a partially written file"""
+    temporary = sharedFile(pid) + '.tmp'
+    with open(temporary, 'w') as file:
+        json.dump(content, file)
+    os.replace(temporary, sharedFile(pid))
+
+def writeShared(withCollectors=True):
+    """Writes the metrics of this process into its file in the shared directory (if configured)"""
+    if SHARED_DIRECTORY is None:
+        return
+    pid = os.getpid()
+    content = {'pid': pid, 'metrics': {metric.name: metric.snapshot() for metric in metrics},
+               'collected': collect() if withCollectors else []}
+    _writeFile(pid, content)
+
+def readShared():
+    """Returns list of the contents of the files of all processes in the shared directory"""
+    processes = []
+    for name in sorted(os.listdir(SHARED_DIRECTORY)):
+        if not (name.startswith('metrics-') and name.endswith('.json')):
+            continue
+        try:
+            with open(os.path.join(SHARED_DIRECTORY, name)) as file:
+                processes.append(json.load(file))
+        except (OSError, ValueError):
+            # Removed or replaced meanwhile
+            continue
+    return processes
+
+def workerLines(processes):
+    """Returns the collected lines of all processes with their process-id as label 'worker',
+    the samples of each metric grouped after its HELP- and TYPE-line"""
+    families = {}
+    for process in processes:
+        family = None
+        for line in process['collected']:
+            if line.startswith('#'):
+                family = families.setdefault(line.split()[2], ([], []))
+                if line not in family[0]:
+                    family[0].append(line)
+            elif family is not None:
+                family[1].append(addLabel(line, 'worker', process['pid']))
+    lines = []
+    for header, samples in families.values():
+        lines += header + samples
+    return lines
+
+def clearShared():
+    """Removes the files of all processes from the shared directory (called by the gunicorn master at startup)"""
+    if SHARED_DIRECTORY is None:
+        return
+    os.makedirs(SHARED_DIRECTORY, exist_ok=True)
+    for name in os.listdir(SHARED_DIRECTORY):
+        if name.startswith('metrics-'):
+            os.remove(os.path.join(SHARED_DIRECTORY, name))
+
+def markExited(pid):
+    """Removes the collected per-worker values of an exited worker from its file, its counters and
+    histograms are kept in the sums (called by the gunicorn master)"""
+    if SHARED_DIRECTORY is None or not os.path.exists(sharedFile(pid)):
+        return
+    with open(sharedFile(pid)) as file:
+        content = json.load(file)
+    content['collected'] = []
+    _writeFile(pid, content)
+
+_sharingProcess = None
+
+def startSharing(reset=False):
+    """Starts the thread writing the metrics of this process into the shared directory every FLUSH_INTERVAL
+    seconds (once per process). With reset the values inherited from the gunicorn master are cleared,
+    since the master writes them into its own file."""
+    global _sharingProcess
+    if SHARED_DIRECTORY is None or _sharingProcess == os.getpid():
+        return
+    _sharingProcess = os.getpid()
+    if reset:
+        for metric in metrics:
+            metric.clear()
+
+    def share():
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            try:
+                writeShared()
+            except OSError as error:
+                print("WARNING: Metrics could not be written into " + SHARED_DIRECTORY + ": " + str(error))
+
+    threading.Thread(target=share, name='metrics-sharing', daemon=True).start()
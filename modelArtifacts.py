@@ -0,0 +1,162 @@
+"""
+Compact model-artifacts as replacement of the pickled model-configurations ('model_buy.p', 'model_rent.p')
+created by modeling.py. The export splits a pickled model-configuration into a directory
+(e.g. 'model_buy/') with the parts:
+    - 'estimator.joblib': the model, dumped uncompressed with joblib
+    - 'test_errors.npy', 'test_errors_notAbsolute.npy', 'test_errors_notAbsolute_sorted.npy':
+      the test-errors as raw float64-arrays, which are memory-mapped when loading
+    - 'meta.json': format-version and columns_used
+Loading an artifact is faster than unpickling and all gunicorn workers share the read-only pages of
+the memory-mapped test-errors via the page-cache of the operating system. The estimator itself is
+not shared: scikit-learn copies the nodes of its trees into private memory of each process when
+loading, even if joblib memory-maps them, so each process holds its own copy of the trees.
+Each export is written into a new versioned directory (e.g. 'model_buy.k2x9q1/') and 'model_buy'
+is then switched to it as symbolic link with a single atomic rename. Files of an exported artifact
+are never rewritten, so processes, which have memory-mapped the previous artifact, keep using
+a consistent state until they reload it.
+
+Export the pickled model-configurations in the current directory with:
+    python modelArtifacts.py export
+and validate existing artifacts with:
+    python modelArtifacts.py validate
+
+@author: Michael Volk
+"""
+
+import argparse
+import json
+import os
+import pickle
+import shutil
+import tempfile
+
+import numpy as np
+
+
+FORMAT_VERSION = 1
+META_FILE = 'meta.json'
+ESTIMATOR_FILE = 'estimator.joblib'
+ARRAY_FILES = ['test_errors', 'test_errors_notAbsolute', 'test_errors_notAbsolute_sorted']
+
+
+class ArtifactError(ValueError):
+    """Raised for a model-artifact, which is incomplete or does not match the expected schema"""
+
+
+def artifactFiles(directory):
+    """Returns all files of the model-artifact in given directory"""
+    return ([os.path.join(directory, META_FILE), os.path.join(directory, ESTIMATOR_FILE)]
+            + [os.path.join(directory, name + '.npy') for name in ARRAY_FILES])
+
+def isArtifact(directory):
+    """Returns whether given directory contains a model-artifact"""
+    return os.path.isfile(os.path.join(directory, META_FILE))
+
+def validateColumns(columns_used, model=None):
+    """Raises ArtifactError if columns_used is no list of unique, non-empty strings
+    or does not match the number and names of the features the model has been fitted with"""
+    if not isinstance(columns_used, (list, tuple)) or not columns_used:
+        raise ArtifactError("columns_used has to be a non-empty list")
+    if not all(isinstance(col, str) and col for col in columns_used):
+        raise ArtifactError("columns_used has to contain only non-empty strings")
+    duplicates = sorted({col for col in columns_used if list(columns_used).count(col) > 1})
+    if duplicates:
+        raise ArtifactError("columns_used contains duplicates: " + ", ".join(duplicates))
+    n_features = getattr(model, 'n_features_in_', None)
+    if n_features is not None and n_features != len(columns_used):
+        raise ArtifactError("Model has been fitted with {} features, but columns_used has {}".format(n_features, len(columns_used)))
+    feature_names = getattr(model, 'feature_names_in_', None)
+    if feature_names is not None and set(feature_names) != set(columns_used):
+        raise ArtifactError("Feature-names of the model differ from columns_used")
+
+def writeArtifact(data, directory):
+    """Writes the parts of the model-configuration data into the (new and empty) directory"""
+    import joblib
+    columns_used = list(data['columns_used'])
+    validateColumns(columns_used, data['model'])
+    joblib.dump(data['model'], os.path.join(directory, ESTIMATOR_FILE), compress=0)
+    arrays = {'test_errors': np.asarray(data['test_errors'], dtype=np.float64),
+              'test_errors_notAbsolute': np.asarray(data['test_errors_notAbsolute'], dtype=np.float64)}
+    arrays['test_errors_notAbsolute_sorted'] = np.sort(arrays['test_errors_notAbsolute'][~np.isnan(arrays['test_errors_notAbsolute'])])
+    for name in ARRAY_FILES:
+        np.save(os.path.join(directory, name + '.npy'), arrays[name])
+    # meta.json is written last, since its existence marks the artifact as complete
+    with open(os.path.join(directory, META_FILE), mode='w') as file:
+        json.dump({'format_version': FORMAT_VERSION, 'columns_used': columns_used}, file, indent=2)
+
+def artifactVersions(directory):
+    """Returns the versioned directories of the artifact at given path (e.g. 'model_buy.k2x9q1')"""
+    parent, name = os.path.split(directory)
+    return [os.path.join(parent or '.', entry) for entry in os.listdir(parent or '.')
+            if entry.startswith(name + '.') and isArtifact(os.path.join(parent or '.', entry))]
+
+def switchArtifact(directory, versionDir):
+    """Points the artifact-path directory atomically to versionDir (as relative symbolic link) and removes
+    older versions except the previous one (processes, which have already mapped it, are not affected,
+    since the files of a removed version stay valid as long as they are mapped)"""
+    previous = None
+    if os.path.islink(directory):
+        previous = os.path.join(os.path.dirname(directory), os.readlink(directory))
+    elif os.path.isdir(directory):
+        # Artifact of an older export written in place: moved aside once as previous version
+        # (renaming onto the new empty directory), so the path is missing only for this first switch
+        previous = tempfile.mkdtemp(prefix=os.path.basename(directory) + '.', dir=os.path.dirname(directory) or '.')
+        os.rename(directory, previous)
+    link = versionDir + '.link'
+    os.symlink(os.path.basename(versionDir), link)
+    os.replace(link, directory)
+    keep = {os.path.realpath(versionDir)} | ({os.path.realpath(previous)} if previous else set())
+    for version in artifactVersions(directory):
+        if os.path.realpath(version) not in keep:
+            shutil.rmtree(version, ignore_errors=True)
+
+def exportArtifact(pickleFile, directory):
+    """Splits the pickled model-configuration pickleFile into a model-artifact, which is written into
+    a new versioned directory and then atomically made available as given directory (see module-docstring)"""
+    with open(pickleFile, mode='rb') as pickled:
+        data = pickle.load(pickled)
+    directory = os.path.normpath(directory)
+    versionDir = tempfile.mkdtemp(prefix=os.path.basename(directory) + '.', dir=os.path.dirname(directory) or '.')
+    try:
+        # mkdtemp() creates the directory only accessible for the owner
+        os.chmod(versionDir, 0o755)
+        writeArtifact(data, versionDir)
+    except BaseException:
+        shutil.rmtree(versionDir, ignore_errors=True)
+        raise
+    switchArtifact(directory, versionDir)
+
+def loadArtifact(directory, mmap=True):
+    """Returns model-configuration of the model-artifact in given directory as dictionary with the same
+    keys as the pickled model-configuration ('model', 'columns_used', 'test_errors', 'test_errors_notAbsolute')
+    and additionally 'test_errors_notAbsolute_sorted'. Test-errors are numpy-arrays (memory-mapped if mmap)"""
+    import joblib
+    mmap_mode = 'r' if mmap else None
+    with open(os.path.join(directory, META_FILE), mode='r') as file:
+        meta = json.load(file)
+    if meta.get('format_version') != FORMAT_VERSION:
+        raise ArtifactError("Unsupported format_version of artifact " + directory + ": " + str(meta.get('format_version')))
+    data = {'model': joblib.load(os.path.join(directory, ESTIMATOR_FILE), mmap_mode=mmap_mode),
+            'columns_used': meta['columns_used']}
+    for name in ARRAY_FILES:
+        data[name] = np.load(os.path.join(directory, name + '.npy'), mmap_mode=mmap_mode)
+        if data[name].dtype != np.float64 or data[name].ndim != 1:
+            raise ArtifactError(name + " of artifact " + directory + " has to be a 1-dimensional float64-array")
+    validateColumns(data['columns_used'], data['model'])
+    return data
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export and validate model-artifacts for app.py")
+    parser.add_argument('command', choices=['export', 'validate'])
+    parser.add_argument('--model-dir', default='.', help="directory of 'model_buy.p'/'model_rent.p' and the artifacts")
+    args = parser.parse_args()
+    for cat in ['_buy', '_rent']:
+        directory = os.path.join(args.model_dir, 'model' + cat)
+        if args.command == 'export':
+            exportArtifact(os.path.join(args.model_dir, 'model' + cat + '.p'), directory)
+            print("Exported", 'model' + cat + '.p', "to", directory)
+        else:
+            data = loadArtifact(directory)
+            print(directory, "is valid:", len(data['columns_used']), "columns,",
+                  len(data['test_errors_notAbsolute']), "test-errors")
@@ -0,0 +1,109 @@
+"""
+Registry for the file-based resources of app.py (model-configurations and city-coordinates).
+Each resource is loaded only once per process (or once in the gunicorn master when the app
+is preloaded, so that the forked workers share the loaded objects copy-on-write) instead of
+once per request. The registry watches modification-time and size of the underlying files
+and swaps in a freshly loaded resource when they change, so new models can be deployed
+without restarting the server.
+
+@author: Michael Volk
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import namedtuple
+
+
+# Loaded resource together with the version (content-hash of the files) it was loaded from
+Snapshot = namedtuple('Snapshot', ['value', 'version', 'signature'])
+
+
+def fileSignature(filenames):
+    """Returns for given filenames a cheap signature (modification-time and size of each file),
+    which changes whenever one of the files is rewritten"""
+    signature = []
+    for filename in filenames:
+        stat = os.stat(filename)
+        signature.append((filename, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+def contentHash(filenames, chunkSize=1 << 20):
+    """Returns the shortened sha256-hexdigest of the content of all given filenames"""
+    digest = hashlib.sha256()
+    for filename in filenames:
+        with open(filename, mode='rb') as file:
+            for chunk in iter(lambda: file.read(chunkSize), b''):
+                digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+class FileRegistry:
+    """
+    Holds one resource, which is created by calling loader() and depends on the given filenames
+    (list or function returning the list, if the files depend on what is deployed).
+    get() returns the current Snapshot. At most every checkInterval seconds the signature of
+    the files is compared with the one of the loaded Snapshot and the resource is reloaded,
+    if the files have changed (checkInterval = 0 checks on every call, checkInterval < 0 never
+    reloads). The new resource is completely loaded before it replaces the old Snapshot by a
+    single assignment, so a caller never sees a half-loaded state. Callers should therefore
+    fetch the Snapshot once per request and use it for the whole request.
+    If reloading fails (e.g. because a file is just being copied) the old Snapshot stays in use
+    and loading is retried with the next check. New files should nevertheless be deployed
+    by an atomic rename.
+    """
+
+    def __init__(self, filenames, loader, checkInterval=2.0):
+        self._filenames = filenames
+        self.loader = loader
+        self.checkInterval = checkInterval
+        self._snapshot = None
+        self._nextCheck = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def filenames(self):
+        """Returns current list of files the resource depends on"""
+        return list(self._filenames() if callable(self._filenames) else self._filenames)
+
+    def get(self):
+        """Returns the current Snapshot and loads or reloads the resource if necessary"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return self._load(None)
+        if self.checkInterval >= 0 and time.monotonic() >= self._nextCheck:
+            return self._load(snapshot)
+        return snapshot
+
+    def _load(self, expected):
+        """(Re-)Loads the resource if the files differ from the signature of the Snapshot expected"""
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not expected and snapshot is not None:
+                # Another thread has already (re-)loaded the resource in the meantime
+                return snapshot
+            self._nextCheck = time.monotonic() + max(self.checkInterval, 0)
+            try:
+                filenames = self.filenames
+                signature = fileSignature(filenames)
+                if snapshot is not None and signature == snapshot.signature:
+                    return snapshot
+                version = contentHash(filenames)
+                value = self.loader()
+            except Exception as error:
+                if snapshot is None:
+                    raise
+                print("WARNING: reloading ", self.filenames, " failed (", repr(error), ") => keeping version ", snapshot.version)
+                return snapshot
+            self._snapshot = Snapshot(value, version, signature)
+            return self._snapshot
+
+    def current(self):
+        """Returns the current Snapshot without checking the files (None if not loaded yet)"""
+        return self._snapshot
+
+    def version(self):
+        """Returns the version of the current Snapshot"""
+        return self.get().version
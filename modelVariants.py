@@ -0,0 +1,140 @@
+"""
+Several versions of the model-configurations (variants) served side by side by app.py, e.g. a lighter,
+faster model next to the current best one. The variants are configured with the environment-variable
+MODEL_VARIANTS as comma-separated list of 'name=directory:weight', e.g.
+    MODEL_VARIANTS="best=.:90,light=models/light:10"
+Each directory contains the model-files of one variant (see app.modelFiles()) and is watched by its
+own FileRegistry (see modelRegistry.py), so each variant is loaded once per process (once in the
+gunicorn master when preloaded) and reloaded independently.
+Each additional variant costs about the in-memory size of its estimators (roughly the size of its
+model-files) once: the workers share the copy loaded in the gunicorn master copy-on-write. With
+RELOAD_BY_MASTER changed variants are reloaded only by the master, which then recycles the workers
+(see gunicorn.conf.py), so they stay shared. Otherwise each worker reloads a changed variant on its
+own into private memory, costing its size per worker.
+Without MODEL_VARIANTS only the variant 'default' of MODEL_DIR is served.
+
+Each request is routed to one variant: to the variant named in the header 'X-Model-Variant', otherwise
+by weight (variants with weight 0 get only requests with the header). Requests with the same header
+'X-Routing-Key' (e.g. a user- or session-id) are always routed to the same variant.
+The duration of model.predict() and the distribution of the predicted prices are recorded per variant
+and the median absolute test-error of each variant is exported, so that the accuracy and the
+inference-cost of the variants can be compared in the metrics.
+
+@author: Michael Volk
+"""
+
+import random
+import zlib
+from collections import namedtuple
+
+import numpy as np
+
+import metrics
+from estimation import ConfigurationError
+
+# Name of the only variant, if no variants are configured
+DEFAULT_VARIANT = 'default'
+# Upper bounds of the buckets of the distributions of the predicted buy- and rent-prices (in €)
+BUY_PRICE_BUCKETS = (50000, 100000, 150000, 200000, 250000, 300000, 400000, 500000, 750000, 1000000, 2000000)
+RENT_PRICE_BUCKETS = (250, 400, 500, 600, 750, 900, 1000, 1250, 1500, 2000, 3000, 5000)
+
+predicted_prices = {
+    '_buy': metrics.Histogram('estimator_predicted_buy_price', 'Distribution of the predicted buy-prices per model-variant',
+                              ['variant'], buckets=BUY_PRICE_BUCKETS),
+    '_rent': metrics.Histogram('estimator_predicted_rent_price', 'Distribution of the predicted rent-prices per model-variant',
+                               ['variant'], buckets=RENT_PRICE_BUCKETS)}
+metrics.metrics += list(predicted_prices.values())
+
+# Configured variant: its name, directory of the model-files and routing-weight
+Variant = namedtuple('Variant', ['name', 'directory', 'weight'])
+
+
+def parseVariants(value, defaultDirectory='.'):
+    """Returns list of Variants of given MODEL_VARIANTS-value (see module-docstring),
+    only the variant 'default' of defaultDirectory if value is empty"""
+    if value is None or not value.strip():
+        return [Variant(DEFAULT_VARIANT, defaultDirectory, 1.0)]
+    variants = []
+    for part in value.split(','):
+        name, separator, location = part.strip().partition('=')
+        if not separator or not name.strip() or not location.strip():
+            raise ValueError("Model-variant '" + part.strip() + "' has to be given as 'name=directory:weight'")
+        directory, separator, weight = location.strip().rpartition(':')
+        if not separator or not weight.strip().replace('.', '', 1).isdigit():
+            # No weight given (or a colon of the directory, e.g. on Windows)
+            directory, weight = location.strip(), '1'
+        variants.append(Variant(name.strip(), directory, float(weight)))
+    names = [variant.name for variant in variants]
+    if len(set(names)) != len(names):
+        raise ValueError("Names of the model-variants have to be unique: " + value)
+    if sum(variant.weight for variant in variants) <= 0:
+        raise ValueError("At least one model-variant needs a positive weight: " + value)
+    return variants
+
+
+class ModelVariants:
+    """
+    Registries (created by registryFactory(variant)) of the configured Variants with routing by header or weight.
+    The first variant is the primary one (e.g. used by the command-line tools and for the heat-maps precomputed at startup).
+    """
+
+    def __init__(self, variants, registryFactory):
+        self.variants = list(variants)
+        self.names = [variant.name for variant in self.variants]
+        self.registries = {variant.name: registryFactory(variant) for variant in self.variants}
+        weights = np.array([variant.weight for variant in self.variants], dtype=np.float64)
+        # Cumulative weights normalized to 1, the last one exactly 1
+        self._cumulative = (np.cumsum(weights) / weights.sum()).tolist()
+        self._cumulative[-1] = 1.0
+
+    @property
+    def primary(self):
+        return self.names[0]
+
+    def choose(self, requested=None, routingKey=None):
+        """Returns name of the variant for a request: the requested one (raises ConfigurationError if it
+        does not exist), otherwise chosen by weight, deterministic for the same routingKey"""
+        if requested:
+            if requested not in self.registries:
+                raise ConfigurationError("Unknown model-variant '" + requested + "' (available: "
+                                         + ', '.join(self.names) + ")")
+            return requested
+        if len(self.names) == 1:
+            return self.names[0]
+        if routingKey:
+            position = zlib.crc32(routingKey.encode('utf-8')) / 2 ** 32
+        else:
+            position = random.random()
+        for name, cumulative in zip(self.names, self._cumulative):
+            if position < cumulative:
+                return name
+        return self.names[-1]
+
+    def get(self, name):
+        """Returns the current Snapshot of the model-configurations of given variant"""
+        return self.registries[name].get()
+
+    def versions(self):
+        """Returns dictionary with the version of each variant"""
+        return {name: registry.version() for name, registry in self.registries.items()}
+
+    def observePredictions(self, name, results):
+        """Records the predicted buy- and rent-prices of a request (see estimation.estimatePrices()) for given variant"""
+        for cat, histogram in predicted_prices.items():
+            if 'y_predicted' + cat in results:
+                histogram.observeMany(results['y_predicted' + cat], variant=name)
+
+    def testErrorMetrics(self):
+        """Returns lines of the median absolute (relative) test-error of the models of each loaded variant"""
+        name = 'estimator_variant_test_error'
+        lines = ['# HELP {} Median absolute relative test-error of the model-variants'.format(name),
+                 '# TYPE {} gauge'.format(name)]
+        for variant, registry in self.registries.items():
+            snapshot = registry.current()
+            if snapshot is None:
+                continue
+            for cat in ['_buy', '_rent']:
+                errors = snapshot.value['error_distribution' + cat].sorted_errors
+                lines.append('{}{} {}'.format(name, metrics.formatLabels(('variant', 'model'), (variant, cat[1:])),
+                                              float(np.median(np.abs(errors)))))
+        return lines
@@ -0,0 +1,58 @@
+"""
+Cache for pages of app.py, which only depend on a file-based resource (e.g. the formular-page,
+which only depends on the city-coordinates). The page is rendered and compressed (gzip and,
+if the optional package 'brotli' is installed, brotli) only once per version of the resource
+and then served from memory together with a strong ETag per content-encoding.
+
+@author: Michael Volk
+"""
+
+import gzip
+import hashlib
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, without it pages are only compressed with gzip
+    brotli = None
+
+
+def compressions():
+    """Returns dictionary of supported content-encodings with their compression-function"""
+    encodings = {'identity': lambda body: body,
+                 'gzip': lambda body: gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        encodings['br'] = lambda body: brotli.compress(body, quality=11)
+    return encodings
+
+
+class PageCache:
+    """
+    Page created by render(value) for the value of the current Snapshot of given registry
+    (see modelRegistry.py). For each version of the registry the page is rendered once and
+    stored for every supported content-encoding as (body, etag).
+    """
+
+    def __init__(self, registry, render):
+        self.registry = registry
+        self.render = render
+        self.encodings = compressions()
+        self._pages = (None, {})
+
+    def get(self, encoding='identity'):
+        """Returns (body, etag) of the page for given content-encoding"""
+        snapshot = self.registry.get()
+        version, pages = self._pages
+        if version != snapshot.version:
+            pages = self._build(snapshot)
+            # Replacing the whole tuple at once, so other threads see either old or new pages
+            self._pages = (snapshot.version, pages)
+        return pages[encoding]
+
+    def _build(self, snapshot):
+        """Returns rendered page of given Snapshot compressed with all supported content-encodings"""
+        body = self.render(snapshot.value).encode('utf-8')
+        digest = hashlib.sha256(body).hexdigest()[:16]
+        pages = {}
+        for encoding, compress in self.encodings.items():
+            pages[encoding] = (compress(body), digest + '-' + encoding)
+        return pages
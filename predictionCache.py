@@ -0,0 +1,180 @@
+"""
+Cache for the predicted buy & rent prices of app.py, so that repeated apartment-configurations
+are not predicted by the models again. The key of an entry is the canonical feature-vector
+(x_dict created by estimation.configurationToFeatures()) with coordinates rounded to a
+configurable number of decimals, prefixed with the version of the model-configuration. So
+entries of a replaced (hot-reloaded) model are never used again and are evicted over time.
+Entries are held in a bounded in-process LRU-cache with time-to-live. Optionally a shared redis-
+backend (package 'redis' and environment-variable PREDICTION_CACHE_URL) is used in addition,
+so that all gunicorn workers benefit from the predictions of each other.
+
+@author: Michael Volk
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class LocalCache:
+    """In-process LRU-cache with at most maxSize entries, which expire after ttl seconds.
+    With a function weigh(value) (e.g. the number of bytes of the value) the sum of the weights of all
+    entries is limited to maxSize instead of their number, values heavier than maxSize are not cached"""
+
+    def __init__(self, maxSize=10000, ttl=3600, weigh=None):
+        self.maxSize = maxSize
+        self.ttl = ttl
+        self.weigh = weigh
+        self.weight = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def getMany(self, keys):
+        """Returns list with the cached value (or None) for each of given keys"""
+        now = time.monotonic()
+        values = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    values.append(None)
+                elif entry[0] < now:
+                    self._remove(key)
+                    values.append(None)
+                else:
+                    self._entries.move_to_end(key)
+                    values.append(entry[1])
+        return values
+
+    def setMany(self, items):
+        """Stores given (key, value)-pairs and evicts the least recently used entries"""
+        expiry = time.monotonic() + self.ttl
+        with self._lock:
+            for key, value in items:
+                weight = self.weigh(value) if self.weigh is not None else 1
+                if key in self._entries:
+                    self._remove(key)
+                if weight > self.maxSize:
+                    continue
+                self._entries[key] = (expiry, value, weight)
+                self.weight += weight
+            while self.weight > self.maxSize:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        self.weight -= self._entries.pop(key)[2]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.weight = 0
+
+
+class RedisCache:
+    """Cache shared by all workers (and servers) in redis, entries expire after ttl seconds"""
+
+    def __init__(self, url, ttl=3600, prefix='prediction:'):
+        import redis  # optional dependency, only needed for the shared cache
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _redisKey(self, key):
+        """Returns given key (tuple of version and feature-values) as redis-key"""
+        return self.prefix + json.dumps(key)
+
+    def getMany(self, keys):
+        """Returns list with the cached value (or None) for each of given keys"""
+        if not keys:
+            return []
+        return [None if value is None else tuple(json.loads(value))
+                for value in self.client.mget([self._redisKey(key) for key in keys])]
+
+    def setMany(self, items):
+        """Stores given (key, value)-pairs"""
+        pipeline = self.client.pipeline(transaction=False)
+        for key, value in items:
+            pipeline.set(self._redisKey(key), json.dumps(value), ex=int(self.ttl))
+        pipeline.execute()
+
+
+class PredictionCache:
+    """
+    Two-level cache (local LRU-cache and optional shared cache) for the predicted values of
+    apartment-configurations. Counts hits and misses of all lookups. Errors of the shared
+    cache (e.g. redis not reachable) are counted and treated as misses.
+    """
+
+    def __init__(self, local, shared=None, coordinatePrecision=4):
+        self.local = local
+        self.shared = shared
+        self.coordinatePrecision = coordinatePrecision
+        self.hits = 0
+        self.misses = 0
+        self.sharedHits = 0
+        self.sharedErrors = 0
+
+    @classmethod
+    def fromEnvironment(cls):
+        """Returns PredictionCache configured by the environment-variables PREDICTION_CACHE_SIZE
+        (0 disables the cache => returns None), PREDICTION_CACHE_TTL (seconds), COORDINATE_PRECISION
+        (decimals of Latitude & Longitude in the key) and PREDICTION_CACHE_URL (redis-url of shared cache)"""
+        size = int(os.environ.get('PREDICTION_CACHE_SIZE', '10000'))
+        if size <= 0:
+            return None
+        ttl = float(os.environ.get('PREDICTION_CACHE_TTL', '3600'))
+        url = os.environ.get('PREDICTION_CACHE_URL')
+        return cls(LocalCache(size, ttl), RedisCache(url, ttl) if url else None,
+                   int(os.environ.get('COORDINATE_PRECISION', '4')))
+
+    def key(self, x_dict, version):
+        """Returns key (tuple) of given feature-vector for the model-configuration of given version.
+        All x_dicts are created with the same order of features, so only the values are part of the key"""
+        return (version, *[round(value, self.coordinatePrecision) if feature in ('Latitude', 'Longitude') else value
+                           for feature, value in x_dict.items()])
+
+    def getMany(self, keys):
+        """Returns list with the cached value (or None) for each of given keys"""
+        values = self.local.getMany(keys)
+        missing = [i for i, value in enumerate(values) if value is None]
+        if missing and self.shared is not None:
+            try:
+                sharedValues = self.shared.getMany([keys[i] for i in missing])
+            except Exception:
+                self.sharedErrors += 1
+                sharedValues = [None] * len(missing)
+            found = [(keys[i], value) for i, value in zip(missing, sharedValues) if value is not None]
+            for i, value in zip(missing, sharedValues):
+                values[i] = value
+            self.local.setMany(found)
+            self.sharedHits += len(found)
+        hits = sum(value is not None for value in values)
+        self.hits += hits
+        self.misses += len(values) - hits
+        return values
+
+    def setMany(self, items):
+        """Stores given (key, value)-pairs in the local and the shared cache"""
+        self.local.setMany(items)
+        if self.shared is not None:
+            try:
+                self.shared.setMany(items)
+            except Exception:
+                self.sharedErrors += 1
+
+    def stats(self):
+        """Returns dictionary with the counters and the size of the cache"""
+        lookups = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'shared_hits': self.sharedHits,
+                'shared_errors': self.sharedErrors,
+                'size': len(self.local),
+                'max_size': self.local.maxSize,
+                'shared': self.shared is not None}
@@ -0,0 +1,108 @@
+"""
+What-if sensitivity of the estimated prices of app.py for one base apartment-configuration.
+All single-feature variations of the base are created: each condition & outdoor checkbox toggled,
+each Category and a range of values for 'Area', 'Rooms' and 'Construction_Year'. The variations are
+scored together with the base as one feature-matrix, so buy and rent are predicted with a single
+model.predict()-call each. The result contains the marginal price-effect of each variation compared
+with the base (e.g. price with balcony minus price without balcony).
+
+@author: Michael Volk
+"""
+
+import math
+
+import numpy as np
+
+from estimation import ConfigurationError, category_features, checkbox_features, featureRows, features, map_num, predictModel
+from metrics import timed
+
+# Default ranges (first, last, step) of the numerical formular-elements (the limits of the formular)
+DEFAULT_RANGES = {'Area': (20, 180, 10), 'Rooms': (1, 7, 1), 'Construction_Year': (1850, 2020, 10)}
+# Maximal number of values per range
+MAX_RANGE_VALUES = 500
+# Model-feature of each numerical formular-element
+num_features = {element: key for key, element in map_num.items()}
+
+
+def parseRange(value, element):
+    """Returns array of the values of a range given as 'first:last:step' (last included) for given element,
+    the default range of the element if value is empty"""
+    if value is None or str(value).strip() == '':
+        first, last, step = DEFAULT_RANGES[element]
+    else:
+        try:
+            first, last, step = (float(part) for part in str(value).split(':'))
+        except ValueError:
+            raise ConfigurationError("Range of " + element + " has to be given as 'first:last:step'") from None
+        if not all(math.isfinite(part) for part in (first, last, step)):
+            raise ConfigurationError("Range of " + element + " has to consist of finite numbers")
+        if not step > 0 or not last >= first:
+            raise ConfigurationError("Range of " + element + " needs a positive step and last >= first")
+        if (last - first) / step + 1 > MAX_RANGE_VALUES:
+            raise ConfigurationError("Too many values in range of " + element + " (maximum: " + str(MAX_RANGE_VALUES) + ")")
+    # Small tolerance, so that last is included despite rounding-errors of the steps
+    return np.arange(first, last + step * 1e-9, step)
+
+def variantRows(x_dict, ranges):
+    """Returns matrix of canonical feature-rows (see estimation.featureRows()) with the base x_dict in the first row
+    followed by its variations and list of (group, name, value) describing each row"""
+    position = {feature: i for i, feature in enumerate(features)}
+    base = featureRows([x_dict])[0]
+    variations = [('base', None, None)]
+    changes = [{}]
+    for element, key in checkbox_features:
+        variations.append(('checkbox', element, not base[position[key]]))
+        changes.append({key: 0.0 if base[position[key]] else 1.0})
+    for category, key in category_features.items():
+        variations.append(('category', category, category))
+        changes.append(dict({other: 0.0 for other in category_features.values()}, **{key: 1.0}))
+    for element, values in ranges.items():
+        for value in values:
+            variations.append(('range', element, float(value)))
+            changes.append({num_features[element]: float(value)})
+    rows = np.repeat(base[np.newaxis, :], len(changes), axis=0)
+    for i, change in enumerate(changes):
+        for key, value in change.items():
+            rows[i, position[key]] = value
+    return rows, variations
+
+def effect(price, reference):
+    """Returns the effect of price compared with the reference-price absolute and in percent"""
+    return {'effect': price - reference, 'effect_percent': (price / reference - 1) * 100}
+
+def sensitivity(x_dict, modelConfigs, ranges):
+    """Returns dictionary with the estimated buy & rent prices of the base x_dict ('base') and the marginal
+    effects of toggling each checkbox ('checkboxes'), of each Category ('categories') and of the values of
+    the given ranges of numerical elements ('ranges', see parseRange()), predicted with one model.predict()
+    per model"""
+    with timed('feature_encoding'):
+        rows, variations = variantRows(x_dict, ranges)
+        x_in = {cat: modelConfigs['encoder' + cat].modelInput(rows) for cat in ['_buy', '_rent']}
+    prices = {cat[1:]: predictModel(x_in[cat], modelConfigs, cat).tolist() for cat in ['_buy', '_rent']}
+    base = {cat: prices[cat][0] for cat in prices}
+
+    result = {'base': base, 'checkboxes': [], 'categories': [], 'ranges': {}}
+    for i, (group, name, value) in enumerate(variations):
+        if group == 'checkbox':
+            # Effect of having the checkbox checked, no matter whether the base has it checked or not
+            entry = {'feature': name, 'checked': not value}
+            for cat in prices:
+                withFeature, withoutFeature = (prices[cat][i], base[cat]) if value else (base[cat], prices[cat][i])
+                entry[cat] = dict(effect(withFeature, withoutFeature), checked=withFeature, unchecked=withoutFeature)
+            result['checkboxes'].append(entry)
+        elif group == 'category':
+            entry = {'category': name, 'selected': bool(rows[0, features.index(category_features[name])] == 1)}
+            for cat in prices:
+                entry[cat] = dict(effect(prices[cat][i], base[cat]), estimate=prices[cat][i])
+            result['categories'].append(entry)
+        elif group == 'range':
+            entry = result['ranges'].setdefault(name, {'values': [], 'buy': [], 'rent': []})
+            entry['values'].append(value)
+            for cat in prices:
+                entry[cat].append(prices[cat][i])
+    for name, entry in result['ranges'].items():
+        # Average change of the price per unit of the element (slope of the least-squares-line)
+        for cat in prices:
+            entry[cat + '_per_unit'] = (float(np.polyfit(entry['values'], entry[cat], 1)[0])
+                                        if len(entry['values']) > 1 else None)
+    return result
@@ -0,0 +1,52 @@
+"""
+Makes the modules of the repository (in its root-directory) importable for the tests and provides
+small synthetic stand-in models (see benchmarks/syntheticModels.py) instead of the real model-files,
+as well as a test-client of the Flask-app serving them.
+
+@author: Michael Volk
+"""
+
+import os
+import sys
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, 'benchmarks'))
+
+CITY_FILE = os.path.join(ROOT_DIR, 'nrwCityCoordinates.csv')
+
+
+@pytest.fixture(scope='session')
+def modelDir(tmp_path_factory):
+    """Directory with small synthetic 'model_buy.p' and 'model_rent.p'"""
+    from syntheticModels import writeSyntheticModels
+    directory = str(tmp_path_factory.mktemp('models'))
+    writeSyntheticModels(directory, n=400, n_estimators=5)
+    return directory
+
+@pytest.fixture
+def servedModels(monkeypatch, modelDir):
+    """Makes app.py (and the ASGI-app using it) serve the synthetic models of modelDir as its only
+    model-variant, marked as ready so that no startup-phase runs in the background"""
+    import threading
+    import app
+    from modelRegistry import FileRegistry
+    from modelVariants import ModelVariants, parseVariants
+    from pageCache import PageCache
+    modelVariants = ModelVariants(parseVariants('', modelDir), app.variantRegistry)
+    cityRegistry = FileRegistry([CITY_FILE], lambda: app.load_cityCoordinates(CITY_FILE))
+    ready = threading.Event()
+    ready.set()
+    monkeypatch.setattr(app, 'modelVariants', modelVariants)
+    monkeypatch.setattr(app, 'modelRegistry', modelVariants.registries[modelVariants.primary])
+    monkeypatch.setattr(app, 'cityRegistry', cityRegistry)
+    monkeypatch.setattr(app, 'formularCache', PageCache(cityRegistry, app.renderFormular))
+    monkeypatch.setattr(app, 'ready', ready)
+
+@pytest.fixture
+def client(servedModels):
+    """Test-client of the Flask-app (app.py) serving the synthetic models (see servedModels)"""
+    import app
+    return app.app.test_client()
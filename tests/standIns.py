@@ -0,0 +1,41 @@
+"""
+Stand-ins for the models of app.py shared by the tests: models predicting a known price
+of the Area, so that the predicted values and their order can be checked, and the data
+of a filled-out formular.
+
+@author: Michael Volk
+"""
+
+import numpy as np
+
+from estimation import FeatureEncoder, features
+
+# Formular-data of the default-configuration of the formular with the location given by cityname
+FORMULAR_DATA = {'chooseLocation': 'cityname', 'Cityname': 'Aachen', 'Latitude': '', 'Longitude': '',
+                 'Category': 'Apartment', 'Area': '100', 'Rooms': '4', 'Construction_Year': '2010',
+                 'Maintained': '1', 'Balcony': '1', 'Confidence_Level': '90%'}
+
+
+class AreaModel:
+    """Stand-in model predicting the log of factor * Area of each row and recording the predicted rows"""
+
+    def __init__(self, factor):
+        self.factor = factor
+        self.predicted = []
+
+    def predict(self, x):
+        self.predicted.append(x[:, 0].tolist())
+        return np.log(self.factor * x[:, 0])
+
+
+def modelConfigurations():
+    """Returns model-configurations with AreaModels for buy (1000 * Area) and rent (10 * Area)"""
+    modelConfigs = {}
+    for cat, factor in [('_buy', 1000.0), ('_rent', 10.0)]:
+        modelConfigs['model' + cat] = AreaModel(factor)
+        modelConfigs['encoder' + cat] = FeatureEncoder(['Area', 'Rooms'])
+    return modelConfigs
+
+def x_dict(area):
+    """Returns x_dict (see estimation.configurationToFeatures()) with given Area"""
+    return dict(dict.fromkeys(features, 0), Area=float(area), Rooms=3.0)
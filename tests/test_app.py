@@ -0,0 +1,104 @@
+"""
+Tests of the endpoints of the Flask-app in app.py with synthetic models (see conftest.client).
+
+@author: Michael Volk
+"""
+
+import json
+import threading
+
+import pytest
+
+import app
+import metrics
+from cityIndex import CityIndex
+from standIns import FORMULAR_DATA
+
+CONFIGURATIONS = [{'Cityname': 'Aachen', 'Category': 'Apartment', 'Area': 80, 'Rooms': 3, 'Construction_Year': 2000},
+                  {'Latitude': 51.2, 'Longitude': 7.0, 'Area': '120', 'Rooms': '4', 'Construction_Year': '1990',
+                   'Balcony': True},
+                  {'Cityname': 'Bonn', 'Category': 'Loft', 'Area': 55.5, 'Rooms': 2, 'Construction_Year': 1970}]
+
+
+def test_unknown_cityname_is_rejected(client):
+    response = client.post('/', data=dict(FORMULAR_DATA, Cityname='Nowhere'))
+    assert response.status_code == 400
+    assert "Unknown Cityname: &#39;Nowhere&#39;" in response.get_data(as_text=True)
+
+    response = client.post('/api/v1/estimate', json=[{'Cityname': 'Nowhere', 'Area': 80, 'Rooms': 3,
+                                                       'Construction_Year': 2000}])
+    assert response.status_code == 400
+    assert 'Nowhere' in response.get_json()['error']
+
+def test_cityname_is_normalized(client):
+    response = client.post('/', data=dict(FORMULAR_DATA, Cityname='DUESSELDORF'))
+    assert response.status_code == 200
+
+def test_posted_values_are_escaped_in_the_result_page(client):
+    response = client.post('/', data=dict(FORMULAR_DATA, Category='<script>alert(1)</script>', Garden='on'))
+    page = response.get_data(as_text=True)
+    assert response.status_code == 200
+    assert '<script>' not in page and '&lt;script&gt;alert(1)&lt;/script&gt;' in page
+    # Checked checkboxes are shown as 'Yes', the estimates are rendered into the page between head and tail
+    assert '<td>Yes</td>' in page
+    assert page.startswith(app.resultPageHead) and page.endswith(app.resultPageTail)
+    assert 'Buy-price per Area' in page
+
+def test_error_messages_are_escaped(client):
+    response = client.post('/', data=dict(FORMULAR_DATA, Cityname='<img src=x onerror=alert(1)>'))
+    assert response.status_code == 400
+    assert '<img' not in response.get_data(as_text=True)
+
+def test_citynames_are_escaped_in_the_formular():
+    page = app.renderFormular(CityIndex(['Aachen', '<b>Bonn</b>'], [50.76, 50.73], [6.11, 7.1]))
+    assert '<b>Bonn</b>' not in page and '&lt;b&gt;Bonn&lt;/b&gt;' in page
+
+def test_estimate_predicts_a_batch_with_one_model_call(client, monkeypatch):
+    monkeypatch.setattr(app, 'predictionCache', None)
+    calls = metrics.model_seconds.count(variant='default', model='buy')
+    response = client.post('/api/v1/estimate?confidence=95', json=CONFIGURATIONS)
+    result = response.get_json()
+    assert response.status_code == 200 and result['confidence'] == 0.95
+    assert metrics.model_seconds.count(variant='default', model='buy') == calls + 1
+    assert len(result['estimates']) == 3
+    for configuration, estimate in zip(CONFIGURATIONS, result['estimates']):
+        single = client.post('/api/v1/estimate?confidence=95', json=configuration).get_json()['estimates'][0]
+        assert estimate['buy'] == pytest.approx(single['buy']) and estimate['rent'] == pytest.approx(single['rent'])
+        assert estimate['buy']['lower_bound'] < estimate['buy']['estimate'] < estimate['buy']['upper_bound']
+
+def test_estimate_with_ndjson(client):
+    body = ''.join(json.dumps(configuration) + '\n' for configuration in CONFIGURATIONS)
+    response = client.post('/api/v1/estimate', data=body, content_type='application/x-ndjson')
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert response.mimetype == 'application/x-ndjson' and 'X-Model-Version' in response.headers
+    assert rows == client.post('/api/v1/estimate', json=CONFIGURATIONS).get_json()['estimates']
+
+@pytest.mark.parametrize('body, message', [
+    ('{"Area": 80', 'JSON-array'),
+    ('[1, 2]', 'JSON-object'),
+    (json.dumps([CONFIGURATIONS[0], dict(CONFIGURATIONS[0], Area='inf')]), 'Configuration 1: Area has to be a finite number'),
+    (json.dumps([dict(CONFIGURATIONS[1], Latitude='nan')]), 'Configuration 0: Latitude and Longitude'),
+])
+def test_invalid_estimation_requests_are_rejected(client, body, message):
+    response = client.post('/api/v1/estimate', data=body, content_type='application/json')
+    assert response.status_code == 400 and message in response.get_json()['error']
+
+def test_too_many_configurations_are_rejected(client, monkeypatch):
+    monkeypatch.setattr(app, 'MAX_BATCH_SIZE', 2)
+    response = client.post('/api/v1/estimate', json=CONFIGURATIONS)
+    assert response.status_code == 400 and 'maximum: 2' in response.get_json()['error']
+
+def test_readiness_after_the_startup_phase(client, monkeypatch):
+    ready = threading.Event()
+    monkeypatch.setattr(app, 'ready', ready)
+    monkeypatch.setattr(app, 'preloadInBackground', lambda: None)
+    assert client.get('/healthz').status_code == 200
+    response = client.get('/readyz')
+    assert response.status_code == 503 and response.get_json()['status'] == 'starting'
+
+    warmUps = metrics.stage_seconds.count(stage='warm_up')
+    app.preload()
+    app.preload()
+    assert metrics.stage_seconds.count(stage='warm_up') == warmUps + 1
+    result = client.get('/readyz').get_json()
+    assert result['status'] == 'ready' and result['model_versions'] == {'default': result['model_version']}
@@ -0,0 +1,157 @@
+"""
+Tests of the micro-batching of asgiApp.py: grouping of the queued requests per model-version
+and splitting of the predicted values back to the requests, limits of the jobs, handling of
+invalid request-bodies and the responses of the endpoints compared with the Flask-app.
+
+@author: Michael Volk
+"""
+
+import asyncio
+import json
+import threading
+from urllib.parse import urlencode
+
+import numpy as np
+import pytest
+
+import asgiApp
+from asgiApp import InferenceBatcher, Overloaded
+from modelRegistry import Snapshot
+from standIns import FORMULAR_DATA, modelConfigurations, x_dict
+
+
+def test_take_batch_groups_requests_of_the_same_snapshot():
+    first, second = Snapshot({}, 'v1', ()), Snapshot({}, 'v2', ())
+    batcher = InferenceBatcher(threads=1, maxBatch=4)
+    queued = [(first, [1], 'a'), (second, [2], 'b'), (first, [3, 4], 'c'), (second, [5], 'd'), (first, [6, 7], 'e')]
+    batcher._queue.extend(queued)
+    # Requests of other versions and requests exceeding maxBatch keep their order in the queue
+    assert batcher._takeBatch() == [queued[0], queued[2]]
+    assert list(batcher._queue) == [queued[1], queued[3], queued[4]]
+    assert batcher._takeBatch() == [queued[1], queued[3]]
+    assert batcher._takeBatch() == [queued[4]]
+    assert not batcher._queue
+
+def test_take_batch_takes_oversized_request_alone():
+    snapshot = Snapshot({}, 'v1', ())
+    batcher = InferenceBatcher(threads=1, maxBatch=2)
+    queued = [(snapshot, [1, 2, 3], 'a'), (snapshot, [4], 'b')]
+    batcher._queue.extend(queued)
+    assert batcher._takeBatch() == [queued[0]]
+    assert batcher._takeBatch() == [queued[1]]
+
+def test_batcher_returns_the_predicted_values_of_each_request():
+    snapshots = [Snapshot(modelConfigurations(), 'v1', ()), Snapshot(modelConfigurations(), 'v2', ())]
+    requests = [(snapshots[0], [50, 60]), (snapshots[1], [70]), (snapshots[0], [80]), (snapshots[0], [90, 100, 110])]
+
+    async def predictAll():
+        batcher = InferenceBatcher(threads=2, maxWait=0.01)
+        batcher.start()
+        try:
+            return await asyncio.gather(*[batcher.predict([x_dict(a) for a in areas], snapshot)
+                                          for snapshot, areas in requests])
+        finally:
+            await batcher.stop()
+
+    results = asyncio.run(predictAll())
+    for (snapshot, areas), result in zip(requests, results):
+        np.testing.assert_allclose(result['y_predicted_buy'], [1000.0 * a for a in areas])
+        np.testing.assert_allclose(result['y_predicted_rent'], [10.0 * a for a in areas])
+    # Queued together, the requests of each model-version have been predicted as one batch
+    assert snapshots[0].value['model_buy'].predicted == [[50.0, 60.0, 80.0, 90.0, 100.0, 110.0]]
+    assert snapshots[1].value['model_buy'].predicted == [[70.0]]
+
+def test_jobs_are_limited_and_rejected_if_the_queue_is_full():
+    release = threading.Event()
+    running = []
+
+    def job(name):
+        running.append(name)
+        release.wait(5)
+        return name
+
+    async def runJobs():
+        batcher = InferenceBatcher(threads=2, maxQueue=2, maxJobs=1)
+        batcher.start()
+        try:
+            jobs = [asyncio.ensure_future(batcher.runJob(job, name)) for name in ['a', 'b', 'c']]
+            await asyncio.sleep(0.05)
+            # One job runs, the others wait for its slot and count to the queue-depth
+            assert running == ['a'] and batcher.queueDepth() == 2
+            with pytest.raises(Overloaded):
+                await batcher.runJob(job, 'd')
+            release.set()
+            return await asyncio.gather(*jobs)
+        finally:
+            await batcher.stop()
+
+    assert asyncio.run(runJobs()) == ['a', 'b', 'c']
+    assert running == ['a', 'b', 'c']
+
+def request(path, messages=(), headers=(), method='POST', query=b''):
+    """Returns the messages sent by the ASGI-application for a request with given received messages"""
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query,
+             'headers': [(name.encode(), value.encode()) for name, value in headers]}
+    received, sent = list(messages), []
+
+    async def receive():
+        return received.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asgiApp.app(scope, receive, send))
+    return sent
+
+def post(path, body, headers=()):
+    """Returns status, headers and body of the response to a POST-request with given body"""
+    sent = request(path, [{'type': 'http.request', 'body': body, 'more_body': False}], headers)
+    return sent[0]['status'], dict(sent[0]['headers']), b''.join(message.get('body', b'') for message in sent[1:])
+
+@pytest.fixture
+def startedApp(monkeypatch):
+    # No background-task and no models needed, the requests fail before
+    monkeypatch.setattr(asgiApp.batcher, '_task', object())
+
+@pytest.mark.parametrize('path', ['/', '/api/v1/estimate', '/api/v1/sensitivity'])
+def test_body_not_utf8_is_rejected(startedApp, path):
+    sent = request(path, [{'type': 'http.request', 'body': b'\xff\xfe', 'more_body': False}])
+    assert sent[0]['status'] == 400
+    assert b'UTF-8' in sent[1]['body']
+
+def test_disconnected_client_gets_no_response(startedApp):
+    assert request('/api/v1/estimate', [{'type': 'http.request', 'body': b'{"Area"', 'more_body': True},
+                                        {'type': 'http.disconnect'}]) == []
+
+@pytest.fixture
+def servedApp(monkeypatch, servedModels):
+    """ASGI-app serving the synthetic models with its own InferenceBatcher (started with the first request)"""
+    batcher = InferenceBatcher(threads=2)
+    monkeypatch.setattr(asgiApp, 'batcher', batcher)
+    yield asgiApp
+    batcher.pool.shutdown()
+
+def test_result_page_matches_the_flask_app(servedApp, client):
+    form = urlencode(FORMULAR_DATA).encode()
+    status, headers, body = post('/', form, [('content-type', 'application/x-www-form-urlencoded')])
+    assert status == 200 and headers[b'content-type'] == b'text/html; charset=utf-8'
+    assert body == client.post('/', data=FORMULAR_DATA).get_data()
+
+def test_estimate_matches_the_flask_app(servedApp, client):
+    configurations = [{'Cityname': 'Aachen', 'Area': 80, 'Rooms': 3, 'Construction_Year': 2000},
+                      {'Latitude': 51.2, 'Longitude': 7.0, 'Area': 120, 'Rooms': 4, 'Construction_Year': 1990}]
+    status, headers, body = post('/api/v1/estimate', json.dumps(configurations).encode(),
+                                 [('content-type', 'application/json')])
+    assert status == 200
+    assert json.loads(body) == client.post('/api/v1/estimate', json=configurations).get_json()
+
+def test_invalid_configuration_and_unknown_path(servedApp):
+    status, headers, body = post('/api/v1/estimate', b'[{"Area": 80}]', [('content-type', 'application/json')])
+    assert status == 400 and 'error' in json.loads(body)
+    assert request('/unknown', method='GET')[0]['status'] == 404
+
+def test_formular_is_not_modified_with_matching_etag(servedApp):
+    sent = request('/', method='GET')
+    etag = dict(sent[0]['headers'])[b'etag'].decode()
+    assert sent[0]['status'] == 200
+    assert request('/', method='GET', headers=[('if-none-match', etag)])[0]['status'] == 304
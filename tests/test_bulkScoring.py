@@ -0,0 +1,83 @@
+"""
+Tests of the bulk-scoring pipeline in bulkScoring.py: scoring of a CSV-file in chunks,
+empty input and resuming an interrupted run from its checkpoint.
+
+@author: Michael Volk
+"""
+
+import os
+
+import pandas as pd
+import pytest
+
+import bulkScoring
+from conftest import CITY_FILE
+
+ROWS = [{'Cityname': 'Aachen', 'Category': 'Apartment', 'Area': '80', 'Rooms': '3', 'Construction_Year': '2000', 'Balcony': '1.0'},
+        {'Cityname': 'Bonn', 'Category': 'Maisonette', 'Area': '120', 'Rooms': '4', 'Construction_Year': '1990', 'Balcony': ''},
+        {'Cityname': 'Nowhere', 'Category': 'Apartment', 'Area': '80', 'Rooms': '3', 'Construction_Year': '2000', 'Balcony': ''},
+        {'Cityname': 'Köln', 'Category': 'Penthouse', 'Area': 'inf', 'Rooms': '5', 'Construction_Year': '2015', 'Balcony': '0'},
+        {'Cityname': 'Essen', 'Category': 'Apartment', 'Area': '55', 'Rooms': '2', 'Construction_Year': '1970', 'Balcony': 'yes'}]
+
+
+@pytest.fixture(autouse=True)
+def resources(monkeypatch):
+    """Loads the resources of each test again (they are cached per process in bulkScoring._resources)"""
+    monkeypatch.setattr(bulkScoring, '_resources', None)
+
+def score(tmp_path, modelDir, rows, **kwargs):
+    inputFile, outputFile = str(tmp_path / 'input.csv'), str(tmp_path / 'output.csv')
+    pd.DataFrame(rows, columns=list(ROWS[0])).to_csv(inputFile, index=False)
+    count = bulkScoring.scoreFile(inputFile, outputFile, modelDir, CITY_FILE, **kwargs)
+    return count, outputFile
+
+
+def test_score_file_adds_estimates_and_errors(tmp_path, modelDir):
+    count, outputFile = score(tmp_path, modelDir, ROWS, chunkSize=2)
+    scored = pd.read_csv(outputFile, dtype=str, keep_default_na=False)
+    assert count == 5
+    assert list(scored.columns) == list(ROWS[0]) + bulkScoring.SCORE_COLUMNS + [bulkScoring.ERROR_COLUMN]
+    assert list(scored['Cityname']) == [row['Cityname'] for row in ROWS]
+    assert list(scored['error'] != '') == [False, False, True, True, False]
+    assert all(float(value) > 0 for value in scored.loc[scored['error'] == '', 'buy_estimate'])
+    assert not os.path.exists(outputFile + '.checkpoint.json')
+
+def test_score_file_without_rows_writes_header(tmp_path, modelDir):
+    count, outputFile = score(tmp_path, modelDir, [])
+    scored = pd.read_csv(outputFile)
+    assert count == 0
+    assert len(scored) == 0
+    assert list(scored.columns) == list(ROWS[0]) + bulkScoring.SCORE_COLUMNS + [bulkScoring.ERROR_COLUMN]
+    assert not os.path.exists(outputFile + '.checkpoint.json')
+
+def test_resume_continues_after_last_checkpoint(tmp_path, modelDir, monkeypatch):
+    _, completeFile = score(tmp_path, modelDir, ROWS, chunkSize=2)
+    with open(completeFile, mode='rb') as file:
+        complete = file.read()
+
+    scoreChunk, calls = bulkScoring.scoreChunk, []
+
+    def failingScoreChunk(chunk, confidence):
+        calls.append(len(chunk))
+        if len(calls) == 2:
+            raise RuntimeError("interrupted")
+        return scoreChunk(chunk, confidence)
+    monkeypatch.setattr(bulkScoring, 'scoreChunk', failingScoreChunk)
+    with pytest.raises(RuntimeError):
+        score(tmp_path, modelDir, ROWS, chunkSize=2)
+    checkpoint = bulkScoring.readCheckpoint(completeFile + '.checkpoint.json')
+    assert (checkpoint['rows'], checkpoint['chunks']) == (2, 1)
+
+    monkeypatch.setattr(bulkScoring, 'scoreChunk', scoreChunk)
+    count, outputFile = score(tmp_path, modelDir, ROWS, chunkSize=2, resume=True)
+    with open(outputFile, mode='rb') as file:
+        assert file.read() == complete
+    assert count == 5
+
+def test_resume_rejects_checkpoint_of_other_models(tmp_path, modelDir):
+    outputFile = str(tmp_path / 'output.csv')
+    bulkScoring.writeCheckpoint(outputFile + '.checkpoint.json',
+                                {'input': str(tmp_path / 'input.csv'), 'model_version': '', 'confidence': 0.5,
+                                 'rows': 0, 'chunks': 0, 'position': None})
+    with pytest.raises(SystemExit):
+        score(tmp_path, modelDir, ROWS, resume=True)
@@ -0,0 +1,67 @@
+"""
+Tests of cityIndex.py: lookup of citynames (normalization of the citynames and unknown cities)
+and the nearest city of coordinates (reverse geocoding) compared with a brute-force search.
+
+@author: Michael Volk
+"""
+
+import numpy as np
+import pytest
+
+from cityIndex import EARTH_RADIUS_KM, CityIndex, normalizeCityname
+from conftest import CITY_FILE
+
+
+@pytest.fixture(scope='module')
+def cityIndex():
+    return CityIndex.fromCsv(CITY_FILE)
+
+
+def test_normalize_cityname():
+    assert normalizeCityname('  Düsseldorf ') == ('duesseldorf', 'dusseldorf')
+    assert normalizeCityname('Mülheim-an der   Ruhr') == ('muelheim an der ruhr', 'mulheim an der ruhr')
+    assert normalizeCityname('STRASSE') == normalizeCityname('Straße')
+
+@pytest.mark.parametrize('cityname', ['Düsseldorf', 'düsseldorf', 'Duesseldorf', 'DUSSELDORF', ' Düsseldorf  '])
+def test_lookup_is_tolerant_regarding_case_umlauts_and_whitespaces(cityIndex, cityname):
+    assert cityIndex.cityname(cityname) == 'Düsseldorf'
+    assert cityIndex.lookup(cityname) == cityIndex.coordinates[cityIndex.names.index('Düsseldorf')]
+
+def test_lookup_of_hyphenated_cityname(cityIndex):
+    name = next(name for name in cityIndex.names if '-' in name)
+    assert cityIndex.cityname(name.replace('-', ' ').lower()) == name
+
+def test_unknown_city(cityIndex):
+    assert 'Nowhere' not in cityIndex
+    with pytest.raises(KeyError):
+        cityIndex.lookup('Nowhere')
+
+def haversine(latitude1, longitude1, latitude2, longitude2):
+    """Returns great-circle distance (in km) between the given coordinates (in degrees)"""
+    latitude1, longitude1, latitude2, longitude2 = map(np.radians, (latitude1, longitude1, latitude2, longitude2))
+    a = (np.sin((latitude2 - latitude1) / 2) ** 2
+         + np.cos(latitude1) * np.cos(latitude2) * np.sin((longitude2 - longitude1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+def test_nearest_cities_match_brute_force_haversine(cityIndex):
+    rng = np.random.default_rng(5)
+    latitudes, longitudes = rng.uniform(50.3, 52.6, size=200), rng.uniform(5.8, 9.6, size=200)
+    cityLatitudes, cityLongitudes = map(np.array, zip(*cityIndex.coordinates))
+    distances = haversine(latitudes[:, None], longitudes[:, None], cityLatitudes[None, :], cityLongitudes[None, :])
+    positions, nearestDistances = cityIndex.nearestMany(latitudes, longitudes)
+    np.testing.assert_array_equal(positions, distances.argmin(axis=1))
+    np.testing.assert_allclose(nearestDistances, distances.min(axis=1))
+    name, distance = cityIndex.nearest(latitudes[0], longitudes[0])
+    assert name == cityIndex.names[positions[0]] and distance == pytest.approx(nearestDistances[0])
+
+def test_nearest_city_of_its_own_coordinates(cityIndex):
+    latitude, longitude = cityIndex.lookup('Köln')
+    name, distance = cityIndex.nearest(latitude, longitude)
+    assert name == 'Köln' and distance == pytest.approx(0, abs=1e-6)
+
+def test_nearest_city_is_returned_by_the_estimation_api(client):
+    latitude, longitude = CityIndex.fromCsv(CITY_FILE).lookup('Bonn')
+    response = client.post('/api/v1/estimate', json=[{'Latitude': latitude + 0.001, 'Longitude': longitude, 'Area': 80,
+                                                       'Rooms': 3, 'Construction_Year': 2000}])
+    city = response.get_json()['estimates'][0]['city']
+    assert city['name'] == 'Bonn' and city['distance_km'] == pytest.approx(0.11, abs=0.01)
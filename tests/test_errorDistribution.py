@@ -0,0 +1,33 @@
+"""
+Tests of the precomputed quantiles of the test-errors (estimation.ErrorDistribution) against
+pandas.Series.quantile, which has computed them per request before.
+
+@author: Michael Volk
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from estimation import ErrorDistribution, confidence_levels
+
+
+@pytest.mark.parametrize('q', np.linspace(0, 1, 21))
+def test_error_distribution_quantile_matches_pandas(q):
+    errors = pd.Series(np.random.default_rng(1).normal(size=101))
+    errors[[3, 50]] = np.nan
+    assert ErrorDistribution(errors).quantile(q) == pytest.approx(errors.quantile(q))
+
+def test_error_distribution_quantile_of_sorted_errors():
+    errors = np.sort(np.random.default_rng(2).normal(size=40))
+    distribution = ErrorDistribution(errors, isSorted=True)
+    assert distribution.quantile(0.05) == pytest.approx(pd.Series(errors).quantile(0.05))
+    assert distribution.quantile(0.95) == pytest.approx(pd.Series(errors).quantile(0.95))
+
+@pytest.mark.parametrize('confidence', list(confidence_levels) + [0.33])
+def test_error_distribution_bounds_match_pandas(confidence):
+    errors = pd.Series(np.random.default_rng(3).normal(scale=0.2, size=200))
+    alpha = (1 - confidence) / 2
+    lower, upper = ErrorDistribution(errors).bounds(np.array([1000.0, 2000.0]), confidence)
+    np.testing.assert_allclose(lower, [1000.0, 2000.0] / np.exp(errors.quantile(1 - alpha)))
+    np.testing.assert_allclose(upper, [1000.0, 2000.0] / np.exp(errors.quantile(alpha)))
@@ -0,0 +1,54 @@
+"""
+Tests of the feature-assembly in estimation.py: apartment-configurations converted into
+model-features and encoded into the columns of a model, compared with the pandas-based
+assembly of the features per request.
+
+@author: Michael Volk
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cityIndex import CityIndex
+from estimation import ConfigurationError, FeatureEncoder, configurationToFeatures, featureRows, features
+
+CITIES = CityIndex(['Aachen'], [50.76], [6.11])
+CONFIGURATION = {'chooseLocation': 'cityname', 'Cityname': 'Aachen', 'Category': 'Maisonette', 'Area': '120',
+                 'Rooms': '4', 'Construction_Year': '1990', 'Maintained': '1', 'Garden': 'on'}
+
+
+class NamedModel:
+    """Stand-in of a model fitted with column-names"""
+
+    def __init__(self, columns):
+        self.feature_names_in_ = np.array(columns)
+
+
+def test_configuration_to_features():
+    x_dict = configurationToFeatures(CONFIGURATION, CITIES)
+    assert list(x_dict) == features
+    assert (x_dict['Area'], x_dict['Rooms'], x_dict['ConstructionYear']) == (120.0, 4.0, 1990.0)
+    assert x_dict['EQ_CAT_maisonette'] == 1 and x_dict['EQ_CAT_apartment'] == 0
+    assert x_dict['EQ_CON_maintained'] == 1 and x_dict['EQ_OUT_garden'] == 1 and x_dict['EQ_OUT_balcony'] == 0
+    assert (x_dict['Latitude'], x_dict['Longitude']) == (50.76, 6.11)
+
+@pytest.mark.parametrize('change', [{'Area': 'abc'}, {'Area': '0'}, {'Rooms': 'nan'}, {'Balcony': 'maybe'}])
+def test_configuration_to_features_rejects_invalid_values(change):
+    with pytest.raises(ConfigurationError):
+        configurationToFeatures(dict(CONFIGURATION, **change), CITIES)
+
+def test_encoder_matches_pandas_assembly():
+    columns = ['Rooms', 'EQ_OTHER_unknown', 'Latitude', 'Area', 'EQ_OUT_garden', 'EQ_CAT_maisonette']
+    x_dicts = [configurationToFeatures(dict(CONFIGURATION, Area=str(area)), CITIES) for area in [50, 75, 100]]
+    expected = pd.DataFrame(x_dicts).reindex(columns=columns, fill_value=0).to_numpy(dtype=np.float64)
+    encoded = FeatureEncoder(columns).encode(featureRows(x_dicts))
+    np.testing.assert_array_equal(encoded, expected)
+
+def test_encoder_creates_data_frame_only_for_models_with_column_names():
+    columns = ['Area', 'Rooms']
+    rows = featureRows([configurationToFeatures(CONFIGURATION, CITIES)])
+    assert isinstance(FeatureEncoder(columns).modelInput(rows), np.ndarray)
+    x_in = FeatureEncoder(columns, NamedModel(columns)).modelInput(rows)
+    assert isinstance(x_in, pd.DataFrame)
+    assert list(x_in.columns) == columns and x_in.values.tolist() == [[120.0, 4.0]]
@@ -0,0 +1,81 @@
+"""
+Tests of the heat-maps of heatmap.py: maximal grid-size per format, the heat-map-cache bounded
+by the bytes of the cached prices and the formats of the heat-map-endpoint of the Flask-app.
+
+@author: Michael Volk
+"""
+
+import numpy as np
+import pytest
+
+import heatmap
+from estimation import ConfigurationError
+from predictionCache import LocalCache
+
+
+def test_check_format_limits_geojson_cells():
+    heatmap.checkFormat(0.05, 'geojson')
+    heatmap.checkFormat(0.005, 'json')
+    with pytest.raises(ConfigurationError, match='GeoJSON'):
+        heatmap.checkFormat(0.005, 'geojson')
+
+def test_check_format_limits_png_pixels():
+    heatmap.checkFormat(0.005, 'png')
+    with pytest.raises(ConfigurationError, match='PNG'):
+        heatmap.checkFormat(0.005, 'png', scale=8)
+
+def test_local_cache_is_bounded_by_weight():
+    cache = LocalCache(maxSize=200, weigh=heatmap.pricesBytes)
+    prices = {'_buy': np.zeros(5), '_rent': np.zeros(5)}
+    cache.setMany([('a', prices), ('b', prices)])
+    assert cache.weight == 160
+    # The oldest entry is evicted until the weights fit
+    cache.setMany([('c', prices)])
+    assert [value is prices for value in cache.getMany(['a', 'b', 'c'])] == [False, True, True]
+    assert cache.weight == 160
+    # Replacing an entry does not count its old weight
+    cache.setMany([('c', prices)])
+    assert cache.weight == 160
+    # Values heavier than maxSize are not cached
+    cache.setMany([('d', {'_buy': np.zeros(30)})])
+    assert cache.getMany(['d']) == [None] and len(cache) == 2
+
+def test_heatmap_endpoint_formats(client):
+    query = {'Area': '80', 'Rooms': '3', 'Construction_Year': '2000', 'resolution': '0.25'}
+    grid = heatmap.Grid(0.25)
+    result = client.get('/api/v1/heatmap', query_string=query).get_json()
+    assert (result['rows'], result['cols']) == (grid.rows, grid.cols)
+    assert np.array(result['rent']).shape == (grid.rows, grid.cols)
+
+    response = client.get('/api/v1/heatmap', query_string=dict(query, format='binary', price='rent'))
+    values = np.frombuffer(response.get_data(), dtype='<f4').reshape(grid.rows, grid.cols)
+    np.testing.assert_allclose(values, result['rent'], atol=0.05)
+    assert response.headers['X-Heatmap-Shape'] == '{},{}'.format(grid.rows, grid.cols)
+
+    response = client.get('/api/v1/heatmap', query_string=dict(query, format='png', scale='2'))
+    assert response.mimetype == 'image/png' and response.get_data().startswith(b'\x89PNG')
+
+    geojson = client.get('/api/v1/heatmap', query_string=dict(query, format='geojson')).get_json()
+    assert len(geojson['features']) == grid.rows * grid.cols
+
+def test_heatmap_cell_matches_the_estimation_api(client):
+    query = {'Category': 'Loft', 'Area': '80', 'Rooms': '3', 'Construction_Year': '2000', 'Balcony': '1',
+             'resolution': '0.5'}
+    result = client.get('/api/v1/heatmap', query_string=query).get_json()
+    grid = heatmap.Grid(0.5)
+    configuration = {'Category': 'Loft', 'Area': 80, 'Rooms': 3, 'Construction_Year': 2000, 'Balcony': 1,
+                     'Latitude': float(grid.latitudes[1]), 'Longitude': float(grid.longitudes[2])}
+    estimate = client.post('/api/v1/estimate', json=[configuration]).get_json()['estimates'][0]
+    assert result['buy'][1][2] == round(estimate['buy']['estimate'])
+
+def test_heatmap_is_cacheable_and_conditional(client):
+    response = client.get('/api/v1/heatmap?resolution=0.25')
+    assert response.headers['Cache-Control'].startswith('public')
+    response = client.get('/api/v1/heatmap?resolution=0.25', headers={'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 304
+
+@pytest.mark.parametrize('query', ['resolution=0.001', 'resolution=0.005&format=geojson', 'format=svg',
+                                   'price=both', 'scale=20', 'resolution=0.005&format=png&scale=8'])
+def test_invalid_heatmap_requests_are_rejected(client, query):
+    response = client.get('/api/v1/heatmap?' + query)
+    assert response.status_code == 400 and 'error' in response.get_json()
@@ -0,0 +1,88 @@
+"""
+Tests of the metrics of metrics.py: histograms, the metrics-endpoint of the Flask-app and
+the metrics of several gunicorn-workers merged through the shared directory.
+
+@author: Michael Volk
+"""
+
+import json
+
+import pytest
+
+import metrics
+
+
+def newMetrics():
+    """Returns new counter and histogram (the metrics of a worker)"""
+    return (metrics.Counter('test_total', 'Test-counter', ['kind']),
+            metrics.Histogram('test_seconds', 'Test-histogram', buckets=(0.1, 1.0)))
+
+@pytest.fixture
+def sharedMetrics(monkeypatch, tmp_path):
+    """Returns counter and histogram as only metrics, shared through a temporary directory"""
+    counter, histogram = newMetrics()
+    monkeypatch.setattr(metrics, 'SHARED_DIRECTORY', str(tmp_path))
+    monkeypatch.setattr(metrics, 'metrics', [counter, histogram])
+    monkeypatch.setattr(metrics, 'collectors', [lambda: metrics.gauge('test_queue_depth', 'Test-gauge', 3)])
+    # Sharing-thread of this process counts as started
+    monkeypatch.setattr(metrics, '_sharingProcess', metrics.os.getpid())
+    return counter, histogram
+
+def writeOtherWorker(pid, counter, histogram):
+    """Writes the file of another worker with the values of given metrics"""
+    with open(metrics.sharedFile(pid), 'w') as file:
+        json.dump({'pid': pid, 'metrics': {counter.name: counter.snapshot(), histogram.name: histogram.snapshot()},
+                   'collected': metrics.gauge('test_queue_depth', 'Test-gauge', 5)}, file)
+
+def test_render_merges_the_metrics_of_all_workers(sharedMetrics):
+    counter, histogram = sharedMetrics
+    other = newMetrics()
+    other[0].inc(2, kind='a')
+    other[0].inc(kind='b')
+    other[1].observe(0.5)
+    writeOtherWorker(1, *other)
+    counter.inc(kind='a')
+    histogram.observe(0.05)
+    histogram.observe(5.0)
+
+    lines = metrics.render().splitlines()
+    assert 'test_total{kind="a"} 3' in lines
+    assert 'test_total{kind="b"} 1' in lines
+    assert 'test_seconds_bucket{le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{le="1.0"} 2' in lines
+    assert 'test_seconds_count 3' in lines
+    # Collected values per worker, grouped under one HELP- and TYPE-line
+    pid = metrics.os.getpid()
+    first, second = sorted(['test_queue_depth{{worker="{}"}} 3'.format(pid), 'test_queue_depth{worker="1"} 5'])
+    assert lines.count('# TYPE test_queue_depth gauge') == 1
+    assert lines[lines.index('# TYPE test_queue_depth gauge') + 1:] in ([first, second], [second, first])
+
+def test_exited_worker_keeps_its_counters(sharedMetrics):
+    counter, histogram = sharedMetrics
+    other = newMetrics()
+    other[0].inc(4, kind='a')
+    writeOtherWorker(1, *other)
+    metrics.markExited(1)
+
+    lines = metrics.render().splitlines()
+    assert 'test_total{kind="a"} 4' in lines
+    assert 'test_queue_depth{worker="1"} 5' not in lines
+
+def test_metrics_endpoint_of_the_flask_app(client, monkeypatch):
+    monkeypatch.setattr(metrics, 'SHARED_DIRECTORY', None)
+    client.post('/api/v1/estimate', json=[{'Cityname': 'Aachen', 'Area': 80, 'Rooms': 3, 'Construction_Year': 2000}])
+    response = client.get('/metrics')
+    lines = response.get_data(as_text=True).splitlines()
+    assert response.status_code == 200 and response.mimetype == 'text/plain'
+    assert '# TYPE estimator_request_seconds histogram' in lines
+    assert any(line.startswith('estimator_request_seconds_count{endpoint="estimate",method="POST"}') for line in lines)
+    assert any(line.startswith('estimator_stage_seconds_count{stage="feature_encoding"}') for line in lines)
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram('test_seconds', 'Test-histogram', ['stage'], buckets=(0.1, 1.0))
+    histogram.observe(0.05, stage='a')
+    histogram.observeMany([0.1, 0.5, 2.0], stage='a')
+    lines = histogram.render()
+    assert lines[2:] == ['test_seconds_bucket{stage="a",le="0.1"} 2', 'test_seconds_bucket{stage="a",le="1.0"} 3',
+                         'test_seconds_bucket{stage="a",le="+Inf"} 4', 'test_seconds_sum{stage="a"} 2.65',
+                         'test_seconds_count{stage="a"} 4']
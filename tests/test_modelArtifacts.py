@@ -0,0 +1,80 @@
+"""
+Tests of the model-artifacts of modelArtifacts.py: export of the pickled synthetic models,
+loading them with the same predictions, versioned switching and validation.
+
+@author: Michael Volk
+"""
+
+import json
+import os
+import pickle
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import app
+from estimation import ErrorDistribution, predictPrices
+from modelArtifacts import (ArtifactError, META_FILE, artifactVersions, exportArtifact, isArtifact, loadArtifact,
+                            validateColumns)
+from standIns import x_dict
+
+
+@pytest.fixture
+def exportedDir(tmp_path, modelDir):
+    """Directory with the pickled synthetic models and their exported artifacts"""
+    directory = str(tmp_path / 'models')
+    shutil.copytree(modelDir, directory)
+    for cat in ['_buy', '_rent']:
+        exportArtifact(os.path.join(directory, 'model' + cat + '.p'), os.path.join(directory, 'model' + cat))
+    return directory
+
+
+def test_export_and_load_artifact(exportedDir):
+    with open(os.path.join(exportedDir, 'model_buy.p'), mode='rb') as pickled:
+        data = pickle.load(pickled)
+    artifact = loadArtifact(os.path.join(exportedDir, 'model_buy'))
+    assert artifact['columns_used'] == list(data['columns_used'])
+    assert isinstance(artifact['test_errors'], np.memmap)
+    np.testing.assert_array_equal(artifact['test_errors_notAbsolute'], data['test_errors_notAbsolute'])
+    sortedErrors = ErrorDistribution(data['test_errors_notAbsolute']).sorted_errors
+    np.testing.assert_array_equal(artifact['test_errors_notAbsolute_sorted'], sortedErrors)
+    x = pd.DataFrame(np.random.default_rng(4).uniform(1, 100, size=(5, len(data['columns_used']))),
+                     columns=data['columns_used'])
+    np.testing.assert_array_equal(artifact['model'].predict(x), data['model'].predict(x))
+
+def test_artifacts_are_preferred_by_the_app(exportedDir):
+    assert app.modelFiles(exportedDir)[0] == os.path.join(exportedDir, 'model_buy', META_FILE)
+    fromArtifacts = app.load_modelConfigurations(exportedDir)
+    for cat in ['_buy', '_rent']:
+        os.remove(os.path.join(exportedDir, 'model' + cat))
+    fromPickles = app.load_modelConfigurations(exportedDir)
+    x_dicts = [dict(x_dict(area), Latitude=51.2, Longitude=7.0) for area in [40, 80, 120]]
+    for key, values in predictPrices(x_dicts, fromArtifacts).items():
+        np.testing.assert_allclose(values, predictPrices(x_dicts, fromPickles)[key])
+
+def test_export_switches_versions_atomically(exportedDir):
+    directory = os.path.join(exportedDir, 'model_buy')
+    first = os.path.realpath(directory)
+    exportArtifact(directory + '.p', directory)
+    second = os.path.realpath(directory)
+    exportArtifact(directory + '.p', directory)
+    # The artifact-path is a symbolic link to the newest version, only the previous version is kept
+    assert os.path.islink(directory) and isArtifact(directory)
+    assert not os.path.exists(first)
+    versions = sorted(os.path.realpath(version) for version in artifactVersions(directory))
+    assert versions == sorted([second, os.path.realpath(directory)])
+    assert oct(os.stat(directory).st_mode & 0o777) == oct(0o755)
+
+def test_unsupported_format_version_is_rejected(exportedDir):
+    directory = os.path.join(exportedDir, 'model_rent')
+    with open(os.path.join(directory, META_FILE), mode='w') as file:
+        json.dump({'format_version': 99, 'columns_used': ['Area']}, file)
+    with pytest.raises(ArtifactError, match='format_version'):
+        loadArtifact(directory)
+
+@pytest.mark.parametrize('columns_used', [[], ['Area', ''], ['Area', 'Area'], 'Area'])
+def test_invalid_columns_are_rejected(columns_used):
+    with pytest.raises(ArtifactError):
+        validateColumns(columns_used)
@@ -0,0 +1,72 @@
+"""
+Tests of the file-based registries of modelRegistry.py: loading once, reloading changed files
+and keeping the loaded resource if reloading fails.
+
+@author: Michael Volk
+"""
+
+import os
+
+import pytest
+
+from modelRegistry import FileRegistry
+
+
+@pytest.fixture
+def resource(tmp_path):
+    """Returns file with content 'a' and list of the contents loaded from it"""
+    filename = tmp_path / 'resource.txt'
+    filename.write_text('a')
+    return filename, []
+
+def registryOf(resource, checkInterval=0):
+    filename, loaded = resource
+
+    def load():
+        content = filename.read_text()
+        if content == 'broken':
+            raise ValueError(content)
+        loaded.append(content)
+        return content
+    return FileRegistry([str(filename)], load, checkInterval=checkInterval)
+
+def rewrite(filename, content):
+    """Rewrites the file with a changed modification-time"""
+    filename.write_text(content)
+    stat = os.stat(str(filename))
+    os.utime(str(filename), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+def test_resource_is_loaded_once(resource):
+    registry = registryOf(resource)
+    first = registry.get()
+    assert registry.get() is first and first.value == 'a'
+    assert resource[1] == ['a']
+
+def test_changed_file_is_reloaded(resource):
+    registry = registryOf(resource)
+    first = registry.get()
+    rewrite(resource[0], 'b')
+    second = registry.get()
+    assert second.value == 'b' and second.version != first.version
+    assert resource[1] == ['a', 'b']
+
+def test_failed_reload_keeps_the_loaded_resource(resource):
+    registry = registryOf(resource)
+    first = registry.get()
+    rewrite(resource[0], 'broken')
+    assert registry.get() is first
+    rewrite(resource[0], 'c')
+    assert registry.get().value == 'c'
+
+def test_no_reload_with_negative_check_interval(resource):
+    registry = registryOf(resource, checkInterval=-1)
+    first = registry.get()
+    rewrite(resource[0], 'b')
+    assert registry.get() is first and registry.version() == first.version
+
+def test_files_are_checked_at_most_every_check_interval(resource):
+    registry = registryOf(resource, checkInterval=3600)
+    first = registry.get()
+    rewrite(resource[0], 'b')
+    assert registry.get() is first
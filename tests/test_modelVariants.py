@@ -0,0 +1,102 @@
+"""
+Tests of the model-variants of modelVariants.py: parsing of MODEL_VARIANTS, routing of the requests
+by header or weight, serving two variants side by side with the Flask-app and reloading them
+in the gunicorn master.
+
+@author: Michael Volk
+"""
+
+import shutil
+
+import pytest
+
+import app
+from estimation import ConfigurationError
+from modelRegistry import FileRegistry
+from modelVariants import ModelVariants, Variant, parseVariants
+
+
+class StaticRegistry:
+    """Stand-in registry without files"""
+
+    def __init__(self, variant):
+        self.variant = variant
+
+
+def test_parse_variants():
+    assert parseVariants('', 'models') == [Variant('default', 'models', 1.0)]
+    assert parseVariants(' best=.:90, light=models/light:10,shadow=C:/models:0 ') == [
+        Variant('best', '.', 90.0), Variant('light', 'models/light', 10.0), Variant('shadow', 'C:/models', 0.0)]
+    assert parseVariants('windows=C:/models') == [Variant('windows', 'C:/models', 1.0)]
+
+@pytest.mark.parametrize('value', ['best', 'best=', 'a=x:1,a=y:1', 'a=x:0'])
+def test_invalid_variants_are_rejected(value):
+    with pytest.raises(ValueError):
+        parseVariants(value)
+
+def test_routing_by_header_key_and_weight():
+    variants = ModelVariants(parseVariants('best=a:75,light=b:25,shadow=c:0'), StaticRegistry)
+    assert variants.primary == 'best'
+    assert variants.choose('shadow') == 'shadow'
+    with pytest.raises(ConfigurationError, match='Unknown model-variant'):
+        variants.choose('other')
+    # The same routing-key always gets the same variant, the variant without weight only by header
+    assert len({variants.choose(routingKey='user-42') for _ in range(20)}) == 1
+    chosen = [variants.choose(routingKey='user-' + str(i)) for i in range(4000)]
+    assert 'shadow' not in chosen
+    assert chosen.count('light') / len(chosen) == pytest.approx(0.25, abs=0.03)
+
+@pytest.fixture
+def twoVariants(monkeypatch, servedModels, modelDir):
+    """Flask-app serving the synthetic models as variant 'best' (weight 1) and 'shadow' (weight 0)"""
+    variants = ModelVariants(parseVariants('best={0}:1,shadow={0}:0'.format(modelDir)), app.variantRegistry)
+    monkeypatch.setattr(app, 'modelVariants', variants)
+    monkeypatch.setattr(app, 'modelRegistry', variants.registries['best'])
+    return variants
+
+def test_requests_are_served_by_the_requested_variant(client, twoVariants):
+    configuration = {'Cityname': 'Aachen', 'Area': 80, 'Rooms': 3, 'Construction_Year': 2000}
+    assert client.post('/api/v1/estimate', json=configuration).get_json()['model_variant'] == 'best'
+    response = client.post('/api/v1/estimate', json=configuration, headers={'X-Model-Variant': 'shadow'})
+    assert response.get_json()['model_variant'] == 'shadow'
+    response = client.post('/api/v1/estimate', json=configuration, headers={'X-Model-Variant': 'other'})
+    assert response.status_code == 400
+    # Heat-maps of weighted routing are not cached by shared caches
+    assert client.get('/api/v1/heatmap?resolution=0.5').headers['Cache-Control'].startswith('private')
+    response = client.get('/api/v1/heatmap?resolution=0.5', headers={'X-Model-Variant': 'shadow'})
+    assert response.headers['Cache-Control'].startswith('public')
+
+def test_test_errors_are_exported_for_loaded_variants_only(twoVariants):
+    assert twoVariants.registries['shadow'].current() is None
+    twoVariants.get('best')
+    lines = twoVariants.testErrorMetrics()
+    assert [line.split('{')[1].split('}')[0] for line in lines[2:]] == ['variant="best",model="buy"',
+                                                                        'variant="best",model="rent"']
+
+def test_current_does_not_load(tmp_path):
+    filename = tmp_path / 'resource.txt'
+    filename.write_text('a')
+    registry = FileRegistry([str(filename)], filename.read_text)
+    assert registry.current() is None
+    snapshot = registry.get()
+    assert registry.current() is snapshot and snapshot.value == 'a'
+
+def test_reload_in_master(monkeypatch, servedModels, modelDir, tmp_path):
+    directory = tmp_path / 'models'
+    shutil.copytree(modelDir, str(directory))
+    monkeypatch.setattr(app, 'RELOAD_CHECK_INTERVAL', 0)
+    monkeypatch.setattr(app, 'HEATMAP_PRECOMPUTE', False)
+    variants = ModelVariants(parseVariants('', str(directory)), app.variantRegistry)
+    monkeypatch.setattr(app, 'modelVariants', variants)
+    before = variants.get('default')
+    app.cityRegistry.get()
+    assert not app.reloadInMaster()
+    with open(str(directory / 'model_rent.p'), mode='ab') as file:
+        file.write(b'\0')
+    assert app.reloadInMaster()
+    assert variants.registries['default'].current() is not before
+    assert not app.reloadInMaster()
+
+    # Workers with disabled reloads keep their snapshot
+    app.disableReloads()
+    assert variants.registries['default'].checkInterval < 0
@@ -0,0 +1,55 @@
+"""
+Tests of the pre-rendered pages of pageCache.py: rendering once per version of the resource,
+compression and ETags per content-encoding, served by the Flask-app with '304 Not Modified'.
+
+@author: Michael Volk
+"""
+
+import gzip
+
+from modelRegistry import Snapshot
+from pageCache import PageCache
+
+
+class StaticRegistry:
+    """Stand-in registry returning the Snapshot set in snapshot"""
+
+    def __init__(self, value, version):
+        self.snapshot = Snapshot(value, version, ())
+
+    def get(self):
+        return self.snapshot
+
+
+def test_page_is_rendered_once_per_version():
+    rendered = []
+    registry = StaticRegistry('a', 'v1')
+    cache = PageCache(registry, lambda value: rendered.append(value) or '<p>' + value + '</p>')
+    body, etag = cache.get()
+    assert body == b'<p>a</p>'
+    assert gzip.decompress(cache.get('gzip')[0]) == body
+    assert cache.get('gzip')[1] != etag
+    registry.snapshot = Snapshot('b', 'v2', ())
+    assert cache.get()[0] == b'<p>b</p>'
+    assert rendered == ['a', 'b']
+
+def test_formular_is_not_modified_with_matching_etag(client):
+    response = client.get('/')
+    etag = response.headers['ETag']
+    assert response.status_code == 200 and 'public' in response.headers['Cache-Control']
+    assert 'Aachen' in response.get_data(as_text=True)
+
+    response = client.get('/', headers={'If-None-Match': etag})
+    assert response.status_code == 304 and response.get_data() == b''
+    assert client.get('/', headers={'If-None-Match': '"other"'}).status_code == 200
+
+def test_etag_depends_on_content_encoding(client):
+    plain = client.get('/')
+    compressed = client.get('/', headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert compressed.headers['ETag'] != plain.headers['ETag']
+    assert gzip.decompress(compressed.get_data()) == plain.get_data()
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    # The ETag of the uncompressed page does not match the compressed one
+    response = client.get('/', headers={'Accept-Encoding': 'gzip', 'If-None-Match': plain.headers['ETag']})
+    assert response.status_code == 200
@@ -0,0 +1,68 @@
+"""
+Tests of the prediction-cache: eviction and expiry of the LRU-cache, the cache-keys and the order
+of the predicted values with cached and duplicate apartment-configurations (see estimation.predictPricesCached()).
+
+@author: Michael Volk
+"""
+
+import numpy as np
+
+import predictionCache
+from estimation import cacheFill, cacheLookup, predictPricesCached
+from predictionCache import LocalCache, PredictionCache
+from standIns import modelConfigurations, x_dict
+
+
+def test_cache_lookup_maps_duplicates_to_first_occurrence():
+    cache = PredictionCache(LocalCache())
+    cache.setMany([(cache.key(x_dict(70), 'v1'), (70000.0, 700.0))])
+    keys, cached, missing = cacheLookup([x_dict(a) for a in [50, 60, 50, 70, 60]], cache, 'v1')
+    assert cached[3] == (70000.0, 700.0)
+    assert list(missing.values()) == [0, 1]
+    assert list(missing) == [keys[0], keys[1]]
+
+def test_cache_fill_keeps_order_with_duplicate_keys():
+    cache = PredictionCache(LocalCache())
+    modelConfigs = modelConfigurations()
+    cache.setMany([(cache.key(x_dict(70), 'v1'), (70000.0, 700.0))])
+    areas = [50, 60, 50, 70, 60, 80]
+    results = predictPricesCached([x_dict(a) for a in areas], modelConfigs, cache, 'v1')
+    np.testing.assert_allclose(results['y_predicted_buy'], [1000.0 * a for a in areas])
+    np.testing.assert_allclose(results['y_predicted_rent'], [10.0 * a for a in areas])
+    # Each missing configuration has been predicted once, in the order of its first occurrence
+    assert modelConfigs['model_buy'].predicted == [[50.0, 60.0, 80.0]]
+
+    results = predictPricesCached([x_dict(a) for a in reversed(areas)], modelConfigs, cache, 'v1')
+    np.testing.assert_allclose(results['y_predicted_buy'], [1000.0 * a for a in reversed(areas)])
+    assert len(modelConfigs['model_buy'].predicted) == 1
+
+def test_cache_fill_without_missing_keys():
+    cache = PredictionCache(LocalCache())
+    keys = [('v1', 1), ('v1', 2)]
+    results = cacheFill(keys, [(1.0, 2.0), (3.0, 4.0)], {}, None, cache)
+    np.testing.assert_array_equal(results['y_predicted_buy'], [1.0, 3.0])
+    np.testing.assert_array_equal(results['y_predicted_rent'], [2.0, 4.0])
+
+def test_local_cache_evicts_least_recently_used():
+    cache = LocalCache(maxSize=2)
+    cache.setMany([('a', 1), ('b', 2)])
+    assert cache.getMany(['a']) == [1]
+    cache.setMany([('c', 3)])
+    assert cache.getMany(['a', 'b', 'c']) == [1, None, 3]
+
+def test_local_cache_entries_expire(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(predictionCache.time, 'monotonic', lambda: now[0])
+    cache = LocalCache(ttl=10)
+    cache.setMany([('a', 1)])
+    now[0] = 109.0
+    assert cache.getMany(['a']) == [1]
+    now[0] = 111.0
+    assert cache.getMany(['a']) == [None] and len(cache) == 0
+
+def test_cache_key_contains_version_and_rounded_coordinates():
+    cache = PredictionCache(LocalCache(), coordinatePrecision=2)
+    first = dict(x_dict(50), Latitude=51.22001, Longitude=6.77)
+    second = dict(first, Latitude=51.21999)
+    assert cache.key(first, 'v1') == cache.key(second, 'v1')
+    assert cache.key(first, 'v1') != cache.key(first, 'v2')
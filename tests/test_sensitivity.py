@@ -0,0 +1,64 @@
+"""
+Tests of the what-if sensitivity of sensitivity.py: effects of the variations compared with separately
+estimated configurations, the parsing of the ranges and the sensitivity-endpoint of the Flask-app.
+
+@author: Michael Volk
+"""
+
+import numpy as np
+import pytest
+
+from estimation import ConfigurationError, predictPrices
+from sensitivity import DEFAULT_RANGES, parseRange, sensitivity
+from standIns import modelConfigurations, x_dict
+
+CONFIGURATION = {'Latitude': 51.2, 'Longitude': 7.0, 'Category': 'Apartment', 'Area': 100, 'Rooms': 4,
+                 'Construction_Year': 2010, 'Maintained': 1, 'Balcony': 1}
+
+
+def test_parse_range():
+    np.testing.assert_array_equal(parseRange('60:80:10', 'Area'), [60.0, 70.0, 80.0])
+    np.testing.assert_allclose(parseRange('0.1:0.3:0.1', 'Area'), [0.1, 0.2, 0.3])
+    assert len(parseRange('', 'Rooms')) == DEFAULT_RANGES['Rooms'][1]
+
+@pytest.mark.parametrize('value', ['60:80', 'a:b:c', '60:80:0', '80:60:5', '0:inf:1', 'nan:80:1', '0:100000:1'])
+def test_invalid_ranges_are_rejected(value):
+    with pytest.raises(ConfigurationError):
+        parseRange(value, 'Area')
+
+def test_range_effects_match_single_predictions():
+    modelConfigs = modelConfigurations()
+    result = sensitivity(x_dict(50), modelConfigs, {'Area': parseRange('40:60:10', 'Area')})
+    # One model-call for the base and all its variations
+    assert len(modelConfigs['model_buy'].predicted) == 1
+    assert result['base']['buy'] == pytest.approx(50000.0)
+    entry = result['ranges']['Area']
+    assert entry['values'] == [40.0, 50.0, 60.0]
+    predicted = predictPrices([x_dict(area) for area in [40, 50, 60]], modelConfigurations())
+    np.testing.assert_allclose(entry['buy'], predicted['y_predicted_buy'])
+    assert entry['buy_per_unit'] == pytest.approx(1000.0) and entry['rent_per_unit'] == pytest.approx(10.0)
+
+def test_checkbox_effects_match_the_estimation_api(client):
+    result = client.post('/api/v1/sensitivity?area=90:110:10', json=CONFIGURATION).get_json()
+    estimates = client.post('/api/v1/estimate', json=[CONFIGURATION, dict(CONFIGURATION, Balcony=0),
+                                                      dict(CONFIGURATION, Garden=1)]).get_json()['estimates']
+    assert result['base']['buy'] == pytest.approx(estimates[0]['buy']['estimate'])
+    checkboxes = {entry['feature']: entry for entry in result['checkboxes']}
+    assert checkboxes['Balcony']['checked'] and not checkboxes['Garden']['checked']
+    assert checkboxes['Balcony']['buy']['effect'] == pytest.approx(estimates[0]['buy']['estimate']
+                                                                   - estimates[1]['buy']['estimate'])
+    assert checkboxes['Garden']['buy']['effect'] == pytest.approx(estimates[2]['buy']['estimate']
+                                                                  - estimates[0]['buy']['estimate'])
+    assert result['ranges']['Area']['values'] == [90.0, 100.0, 110.0]
+    assert result['ranges']['Area']['buy'][1] == pytest.approx(result['base']['buy'])
+
+def test_sensitivity_of_formular_data(client):
+    form = {key: str(value) for key, value in CONFIGURATION.items()}
+    fromForm = client.post('/api/v1/sensitivity', data=form).get_json()
+    assert fromForm == client.post('/api/v1/sensitivity', json=CONFIGURATION).get_json()
+
+@pytest.mark.parametrize('query, body', [('', [CONFIGURATION]), ('', dict(CONFIGURATION, Area='inf')),
+                                         ('?rooms=1:inf:1', CONFIGURATION)])
+def test_invalid_sensitivity_requests_are_rejected(client, query, body):
+    response = client.post('/api/v1/sensitivity' + query, json=body)
+    assert response.status_code == 400 and 'error' in response.get_json()